@@ -0,0 +1,145 @@
+import asyncio
+
+import aiohttp
+from requests import Response
+from requests.exceptions import Timeout
+
+from NauNetTools.AsyncClients.AsyncSSOClient import AsyncSSOClient
+from NauNetTools.Clients.EncodingResolver import EncodingResolver
+from NauNetTools.Clients.JwcClient import JwcClient, JwcNetState
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+
+# Asyncio version of JwcClient
+class AsyncJwcClient(AsyncSSOClient):
+    jwcServer: str = JwcClient.jwcServer
+    __jwcLoginUrl: str = jwcServer + 'login.aspx'
+    __jwcSingleLoginUrl: str = jwcServer + 'Login_Single.aspx'
+    __jwcLogoutUrl: str = jwcServer + 'LoginOut.aspx'
+    __jwcStudentIndex: str = jwcServer + 'Students/StudentIndex.aspx'
+    __netTimeOut: int
+    __jwcIndexUrl = None
+    __jwcIndexPath = None
+    __loginState: bool = False
+    __lastLoginSuccessHtml = None
+    avoidAlreadyLogin: bool
+
+    def __init__(self, time_out: int = 10, avoid_already_login: bool = True, connector: aiohttp.BaseConnector = None,
+                 encoding_resolver: EncodingResolver = None):
+        super(AsyncJwcClient, self).__init__(self.__jwcSingleLoginUrl, time_out, connector=connector,
+                                             encoding_resolver=encoding_resolver)
+
+        self.__jwcFunctionDict = None
+        self.__jwcFunctionHtml = None
+        self._jwcPublicHeader: dict = {
+            'User-Agent': self._ssoUA,
+            'Accept': '*/*',
+            'Accept-Encoding': 'gzip, deflate',
+            'Accept-Language': 'zh-CN,zh;q=0.9',
+            'Connection': 'keep-alive',
+            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+            'X-Requested-With': 'XMLHttpRequest;'
+        }
+
+        self.__netTimeOut = time_out
+        self.avoidAlreadyLogin = avoid_already_login
+
+    def get_jwc_server(self):
+        return self.jwcServer
+
+    def get_jwc_main_url(self):
+        return self.__jwcIndexUrl
+
+    async def login(self, user_id: str, user_pw: str, sso_response: Response = None) -> JwcNetState:
+        return await self._jwc_login(user_id, user_pw, sso_response)
+
+    def get_last_login_success_html(self):
+        return self.__lastLoginSuccessHtml
+
+    async def _jwc_login(self, user_id: str, user_pw: str, sso_response: Response = None,
+                         re_login_once: bool = False):
+        # noinspection PyBroadException
+        try:
+            login_result = await super(AsyncJwcClient, self).login(user_id, user_pw, sso_response)
+            if login_result.is_success:
+                if '当前你已经登录' in login_result.text:
+                    if self.avoidAlreadyLogin and not re_login_once:
+                        await self.logout()
+                        return await self._jwc_login(user_id, user_pw, sso_response, True)
+                    else:
+                        return JwcNetState.ALREADY_LOGIN
+                elif '请勿输入非法字符' in login_result.text:
+                    return JwcNetState.SERVER_ERROR
+                elif '密码错误' in login_result.text:
+                    return JwcNetState.PASSWORD_ERROR
+                else:
+                    self.__loginState = True
+                    self.__jwcIndexUrl = VPNInterceptor.get_vpn_url_builder().canonicalize_url(login_result.url)
+                    self.__lastLoginSuccessHtml = login_result.text
+                    # noinspection PyBroadException
+                    try:
+                        self.__jwcIndexPath = JwcClient._get_index_path(self.__jwcIndexUrl)
+                        self.__jwcFunctionDict = None
+                        self.__jwcFunctionHtml = JwcClient._extract_jwc_function_html(login_result.text)
+                    except:
+                        return JwcNetState.PARSE_ERROR
+                    else:
+                        return JwcNetState.SUCCESS
+            else:
+                return JwcNetState.PASSWORD_ERROR
+        except (TimeoutError, asyncio.TimeoutError, Timeout):
+            return JwcNetState.TIME_OUT
+        except:
+            return JwcNetState.REQUEST_ERROR
+
+    async def check_login(self) -> bool:
+        if await super(AsyncJwcClient, self).check_login():
+            # noinspection PyBroadException
+            try:
+                check_login_response = await self.get(self.__jwcStudentIndex, timeout=self.__netTimeOut,
+                                                      headers=self._jwcPublicHeader)
+                return JwcClient._has_jwc_login(check_login_response)
+            except:
+                return False
+        else:
+            return False
+
+    def check_login_with_response(self, response: Response) -> bool:
+        if super(AsyncJwcClient, self).check_login_with_response(response):
+            return JwcClient._has_jwc_login(response)
+        else:
+            return False
+
+    def get_function_dict(self) -> dict:
+        if self.__loginState:
+            if self.__jwcFunctionDict is None:
+                self.__jwcFunctionDict = JwcClient._get_jwc_function_dict(self.__jwcFunctionHtml,
+                                                                          self.__jwcIndexPath)
+            return self.__jwcFunctionDict
+        else:
+            raise ConnectionError('You must login once first!')
+
+    async def logout(self) -> JwcNetState:
+        # noinspection PyBroadException
+        try:
+            logout_response = await self.get(self.__jwcLogoutUrl, timeout=self.__netTimeOut,
+                                             headers=self._jwcPublicHeader)
+            if logout_response.url == self.__jwcLoginUrl and await super(AsyncJwcClient, self).logout():
+                self.__loginState = False
+                self.__jwcIndexUrl = None
+                self.__jwcIndexPath = None
+                self.__lastLoginSuccessHtml = None
+                return JwcNetState.SUCCESS
+            else:
+                return JwcNetState.SERVER_ERROR
+        except (TimeoutError, asyncio.TimeoutError, Timeout):
+            return JwcNetState.TIME_OUT
+        except:
+            return JwcNetState.REQUEST_ERROR
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.logout()
+        await super(AsyncJwcClient, self).__aexit__(exc_type, exc_val, exc_tb)
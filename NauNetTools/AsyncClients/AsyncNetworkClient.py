@@ -0,0 +1,202 @@
+import inspect
+import time
+from itertools import count
+
+import aiohttp
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.Deadline import Deadline
+from NauNetTools.Clients.EncodingResolver import EncodingResolver
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, PostRequestParam, RequestContext, \
+    RequestParam
+
+
+# Asyncio version of NetworkClient based on aiohttp
+# Same NetInterceptor could be used, response_intercept and close are allowed to be coroutines
+# Response body is read before interceptors, and returned as requests.Response
+class AsyncNetworkClient(object):
+    # Only these requests kwargs will be sent to aiohttp
+    __requestKwargs: list = ['params', 'headers', 'allow_redirects', 'cookies', 'proxy']
+
+    def __init__(self, connector: aiohttp.BaseConnector = None, encoding_resolver: EncodingResolver = None):
+        self.__interceptorList = []
+        self.__requestCode = count(1)
+        self.__connector = connector
+        self.__session = None
+        self.__cookieJar = None
+        self.headers: dict = {}
+        # Default proxy url for all requests
+        self.proxy: str = None
+        if encoding_resolver is None:
+            self.__encodingResolver = NetworkClient.defaultEncodingResolver
+        else:
+            self.__encodingResolver = encoding_resolver
+
+    # Session and cookie jar should be created inside running event loop
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.__session is None or self.__session.closed:
+            if self.__cookieJar is None:
+                self.__cookieJar = aiohttp.CookieJar()
+            if self.__connector is None:
+                self.__session = aiohttp.ClientSession(cookie_jar=self.__cookieJar)
+            else:
+                # Connection pool is shared with other clients
+                self.__session = aiohttp.ClientSession(connector=self.__connector, connector_owner=False,
+                                                       cookie_jar=self.__cookieJar)
+        return self.__session
+
+    @property
+    def cookie_jar(self) -> aiohttp.CookieJar:
+        return self.__cookieJar
+
+    def add_interceptor(self, new_interceptor: NetInterceptor):
+        for interceptor in self.__interceptorList:
+            if interceptor == new_interceptor:
+                return
+        self.__interceptorList.append(new_interceptor)
+
+    def remove_interceptor(self, old_interceptor: NetInterceptor):
+        if old_interceptor in self.__interceptorList:
+            self.__interceptorList.remove(old_interceptor)
+
+    def has_interceptor_type(self, use_interceptor: classmethod):
+        for interceptor in self.__interceptorList:
+            if type(interceptor) == use_interceptor:
+                return True
+        return False
+
+    def get_interceptor(self, use_interceptor: classmethod):
+        for interceptor in self.__interceptorList:
+            if type(interceptor) == use_interceptor:
+                return interceptor
+        return None
+
+    def set_encoding_resolver(self, encoding_resolver: EncodingResolver):
+        if encoding_resolver is None:
+            self.__encodingResolver = NetworkClient.defaultEncodingResolver
+        else:
+            self.__encodingResolver = encoding_resolver
+
+    @staticmethod
+    def __build_timeout(timeout) -> aiohttp.ClientTimeout:
+        if timeout is None:
+            return None
+        if isinstance(timeout, tuple):
+            return aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        return aiohttp.ClientTimeout(total=timeout)
+
+    @staticmethod
+    def __build_response(client_response: aiohttp.ClientResponse, content: bytes) -> Response:
+        response = Response()
+        response.status_code = client_response.status
+        response.reason = client_response.reason
+        response.url = str(client_response.url)
+        response.headers = CaseInsensitiveDict(client_response.headers)
+        # noinspection PyProtectedMember
+        response._content = content
+        # noinspection PyProtectedMember
+        response._content_consumed = True
+        return response
+
+    # Send request without interceptors
+    async def request(self, method: str, url: str, data=None, json=None, timeout=None, **kwargs) -> Response:
+        request_kwargs = {}
+        for key in self.__requestKwargs:
+            if key in kwargs.keys() and kwargs[key] is not None:
+                request_kwargs[key] = kwargs[key]
+        headers = dict(self.headers)
+        if 'headers' in request_kwargs.keys():
+            headers.update(request_kwargs['headers'])
+        request_kwargs['headers'] = headers
+        if 'proxy' not in request_kwargs.keys() and self.proxy is not None:
+            request_kwargs['proxy'] = self.proxy
+        deadline = Deadline.current()
+        if deadline is not None:
+            timeout = deadline.get_timeout(timeout)
+        client_timeout = self.__build_timeout(timeout)
+        if client_timeout is not None:
+            request_kwargs['timeout'] = client_timeout
+        async with self.get_session().request(method, url, data=data, json=json,
+                                              **request_kwargs) as client_response:
+            content = await client_response.read()
+            response = self.__build_response(client_response, content)
+            for history_response in client_response.history:
+                response.history.append(self.__build_response(history_response, b''))
+        response.encoding = self.__encodingResolver.resolve(response)
+        return response
+
+    @staticmethod
+    async def __call_interceptor(observer_list: list, context: RequestContext, interceptor: NetInterceptor,
+                                 intercept, *args):
+        start_time = time.perf_counter()
+        try:
+            result = intercept(context, *args)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            if len(observer_list) > 0:
+                cost_time = time.perf_counter() - start_time
+                for observer in observer_list:
+                    if observer is not interceptor:
+                        observer.context_interceptor_timing(context, interceptor, cost_time)
+
+    async def __intercept(self, param: RequestParam, method: str) -> Response:
+        context = RequestContext(self, next(self.__requestCode), param, Deadline.current())
+        interceptor_list = list(self.__interceptorList)
+        observer_list = [interceptor for interceptor in interceptor_list if interceptor.observeChain]
+        response = None
+        try:
+            for i in range(len(interceptor_list)):
+                result = await self.__call_interceptor(observer_list, context, interceptor_list[i],
+                                                       interceptor_list[i].context_request_intercept)
+                if isinstance(result, Response):
+                    response = result
+                    interceptor_list = interceptor_list[0:i + 1]
+                    break
+            if response is None:
+                if isinstance(param, PostRequestParam):
+                    response = await self.request(method, param.url, param.data, param.json, **param.kwargs)
+                else:
+                    response = await self.request(method, param.url, **param.kwargs)
+            for interceptor in reversed(interceptor_list):
+                last_response = response
+                response = await self.__call_interceptor(observer_list, context, interceptor,
+                                                         interceptor.context_response_intercept, response)
+                if response is not None and response is not last_response:
+                    response.encoding = self.__encodingResolver.resolve(response)
+        except Exception as e:
+            for observer in observer_list:
+                observer.context_chain_finished(context, None, e)
+            raise
+        for observer in observer_list:
+            observer.context_chain_finished(context, response, None)
+        return response
+
+    async def get(self, url: str, with_interceptor: bool = True, **kwargs) -> Response:
+        if with_interceptor:
+            return await self.__intercept(RequestParam(url, **kwargs), 'GET')
+        else:
+            return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, data=None, json=None, with_interceptor: bool = True, **kwargs) -> Response:
+        if with_interceptor:
+            return await self.__intercept(PostRequestParam(url, data, json, **kwargs), 'POST')
+        else:
+            return await self.request('POST', url, data, json, **kwargs)
+
+    async def close(self):
+        for interceptor in self.__interceptorList:
+            result = interceptor.close(self)
+            if inspect.isawaitable(result):
+                await result
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
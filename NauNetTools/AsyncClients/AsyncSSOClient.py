@@ -0,0 +1,128 @@
+from urllib import parse
+
+import aiohttp
+from requests import Response
+
+from NauNetTools.AsyncClients.AsyncNetworkClient import AsyncNetworkClient
+from NauNetTools.Clients.EncodingResolver import EncodingResolver
+from NauNetTools.Clients.SSOClient import ClientServiceResponse, SSOClient
+
+
+# Asyncio version of SSOClient
+class AsyncSSOClient(AsyncNetworkClient):
+    __netTimeOut: int
+    ssoHost: str = SSOClient.ssoHost
+    __ssoLoginUrl: str = 'http://' + ssoHost + '/sso/login'
+    __ssoLogoutUrl: str = 'http://' + ssoHost + '/sso/logout'
+    __ssoJumpHostCheck: bool
+    __ssoHostCheck: bool
+    __useInterceptor: bool
+    _ssoUA: str = SSOClient._ssoUA
+
+    def __init__(self, service_url: str = None, time_out: int = 10, sso_host_check: bool = True,
+                 sso_jump_host_check: bool = True, request_login_client: AsyncNetworkClient = None,
+                 with_interceptor: bool = True, connector: aiohttp.BaseConnector = None,
+                 encoding_resolver: EncodingResolver = None):
+        super(AsyncSSOClient, self).__init__(connector, encoding_resolver)
+
+        self.__ssoLoginUrlParam: dict = {}
+        self.__requestLoginClient: AsyncNetworkClient
+        self._ssoPublicHeader: dict = {
+            'User-Agent': self._ssoUA,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,'
+                      'application/signed-exchange;v=b3',
+            'Accept-Encoding': 'gzip, deflate',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en-US;q=0.8,en;q=0.7',
+            'Connection': 'keep-alive',
+            'Cache-Control': 'max-age=0',
+            'Upgrade-Insecure-Requests': '1'
+        }
+
+        if service_url is not None:
+            self.__ssoLoginUrlParam['service'] = parse.unquote(service_url)
+        self.__netTimeOut = time_out
+        self.__ssoHostCheck = sso_host_check
+        self.__ssoJumpHostCheck = sso_jump_host_check
+        self.__useInterceptor = with_interceptor
+        if request_login_client is None:
+            self.__requestLoginClient = self
+        else:
+            self.__requestLoginClient = request_login_client
+
+    async def login(self, user_id: str, user_pw: str, sso_response: Response = None) -> ClientServiceResponse:
+        if sso_response is None:
+            sso_response = await self.__requestLoginClient.get(self.__ssoLoginUrl,
+                                                               with_interceptor=self.__useInterceptor,
+                                                               params=self.__ssoLoginUrlParam,
+                                                               timeout=self.__netTimeOut,
+                                                               headers=self._ssoPublicHeader)
+        response = ClientServiceResponse()
+        response.is_service_login = len(self.__ssoLoginUrlParam) > 0
+        if (self.__useInterceptor or not self.__ssoHostCheck
+            or self._has_same_host(sso_response.url, self.__ssoLoginUrl)) \
+                and not SSOClient._is_service_jumped(sso_response.url, response.is_service_login):
+            if SSOClient._is_login_success_text(sso_response.text) and not response.is_service_login:
+                response.is_success = True
+            else:
+                post_form = SSOClient._get_login_post_form(sso_response.text, user_id, user_pw)
+                login_result_response = await self.__requestLoginClient.post(sso_response.url, post_form,
+                                                                             with_interceptor=self.__useInterceptor,
+                                                                             timeout=self.__netTimeOut,
+                                                                             headers=self._ssoPublicHeader)
+                if (self.__useInterceptor or not self.__ssoHostCheck
+                    or self._has_same_host(login_result_response.url, self.__ssoLoginUrl)) \
+                        and not response.is_service_login:
+                    response.is_success = SSOClient._is_login_success_text(login_result_response.text)
+                elif self.__useInterceptor or not self.__ssoJumpHostCheck \
+                        or self._has_same_host(login_result_response.url, self.__ssoLoginUrlParam['service']):
+                    response.status_code = login_result_response.status_code
+                    response.url = login_result_response.url
+                    response.text = login_result_response.text
+                    response.headers = login_result_response.headers
+                    response.is_success = True
+                else:
+                    raise ConnectionError('SSO service host is different from jump page host! Jump page: '
+                                          + login_result_response.url)
+        elif self.__useInterceptor or not self.__ssoJumpHostCheck \
+                or self._has_same_host(sso_response.url, self.__ssoLoginUrlParam['service']):
+            response.status_code = sso_response.status_code
+            response.url = sso_response.url
+            response.text = sso_response.text
+            response.headers = sso_response.headers
+            response.is_success = True
+        else:
+            raise ConnectionError('SSO service host is different from jump page host! Jump page: '
+                                  + sso_response.url)
+        return response
+
+    async def logout(self) -> bool:
+        logout_response = await self.__requestLoginClient.get(self.__ssoLogoutUrl,
+                                                              with_interceptor=self.__useInterceptor,
+                                                              timeout=self.__netTimeOut,
+                                                              headers=self._ssoPublicHeader)
+        if '注销成功' in logout_response.text:
+            if self.cookie_jar is not None:
+                self.cookie_jar.clear()
+            return True
+        return False
+
+    async def check_login(self) -> bool:
+        login_check_response = await self.__requestLoginClient.get(self.__ssoLoginUrl,
+                                                                   with_interceptor=self.__useInterceptor,
+                                                                   timeout=self.__netTimeOut,
+                                                                   headers=self._ssoPublicHeader)
+        return self.check_login_with_response(login_check_response)
+
+    def check_login_with_response(self, response: Response) -> bool:
+        return '登录成功' in response.text or self._has_same_host(response.url, self.__ssoLoginUrl)
+
+    @staticmethod
+    def _has_same_host(url1: str, url2: str):
+        return SSOClient._has_same_host(url1, url2)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.logout()
+        await super(AsyncSSOClient, self).__aexit__(exc_type, exc_val, exc_tb)
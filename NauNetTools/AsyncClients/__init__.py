@@ -0,0 +1 @@
+__all__ = ["AsyncJwcClient", "AsyncNetworkClient", "AsyncSSOClient"]
@@ -1,10 +1,12 @@
 from urllib import parse
 
 # noinspection PyProtectedMember
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup
 from requests import Response
 
+from NauNetTools.Clients.Deadline import Deadline
 from NauNetTools.Clients.SSOClient import SSOClient
+from NauNetTools.Clients.SSOSession import SSOSession
 from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor, VPNUtils
 
 
@@ -17,16 +19,26 @@ class AlstuClient(SSOClient):
     __useVPN: bool = True
     __lastLoginSuccessHtml = None
 
-    def __init__(self, time_out: int = 10, use_vpn: bool = True):
+    # Vpn will be logged in with the TGT of sso_session if it is provided
+    def __init__(self, time_out: int = 10, use_vpn: bool = True, sso_session: SSOSession = None):
         super(AlstuClient, self).__init__(self.__alstuMainUrl, time_out)
 
         self.__alstuFunctionDict: dict = {}
 
         self.__useVPN = use_vpn
+        self.__ssoSession = sso_session
+        self.__netTimeOut = time_out
 
-    def login(self, user_id: str, user_pw: str, sso_response: Response = None) -> bool:
+    # Sso session login, vpn login and service login are limited by the same deadline
+    def login(self, user_id: str, user_pw: str, sso_response: Response = None, deadline: Deadline = None) -> bool:
+        with Deadline.use(deadline):
+            return self.__alstu_login(user_id, user_pw, sso_response)
+
+    def __alstu_login(self, user_id: str, user_pw: str, sso_response: Response = None) -> bool:
+        if self.__ssoSession is not None:
+            self.__ssoSession.attach(self)
         if self.__useVPN:
-            interceptor = VPNUtils.use_school_vpn(self, user_id, user_pw)
+            interceptor = VPNUtils.use_school_vpn(self, user_id, user_pw, sso_session=self.__ssoSession)
             if interceptor is not None:
                 self.vpnInterceptor = interceptor
         login_result = super(AlstuClient, self).login(user_id, user_pw, sso_response)
@@ -51,15 +63,15 @@ class AlstuClient(SSOClient):
         if content_html is not None and not str.isspace(content_html):
             self.__alstuFunctionDict = {}
             soup = BeautifulSoup(content_html, "html.parser")
-            div_node = Tag(soup.find('div', attrs={'class': 'top_nav'}))
+            div_node = soup.find('div', attrs={'class': 'top_nav'})
             a_nodes = div_node.find_all('a')
             for a in a_nodes:
                 self.__alstuFunctionDict[a.text] = self.__function_dict_jump_url_fix(a.attrs['href'])
 
     def __function_dict_jump_url_fix(self, href: str) -> str:
         if href is not None:
-            href = href.strip()
-            if self.__useVPN and VPNInterceptor.vpnHost == parse.urlparse(href).netloc:
+            href = VPNInterceptor.get_vpn_url_builder().canonicalize_url(href.strip())
+            if len(parse.urlparse(href).netloc) > 0:
                 return href
             else:
                 return self.alstuServer + href
@@ -71,6 +83,44 @@ class AlstuClient(SSOClient):
         else:
             raise ConnectionError('You must login once first!')
 
+    # Login state, function dict, vpn interceptor state and full cookie jar
+    def snapshot(self, with_html: bool = False) -> dict:
+        snapshot = super(AlstuClient, self).snapshot()
+        vpn_interceptor = self.get_interceptor(VPNInterceptor)
+        snapshot['vpn'] = vpn_interceptor.get_state() if vpn_interceptor is not None else None
+        snapshot['alstu'] = {
+            'login_state': self.__loginState,
+            'use_vpn': self.__useVPN,
+            'function_dict': self.__alstuFunctionDict,
+            'last_login_success_html': self.__lastLoginSuccessHtml if with_html else None
+        }
+        return snapshot
+
+    # Vpn interceptor will be restored only when vpn password is provided
+    # Restored session will be checked with one request if validate is True
+    def restore_snapshot(self, snapshot: dict, vpn_user_pw: str = None, validate: bool = True) -> bool:
+        if not super(AlstuClient, self).restore_snapshot(snapshot):
+            return False
+        vpn_state = snapshot.get('vpn')
+        if vpn_state is not None and vpn_user_pw is not None and not VPNUtils.is_use_school_vpn(self):
+            self.vpnInterceptor = VPNInterceptor.from_state(vpn_state, vpn_user_pw)
+            self.add_interceptor(self.vpnInterceptor)
+        alstu_state = snapshot.get('alstu')
+        if alstu_state is None or not alstu_state.get('login_state'):
+            return False
+        self.__loginState = True
+        self.__useVPN = alstu_state.get('use_vpn', self.__useVPN)
+        self.__alstuFunctionDict = alstu_state.get('function_dict') or {}
+        self.__lastLoginSuccessHtml = alstu_state.get('last_login_success_html')
+        if validate:
+            # noinspection PyBroadException
+            try:
+                with self.get(self.__alstuMainUrl, timeout=self.__netTimeOut) as check_login_response:
+                    self.__loginState = '奥蓝信息系统' in check_login_response.text
+            except:
+                self.__loginState = False
+        return self.__loginState
+
     def logout(self) -> bool:
         logout_result = super(AlstuClient, self).logout()
         if logout_result:
@@ -0,0 +1,436 @@
+import json as json_parse
+import os
+import tempfile
+import time
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from threading import Lock
+from urllib import parse
+
+from NauNetTools.Clients.JwcClient import JwcClient, JwcNetState
+from NauNetTools.Clients.SessionStore import SessionStore
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+
+# Same page with or without vpn gets the same url, fragment is dropped and query is sorted
+def canonicalize_crawl_url(url: str) -> str:
+    url = VPNInterceptor.get_vpn_url_builder().canonicalize_url(url.strip())
+    split_result = parse.urlsplit(url)
+    scheme = split_result.scheme.lower()
+    netloc = split_result.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = parse.urlencode(sorted(parse.parse_qsl(split_result.query, keep_blank_values=True)))
+    return parse.urlunsplit((scheme, netloc, split_result.path or '/', query, ''))
+
+
+class CrawlTask:
+    userId: str
+    path: tuple
+    url: str
+    canonicalUrl: str
+    host: str
+    depth: int
+    attempt: int = 0
+
+    def __init__(self, user_id: str, path: tuple, url: str):
+        self.userId = user_id
+        self.path = path
+        self.url = url
+        self.canonicalUrl = canonicalize_crawl_url(url)
+        self.host = parse.urlsplit(self.canonicalUrl).netloc
+        self.depth = len(path)
+
+    def get_key(self) -> tuple:
+        return self.userId, self.canonicalUrl
+
+
+class CrawlPage:
+    task: CrawlTask
+    statusCode: int = None
+    url: str = None
+    content: bytes = None
+    encoding: str = None
+    headers: dict = None
+    elapsed: float = 0
+    error: str = None
+    # Jwc login page is returned, page will be fetched again after login
+    expired: bool = False
+
+    def __init__(self, task: CrawlTask):
+        self.task = task
+
+    def is_success(self) -> bool:
+        return self.error is None and not self.expired and self.statusCode is not None and self.statusCode < 400
+
+    @property
+    def text(self) -> str:
+        if self.content is None:
+            return None
+        return self.content.decode(self.encoding or 'utf-8', 'replace')
+
+
+class CrawlSink:
+    __metaclass__ = ABCMeta
+
+    def open(self):
+        pass
+
+    # Called in the crawl thread only, so sinks do not need locks
+    @abstractmethod
+    def write(self, page: CrawlPage):
+        pass
+
+    def close(self):
+        pass
+
+
+class CallbackSink(CrawlSink):
+    def __init__(self, callback):
+        self.__callback = callback
+
+    def write(self, page: CrawlPage):
+        self.__callback(page)
+
+
+# One json line for each page: user_id, path, url, status_code, encoding and text
+class JsonLinesSink(CrawlSink):
+    def __init__(self, file_path: str, with_text: bool = True):
+        self.__filePath = file_path
+        self.__withText = with_text
+        self.__file = None
+
+    def open(self):
+        self.__file = open(self.__filePath, 'a', encoding='utf-8')
+
+    def write(self, page: CrawlPage):
+        line = {
+            'user_id': page.task.userId,
+            'path': list(page.task.path),
+            'url': page.task.canonicalUrl,
+            'status_code': page.statusCode,
+            'encoding': page.encoding,
+            'size': len(page.content) if page.content is not None else 0
+        }
+        if self.__withText:
+            line['text'] = page.text
+        self.__file.write(json_parse.dumps(line, ensure_ascii=False) + '\n')
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+# Keys of finished pages are appended to file, so an interrupted crawl could skip them when it runs again
+class CrawlCheckpoint:
+    def __init__(self, file_path: str):
+        self.__filePath = file_path
+        self.__doneKeys = set()
+        self.__file = None
+
+    def load(self) -> int:
+        self.__doneKeys = set()
+        if os.path.isfile(self.__filePath):
+            with open(self.__filePath, 'r', encoding='utf-8') as file:
+                for line in file:
+                    # Last line may be broken when process is killed
+                    # noinspection PyBroadException
+                    try:
+                        data = json_parse.loads(line)
+                        self.__doneKeys.add((data['user_id'], data['url']))
+                    except:
+                        continue
+        return len(self.__doneKeys)
+
+    def is_done(self, key: tuple) -> bool:
+        return key in self.__doneKeys
+
+    def mark_done(self, key: tuple):
+        if key in self.__doneKeys:
+            return
+        self.__doneKeys.add(key)
+        if self.__file is None:
+            self.__file = open(self.__filePath, 'a', encoding='utf-8')
+        self.__file.write(json_parse.dumps({'user_id': key[0], 'url': key[1]}, ensure_ascii=False) + '\n')
+        self.__file.flush()
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+# Logged in client of every account, shared by all crawl threads of one process
+class _CrawlSessions:
+    def __init__(self, accounts: dict, client_factory, time_out: int, store_path: str = None):
+        self.__accounts = accounts
+        self.__clientFactory = client_factory
+        self.__timeOut = time_out
+        self.__store = SessionStore(store_path) if store_path is not None else None
+        self.__clients: dict = {}
+        self.__accountLocks = {user_id: Lock() for user_id in accounts.keys()}
+
+    def __new_client(self) -> JwcClient:
+        if self.__clientFactory is None:
+            return JwcClient(self.__timeOut)
+        return self.__clientFactory()
+
+    # Return (client, version), version is used to expire the same login only
+    def get(self, user_id: str) -> tuple:
+        with self.__accountLocks[user_id]:
+            session = self.__clients.get(user_id)
+            if session is not None:
+                return session
+            client = self.__new_client()
+            if self.__store is not None:
+                success, version = self.__store.borrow_client(client, user_id, self.__accounts[user_id])
+            else:
+                success, version = client.login(user_id, self.__accounts[user_id]) == JwcNetState.SUCCESS, 0
+            if not success:
+                client.close()
+                raise ConnectionError('Login failed! Account: ' + user_id)
+            session = (client, version)
+            self.__clients[user_id] = session
+            return session
+
+    def expire(self, user_id: str, client: JwcClient, version: int):
+        with self.__accountLocks[user_id]:
+            session = self.__clients.get(user_id)
+            if session is None or session[0] is not client:
+                return
+            self.__clients.pop(user_id)
+        # Client is not closed here, other threads may still be using it
+        if self.__store is not None:
+            self.__store.invalidate_session(SessionStore.get_service_name(client), user_id, version)
+
+    def get_function_dict(self, user_id: str) -> dict:
+        return self.get(user_id)[0].get_function_dict()
+
+    def fetch(self, task: CrawlTask, time_out: int) -> CrawlPage:
+        page = CrawlPage(task)
+        start_time = time.perf_counter()
+        # noinspection PyBroadException
+        try:
+            client, version = self.get(task.userId)
+            with client.get(task.url, timeout=time_out) as response:
+                page.statusCode = response.status_code
+                page.url = response.url
+                page.content = response.content
+                page.encoding = response.encoding
+                page.headers = dict(response.headers)
+                page.expired = not JwcClient._has_jwc_login(response)
+            if page.expired:
+                self.expire(task.userId, client, version)
+        except Exception as e:
+            page.error = repr(e)
+        page.elapsed = time.perf_counter() - start_time
+        return page
+
+    def close(self):
+        for client, _ in list(self.__clients.values()):
+            client.close()
+        self.__clients.clear()
+
+
+# Sessions of worker process, created by initializer of process pool
+_crawlProcessSessions: _CrawlSessions = None
+
+
+def _init_crawl_process(accounts: dict, client_factory, time_out: int, store_path: str):
+    global _crawlProcessSessions
+    _crawlProcessSessions = _CrawlSessions(accounts, client_factory, time_out, store_path)
+
+
+def _crawl_process_function_dict(user_id: str) -> dict:
+    return _crawlProcessSessions.get_function_dict(user_id)
+
+
+def _crawl_process_fetch(task: CrawlTask, time_out: int) -> CrawlPage:
+    return _crawlProcessSessions.fetch(task, time_out)
+
+
+# Fetch all pages of jwc function tree of every account, level by level
+# Pages are deduplicated by account and canonical url, so vpn urls and real urls are the same page
+# Every host has at most host_limit pages in flight, finished pages are written to sink in the calling thread
+# Thread mode shares one login of each account, process mode shares logins of all processes with a SessionStore
+# A temporary store is used if session_store_path is not set, otherwise the login of one process would log out
+# the others, client_factory should be picklable in process mode
+class CrawlEngine:
+    __pageCount: int = 0
+    __failedCount: int = 0
+    __failedAccountCount: int = 0
+    __duplicateCount: int = 0
+    __skippedCount: int = 0
+    __byteCount: int = 0
+    __crawlTime: float = 0
+
+    # Accounts is a list of (user_id, user_pw)
+    def __init__(self, accounts: list, sink: CrawlSink, workers: int = 8, host_limit: int = 4,
+                 checkpoint_path: str = None, use_processes: bool = False, session_store_path: str = None,
+                 client_factory=None, time_out: int = 10, max_attempts: int = 2):
+        self.__accounts = OrderedDict(accounts)
+        self.__sink = sink
+        self.__workers = max(1, workers)
+        self.__hostLimit = max(1, host_limit)
+        self.__checkpoint = CrawlCheckpoint(checkpoint_path) if checkpoint_path is not None else None
+        self.__useProcesses = use_processes
+        self.__sessionStorePath = session_store_path
+        self.__clientFactory = client_factory
+        self.__timeOut = time_out
+        self.__maxAttempts = max(1, max_attempts)
+        self.__failedPages = []
+
+    @staticmethod
+    def iter_function_tree(function_dict: dict, user_id: str):
+        queue = deque([((), function_dict)])
+        while len(queue) > 0:
+            path, node = queue.popleft()
+            for name, value in node.items():
+                if isinstance(value, dict):
+                    queue.append((path + (name,), value))
+                elif isinstance(value, str) and len(value.strip()) > 0:
+                    yield CrawlTask(user_id, path + (name,), value)
+
+    # Tasks of all accounts are merged level by level
+    def __build_tasks(self, function_dicts: dict) -> list:
+        tasks = []
+        seen_keys = set()
+        for user_id, function_dict in function_dicts.items():
+            for task in self.iter_function_tree(function_dict, user_id):
+                key = task.get_key()
+                if key in seen_keys:
+                    self.__duplicateCount += 1
+                    continue
+                seen_keys.add(key)
+                if self.__checkpoint is not None and self.__checkpoint.is_done(key):
+                    self.__skippedCount += 1
+                    continue
+                tasks.append(task)
+        tasks.sort(key=lambda t: t.depth)
+        return tasks
+
+    def __create_executor(self, store_path: str):
+        if self.__useProcesses:
+            return ProcessPoolExecutor(max_workers=self.__workers, initializer=_init_crawl_process,
+                                       initargs=(dict(self.__accounts), self.__clientFactory, self.__timeOut,
+                                                 store_path))
+        return ThreadPoolExecutor(max_workers=self.__workers)
+
+    # Return metrics of this crawl
+    def crawl(self) -> dict:
+        start_time = time.perf_counter()
+        if self.__checkpoint is not None:
+            self.__checkpoint.load()
+        sessions = None
+        store_path = self.__sessionStorePath
+        store_directory = None
+        if not self.__useProcesses:
+            sessions = _CrawlSessions(self.__accounts, self.__clientFactory, self.__timeOut, store_path)
+        elif store_path is None:
+            store_directory = tempfile.TemporaryDirectory(prefix='nau_crawl_')
+            store_path = os.path.join(store_directory.name, 'sessions.db')
+        executor = self.__create_executor(store_path)
+        self.__sink.open()
+        try:
+            function_dicts = self.__get_function_dicts(executor, sessions)
+            self.__run(executor, sessions, self.__build_tasks(function_dicts))
+        finally:
+            executor.shutdown(wait=True)
+            self.__sink.close()
+            if self.__checkpoint is not None:
+                self.__checkpoint.close()
+            if sessions is not None:
+                sessions.close()
+            if store_directory is not None:
+                store_directory.cleanup()
+            self.__crawlTime += time.perf_counter() - start_time
+        return self.get_metrics()
+
+    def __get_function_dicts(self, executor, sessions: _CrawlSessions) -> dict:
+        if sessions is not None:
+            futures = {user_id: executor.submit(sessions.get_function_dict, user_id)
+                       for user_id in self.__accounts.keys()}
+        else:
+            futures = {user_id: executor.submit(_crawl_process_function_dict, user_id)
+                       for user_id in self.__accounts.keys()}
+        function_dicts = OrderedDict()
+        for user_id, future in futures.items():
+            # noinspection PyBroadException
+            try:
+                function_dicts[user_id] = future.result()
+            except:
+                # Account could not login, its pages are not crawled
+                self.__failedAccountCount += 1
+        return function_dicts
+
+    def __run(self, executor, sessions: _CrawlSessions, tasks: list):
+        host_queues: OrderedDict = OrderedDict()
+        for task in tasks:
+            host_queues.setdefault(task.host, deque()).append(task)
+        host_in_flight = {host: 0 for host in host_queues.keys()}
+        futures = {}
+        while True:
+            self.__submit_ready(executor, sessions, host_queues, host_in_flight, futures)
+            if len(futures) == 0:
+                break
+            done_futures, _ = wait(list(futures.keys()), return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                task = futures.pop(future)
+                host_in_flight[task.host] -= 1
+                try:
+                    page = future.result()
+                except Exception as e:
+                    page = CrawlPage(task)
+                    page.error = repr(e)
+                self.__handle_page(page, host_queues)
+
+    def __submit_ready(self, executor, sessions: _CrawlSessions, host_queues: OrderedDict, host_in_flight: dict,
+                       futures: dict):
+        submitted = True
+        while submitted and len(futures) < self.__workers * 2:
+            submitted = False
+            # Round robin over hosts, tasks of one host keep their level order
+            for host, queue in host_queues.items():
+                if len(queue) == 0 or host_in_flight[host] >= self.__hostLimit:
+                    continue
+                task = queue.popleft()
+                task.attempt += 1
+                if sessions is not None:
+                    future = executor.submit(sessions.fetch, task, self.__timeOut)
+                else:
+                    future = executor.submit(_crawl_process_fetch, task, self.__timeOut)
+                futures[future] = task
+                host_in_flight[host] += 1
+                submitted = True
+
+    def __handle_page(self, page: CrawlPage, host_queues: OrderedDict):
+        task = page.task
+        if page.is_success():
+            self.__pageCount += 1
+            self.__byteCount += len(page.content) if page.content is not None else 0
+            self.__sink.write(page)
+            if self.__checkpoint is not None:
+                self.__checkpoint.mark_done(task.get_key())
+        elif task.attempt < self.__maxAttempts and (page.expired or page.error is not None):
+            # Session has been expired and will login again, or the request may succeed next time
+            host_queues[task.host].append(task)
+        else:
+            self.__failedCount += 1
+            self.__failedPages.append(page)
+
+    def get_failed_pages(self) -> list:
+        return list(self.__failedPages)
+
+    def get_metrics(self) -> dict:
+        return {
+            'pages': self.__pageCount,
+            'failed': self.__failedCount,
+            'failed_accounts': self.__failedAccountCount,
+            'duplicates': self.__duplicateCount,
+            'skipped': self.__skippedCount,
+            'bytes': self.__byteCount,
+            'crawl_time': self.__crawlTime,
+            'pages_per_second': self.__pageCount / self.__crawlTime if self.__crawlTime > 0 else 0
+        }
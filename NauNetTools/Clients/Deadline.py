@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from requests.exceptions import Timeout
+
+
+# Subclass of requests Timeout, so it is handled the same as other timeouts
+class DeadlineExceeded(Timeout):
+    pass
+
+
+# Overall time budget of a multi-step operation, such as sso login with redirects and vpn login again
+# Every request sent inside Deadline.use() only gets the remaining time as its timeout
+# Works with threads and asyncio tasks, requests of other threads are not affected
+class Deadline:
+    expireTime: float
+    __current: ContextVar = ContextVar('nau_net_deadline', default=None)
+
+    def __init__(self, seconds: float):
+        self.expireTime = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expireTime - time.monotonic()
+
+    def is_expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.is_expired():
+            raise DeadlineExceeded('Deadline exceeded!')
+
+    # Timeout should not be longer than remaining time, timeout could be None, a number or (connect, read)
+    def get_timeout(self, timeout=None):
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded('Deadline exceeded!')
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
+
+    @classmethod
+    def current(cls):
+        return cls.__current.get()
+
+    # The earlier one of this deadline and the current deadline is used inside this block
+    @classmethod
+    @contextmanager
+    def use(cls, deadline):
+        current = cls.__current.get()
+        if deadline is None or (current is not None and current.expireTime <= deadline.expireTime):
+            yield current
+            return
+        token = cls.__current.set(deadline)
+        try:
+            yield deadline
+        finally:
+            cls.__current.reset(token)
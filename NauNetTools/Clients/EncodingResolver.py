@@ -0,0 +1,122 @@
+import codecs
+import re
+from abc import ABCMeta, abstractmethod
+from threading import Lock
+from urllib import parse
+
+from requests import Response
+
+from NauNetTools.Clients.ResponsePeeker import ResponsePeeker
+
+
+class EncodingResolver(object):
+    __metaclass__ = ABCMeta
+
+    # Return None to let requests decide when response.text is used
+    @abstractmethod
+    def resolve(self, response: Response):
+        pass
+
+
+# Old behavior, detect charset from the full content every time
+# Streaming responses are left to requests, otherwise the whole body will be read here
+class DetectEncodingResolver(EncodingResolver):
+    def resolve(self, response: Response):
+        if ResponsePeeker.is_streaming(response):
+            return None
+        return response.apparent_encoding
+
+
+# Content-Type header -> <meta charset> -> per host cache -> charset detection
+# Streaming responses only peek the meta sniff size, and skip charset detection
+class CachedEncodingResolver(EncodingResolver):
+    __metaCharsetPattern = re.compile(br'<meta[^>]+?charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-:.]+)', re.IGNORECASE)
+    # Browsers decode gb2312 pages as gbk, so do we
+    __encodingAlias: dict = {
+        'gb2312': 'gb18030',
+        'gbk': 'gb18030'
+    }
+    __textMimeKeywords: list = ['text/', 'xml', 'json', 'javascript', 'x-www-form-urlencoded']
+    __metaSniffSize: int
+    __useHostCache: bool
+
+    def __init__(self, meta_sniff_size: int = 4096, use_host_cache: bool = True):
+        self.__metaSniffSize = meta_sniff_size
+        self.__useHostCache = use_host_cache
+        self.__hostEncodingCache: dict = {}
+        self.__hostEncodingCacheLock = Lock()
+
+    def __normalize_encoding(self, encoding) -> str:
+        if encoding is None:
+            return None
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode('ascii', 'ignore')
+        encoding = encoding.strip().strip('"\'').lower()
+        encoding = self.__encodingAlias.get(encoding, encoding)
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            return None
+        return encoding
+
+    @staticmethod
+    def _get_mime_type(response: Response) -> str:
+        content_type = response.headers.get('Content-Type')
+        if content_type is None:
+            return ''
+        return content_type.split(';', 1)[0].strip().lower()
+
+    def _get_header_encoding(self, response: Response):
+        content_type = response.headers.get('Content-Type')
+        if content_type is not None:
+            for param in content_type.split(';')[1:]:
+                key, _, value = param.partition('=')
+                if key.strip().lower() == 'charset':
+                    return self.__normalize_encoding(value)
+        return None
+
+    def _get_meta_encoding(self, response: Response):
+        if self.__metaSniffSize > 0:
+            content = ResponsePeeker.peek_content(response, self.__metaSniffSize)
+            if content is not None:
+                match = self.__metaCharsetPattern.search(content, 0, self.__metaSniffSize)
+                if match is not None:
+                    return self.__normalize_encoding(match.group(1))
+        return None
+
+    def is_text_response(self, response: Response) -> bool:
+        mime_type = self._get_mime_type(response)
+        if len(mime_type) == 0:
+            return True
+        for keyword in self.__textMimeKeywords:
+            if keyword in mime_type:
+                return True
+        return False
+
+    def clear_cache(self):
+        with self.__hostEncodingCacheLock:
+            self.__hostEncodingCache.clear()
+
+    def resolve(self, response: Response):
+        encoding = self._get_header_encoding(response)
+        if encoding is not None:
+            return encoding
+        if not self.is_text_response(response):
+            return None
+        encoding = self._get_meta_encoding(response)
+        if encoding is not None:
+            return encoding
+        cache_key = None
+        if self.__useHostCache and response.url is not None:
+            cache_key = (parse.urlparse(response.url).netloc.lower(), self._get_mime_type(response))
+            with self.__hostEncodingCacheLock:
+                encoding = self.__hostEncodingCache.get(cache_key)
+            if encoding is not None:
+                return encoding
+        if ResponsePeeker.is_streaming(response):
+            return None
+        encoding = self.__normalize_encoding(response.apparent_encoding)
+        if encoding is not None and cache_key is not None:
+            with self.__hostEncodingCacheLock:
+                self.__hostEncodingCache[cache_key] = encoding
+        return encoding
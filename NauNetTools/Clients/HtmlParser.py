@@ -0,0 +1,159 @@
+import re
+from enum import IntEnum
+from html.parser import HTMLParser as _TagParser
+
+from bs4 import BeautifulSoup, Tag
+
+try:
+    import lxml.html as lxml_html
+except ImportError:
+    lxml_html = None
+
+
+class HtmlParserBackend(IntEnum):
+    # Use LXML if lxml is installed, otherwise use TARGETED
+    AUTO = 0
+    # Parse full page with BeautifulSoup html.parser
+    HTML_PARSER = 1
+    # Only scan the needed tags and parse the needed fragment with html.parser
+    TARGETED = 2
+    # Same as TARGETED, but use lxml
+    LXML = 3
+
+
+class _TagAttrParser(_TagParser):
+    def __init__(self):
+        super(_TagAttrParser, self).__init__()
+        self.attrs = {}
+
+    def handle_starttag(self, tag, attrs):
+        for key, value in attrs:
+            self.attrs[key] = '' if value is None else value
+
+    def error(self, message):
+        pass
+
+
+# Fast path html parsing for login forms and function trees
+# All backends return the same results as parsing full page with html.parser
+class HtmlParser:
+    __backend: HtmlParserBackend = HtmlParserBackend.AUTO
+    __commentPattern = re.compile(r'<!--.*?-->', re.DOTALL)
+    __inputTagPattern = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+
+    @classmethod
+    def set_backend(cls, backend: HtmlParserBackend):
+        if backend == HtmlParserBackend.LXML and lxml_html is None:
+            raise ImportError('lxml is not installed!')
+        cls.__backend = backend
+
+    @classmethod
+    def get_backend(cls) -> HtmlParserBackend:
+        if cls.__backend == HtmlParserBackend.AUTO:
+            if lxml_html is not None:
+                return HtmlParserBackend.LXML
+            else:
+                return HtmlParserBackend.TARGETED
+        return cls.__backend
+
+    @staticmethod
+    def __parse_tag_attrs(tag_html: str) -> dict:
+        parser = _TagAttrParser()
+        parser.feed(tag_html)
+        parser.close()
+        return parser.attrs
+
+    # Return {name: value} of <input> whose name is in names, later inputs override former ones
+    @classmethod
+    def find_input_values(cls, html: str, names: list, backend: HtmlParserBackend = None) -> dict:
+        if backend is None:
+            backend = cls.get_backend()
+        values = {}
+        if backend == HtmlParserBackend.LXML:
+            # noinspection PyBroadException
+            try:
+                for node in lxml_html.fromstring(html).iter('input'):
+                    name = node.get('name')
+                    if name in names:
+                        values[name] = node.get('value')
+                return values
+            except:
+                values = {}
+                backend = HtmlParserBackend.TARGETED
+        if backend == HtmlParserBackend.TARGETED:
+            for tag_html in cls.__inputTagPattern.findall(cls.__commentPattern.sub('', html)):
+                attrs = cls.__parse_tag_attrs(tag_html)
+                name = attrs.get('name')
+                if name in names:
+                    values[name] = attrs.get('value')
+            return values
+        soup = BeautifulSoup(html, 'html.parser')
+        for node in soup.find_all('input'):
+            name = node.get('name')
+            if name in names:
+                values[name] = node.get('value')
+        return values
+
+    # Return {name: value} of all <input type="hidden">, such as __VIEWSTATE and __EVENTVALIDATION of ASP.NET forms
+    @classmethod
+    def find_hidden_input_values(cls, html: str, backend: HtmlParserBackend = None) -> dict:
+        if backend is None:
+            backend = cls.get_backend()
+        values = {}
+        if backend == HtmlParserBackend.LXML:
+            # noinspection PyBroadException
+            try:
+                for node in lxml_html.fromstring(html).iter('input'):
+                    name = node.get('name')
+                    if name is not None and (node.get('type') or '').lower() == 'hidden':
+                        values[name] = node.get('value') or ''
+                return values
+            except:
+                values = {}
+                backend = HtmlParserBackend.TARGETED
+        if backend == HtmlParserBackend.TARGETED:
+            for tag_html in cls.__inputTagPattern.findall(cls.__commentPattern.sub('', html)):
+                attrs = cls.__parse_tag_attrs(tag_html)
+                name = attrs.get('name')
+                if name is not None and attrs.get('type', '').lower() == 'hidden':
+                    values[name] = attrs.get('value', '')
+            return values
+        soup = BeautifulSoup(html, 'html.parser')
+        for node in soup.find_all('input'):
+            name = node.get('name')
+            if name is not None and (node.get('type') or '').lower() == 'hidden':
+                values[name] = node.get('value') or ''
+        return values
+
+    # Return the raw html of the first <tag id="element_id"> and all its children, or None if not found
+    @staticmethod
+    def extract_element_html(html: str, tag: str, element_id: str):
+        tag = re.escape(tag)
+        start_match = re.search(r'<' + tag + r'\b[^>]*?\bid\s*=\s*["\']?' + re.escape(element_id) + r'["\'\s/>]',
+                                html, re.IGNORECASE)
+        if start_match is None:
+            return None
+        depth = 0
+        for match in re.finditer(r'<(/?)' + tag + r'\b[^>]*>', html[start_match.start():], re.IGNORECASE):
+            if match.group(1) == '/':
+                depth -= 1
+                if depth == 0:
+                    return html[start_match.start():start_match.start() + match.end()]
+            else:
+                depth += 1
+        return html[start_match.start():]
+
+    # Return the first <tag id="element_id"> as BeautifulSoup Tag, or None if not found
+    @classmethod
+    def find_element_by_id(cls, html: str, tag: str, element_id: str, backend: HtmlParserBackend = None):
+        if backend is None:
+            backend = cls.get_backend()
+        if backend != HtmlParserBackend.HTML_PARSER:
+            fragment = cls.extract_element_html(html, tag, element_id)
+            if fragment is not None:
+                features = 'lxml' if backend == HtmlParserBackend.LXML else 'html.parser'
+                node = BeautifulSoup(fragment, features).find(tag, id=element_id)
+                if isinstance(node, Tag):
+                    return node
+        node = BeautifulSoup(html, 'html.parser').find(tag, id=element_id)
+        return node if isinstance(node, Tag) else None
@@ -1,11 +1,23 @@
+import codecs
+import copy
+import hashlib
+import time
+from collections import OrderedDict
 from enum import IntEnum
+from threading import Lock
 from urllib import parse
 
 # noinspection PyProtectedMember
-from bs4 import BeautifulSoup, Tag
+from bs4 import Tag
 from requests import Response
+from requests.exceptions import Timeout
 
+from NauNetTools.Clients.Deadline import Deadline
+from NauNetTools.Clients.HtmlParser import HtmlParser, HtmlParserBackend
+from NauNetTools.Clients.LoginKeeper import LoginKeeper
+from NauNetTools.Clients.ResponsePeeker import ResponsePeeker
 from NauNetTools.Clients.SSOClient import SSOClient
+from NauNetTools.Clients.TableStreamParser import TableStreamParser
 from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor, VPNUtils
 
 
@@ -36,17 +48,32 @@ class JwcClient(SSOClient):
     __jwcLogoutUrl: str = jwcServer + 'LoginOut.aspx'
     __jwcStudentIndex: str = jwcServer + 'Students/StudentIndex.aspx'
     __netTimeOut: int
+    # Minutes between two probes of the default login keeper
     __loginKeeperRecallPeriod: int = 5
+    __defaultLoginKeeper: LoginKeeper = None
+    __defaultLoginKeeperLock: Lock = Lock()
+    # Only this size of streaming response is read to check jwc login page
+    __loginCheckSize: int = 8 * 1024
     __jwcIndexUrl = None
     __jwcIndexPath = None
     __loginState: bool = False
     __lastLoginSuccessHtml = None
     avoidAlreadyLogin: bool
+    # Parsed function trees shared by all clients, key is hash of tree html and index path
+    __functionTreeCache: OrderedDict = OrderedDict()
+    __functionTreeCacheLock: Lock = Lock()
+    functionTreeCacheSize: int = 64
+    # Hidden form fields of the last response of every page, used by the next postback of the same page
+    postbackStateCacheSize: int = 32
+    __postbackErrorTexts: tuple = ('Invalid postback or callback argument', 'Validation of viewstate MAC failed',
+                                   '无效的回发或回调参数', '验证视图状态 MAC 失败')
 
-    def __init__(self, time_out: int = 10, avoid_already_login: bool = True):
+    # Result of check_login will be reused in login_check_cache_time seconds, 0 means always check
+    def __init__(self, time_out: int = 10, avoid_already_login: bool = True, login_check_cache_time: float = 0):
         super(JwcClient, self).__init__(self.__jwcSingleLoginUrl, time_out)
 
-        self.__jwcFunctionDict: dict = {}
+        self.__jwcFunctionDict = None
+        self.__jwcFunctionHtml = None
         self._jwcPublicHeader: dict = {
             'User-Agent': self._ssoUA,
             'Accept': '*/*',
@@ -59,6 +86,12 @@ class JwcClient(SSOClient):
 
         self.__netTimeOut = time_out
         self.avoidAlreadyLogin = avoid_already_login
+        self.loginCheckCacheTime = login_check_cache_time
+        self.__loginCheckTime = None
+        self.__loginCheckResult = False
+        self.__loginKeeper = None
+        self.__postbackStates: OrderedDict = OrderedDict()
+        self.__postbackStateLock = Lock()
 
     def get_jwc_server(self):
         return self.jwcServer
@@ -66,21 +99,26 @@ class JwcClient(SSOClient):
     def get_jwc_main_url(self):
         return self.__jwcIndexUrl
 
-    def login(self, user_id: str, user_pw: str, sso_response: Response = None) -> JwcNetState:
-        return self._jwc_login(user_id, user_pw, sso_response)
+    # Logout and login again of avoidAlreadyLogin and vpn login again are limited by the same deadline
+    def login(self, user_id: str, user_pw: str, sso_response: Response = None,
+              deadline: Deadline = None) -> JwcNetState:
+        return self._jwc_login(user_id, user_pw, sso_response, deadline=deadline)
 
     def get_last_login_success_html(self):
         return self.__lastLoginSuccessHtml
 
-    def _jwc_login(self, user_id: str, user_pw: str, sso_response: Response = None, re_login_once: bool = False):
+    def _jwc_login(self, user_id: str, user_pw: str, sso_response: Response = None, re_login_once: bool = False,
+                   deadline: Deadline = None):
         # noinspection PyBroadException
         try:
-            login_result = super(JwcClient, self).login(user_id, user_pw, sso_response)
+            with Deadline.use(deadline) as deadline:
+                login_result = super(JwcClient, self).login(user_id, user_pw, sso_response)
             if login_result.is_success:
                 if '当前你已经登录' in login_result.text:
                     if self.avoidAlreadyLogin and not re_login_once:
-                        self.logout()
-                        return self._jwc_login(user_id, user_pw, sso_response, True)
+                        with Deadline.use(deadline):
+                            self.__jwc_logout()
+                        return self._jwc_login(user_id, user_pw, sso_response, True, deadline)
                     else:
                         return JwcNetState.ALREADY_LOGIN
                 elif '请勿输入非法字符' in login_result.text:
@@ -88,26 +126,30 @@ class JwcClient(SSOClient):
                 elif '密码错误' in login_result.text:
                     return JwcNetState.PASSWORD_ERROR
                 else:
-                    self.__loginState = True
-                    self.__jwcIndexUrl = login_result.url
+                    self.__loginState = self.__save_login_check(True)
+                    self.clear_postback_state()
+                    # Keep the same index url whether vpn is used or not
+                    self.__jwcIndexUrl = VPNInterceptor.get_vpn_url_builder().canonicalize_url(login_result.url)
                     self.__lastLoginSuccessHtml = login_result.text
                     # noinspection PyBroadException
                     try:
-                        self.__jwcIndexPath = self.__get_index_path(login_result.url)
-                        self.__parse_jwc_function(login_result.text)
+                        self.__jwcIndexPath = self._get_index_path(self.__jwcIndexUrl)
+                        # Function tree will be parsed when it is used
+                        self.__jwcFunctionDict = None
+                        self.__jwcFunctionHtml = self._extract_jwc_function_html(login_result.text)
                     except:
                         return JwcNetState.PARSE_ERROR
                     else:
                         return JwcNetState.SUCCESS
             else:
                 return JwcNetState.PASSWORD_ERROR
-        except TimeoutError:
+        except (TimeoutError, Timeout):
             return JwcNetState.TIME_OUT
         except:
             return JwcNetState.REQUEST_ERROR
 
     @staticmethod
-    def __get_index_path(url: str) -> str:
+    def _get_index_path(url: str) -> str:
         path = ''
         if url is not None:
             path = parse.urlparse(url).path
@@ -115,69 +157,360 @@ class JwcClient(SSOClient):
                 path = path[1:path.rindex('/') + 1]
         return path
 
-    def __parse_jwc_function(self, content_html: str):
-        if content_html is not None and not str.isspace(content_html):
-            self.__jwcFunctionDict = {}
-            soup = BeautifulSoup(content_html, "html.parser")
-            tree = soup.find('ul', id='tt')
-            if isinstance(tree, Tag):
-                self.__tree_node_selector(tree, self.__jwcFunctionDict)
-            else:
-                raise IOError('Tag found error!')
+    @staticmethod
+    def _extract_jwc_function_html(content_html: str) -> str:
+        if content_html is None or str.isspace(content_html):
+            return None
+        function_html = HtmlParser.extract_element_html(content_html, 'ul', 'tt')
+        if function_html is None:
+            raise IOError('Tag found error!')
+        return function_html
+
+    # Same function tree will only be parsed once in process
+    @classmethod
+    def _get_jwc_function_dict(cls, function_html: str, index_path: str) -> dict:
+        if function_html is None:
+            return {}
+        key = hashlib.sha1((index_path or '').encode('utf-8') + b'\n' + function_html.encode('utf-8')).hexdigest()
+        with cls.__functionTreeCacheLock:
+            function_dict = cls.__functionTreeCache.get(key)
+            if function_dict is not None:
+                cls.__functionTreeCache.move_to_end(key)
+        if function_dict is None:
+            function_dict = cls._parse_jwc_function_dict(function_html, index_path)
+            with cls.__functionTreeCacheLock:
+                cls.__functionTreeCache[key] = function_dict
+                while len(cls.__functionTreeCache) > cls.functionTreeCacheSize:
+                    cls.__functionTreeCache.popitem(last=False)
+        # Cached dict should not be changed by users
+        return copy.deepcopy(function_dict)
+
+    @classmethod
+    def clear_function_tree_cache(cls):
+        with cls.__functionTreeCacheLock:
+            cls.__functionTreeCache.clear()
+
+    @classmethod
+    def _parse_jwc_function_dict(cls, content_html: str, index_path: str) -> dict:
+        function_dict = {}
+        tree = HtmlParser.find_element_by_id(content_html, 'ul', 'tt')
+        if isinstance(tree, Tag):
+            cls.__tree_node_selector(tree, function_dict, index_path)
+        else:
+            raise IOError('Tag found error!')
+        return function_dict
 
-    def __tree_node_selector(self, soup_node_tree: Tag, father_dict: dict):
+    @classmethod
+    def __tree_node_selector(cls, soup_node_tree: Tag, father_dict: dict, index_path: str):
         for li in soup_node_tree.find_all('li', recursive=False):
             ul = li.find('ul', recursive=False)
             if ul is None:
                 a = li.find('a')
-                father_dict[a.text] = self.__tree_node_jump_url_fix(a.attrs['href'])
+                father_dict[a.text] = cls.__tree_node_jump_url_fix(a.attrs['href'], index_path)
             else:
                 key = li.find('span').text
                 father_dict[key] = {}
-                self.__tree_node_selector(ul, father_dict[key])
+                cls.__tree_node_selector(ul, father_dict[key], index_path)
 
-    def __tree_node_jump_url_fix(self, href: str) -> str:
+    @classmethod
+    def __tree_node_jump_url_fix(cls, href: str, index_path: str) -> str:
         if href is not None:
             href = href.strip()
             if 'Direct' in href:
                 start = href.index('Direct')
                 href = href[href.index('\'', start) + 1:href.rindex('\'', start)]
+            href = VPNInterceptor.get_vpn_url_builder().canonicalize_url(href)
             if href.startswith('http'):
                 return href
             else:
-                if VPNUtils.is_use_school_vpn(self):
-                    return VPNInterceptor.vpnServer + '/' + self.__jwcIndexPath + href
-                else:
-                    return self.jwcServer + self.__jwcIndexPath + href
+                return cls.jwcServer + index_path + href
         return ''
 
-    def check_login(self) -> bool:
+    def __save_login_check(self, result: bool) -> bool:
+        self.__loginCheckResult = result
+        self.__loginCheckTime = time.monotonic()
+        return result
+
+    def __has_login_check_cache(self) -> bool:
+        return self.loginCheckCacheTime > 0 and self.__loginCheckTime is not None \
+               and time.monotonic() - self.__loginCheckTime < self.loginCheckCacheTime
+
+    def clear_login_check_cache(self):
+        self.__loginCheckTime = None
+
+    # Cached result will be returned if use_cache is True and it is not older than loginCheckCacheTime
+    def check_login(self, use_cache: bool = True) -> bool:
+        if use_cache and self.__has_login_check_cache():
+            return self.__loginCheckResult
         if super(JwcClient, self).check_login():
             # noinspection PyBroadException
             try:
                 with self.get(self.__jwcStudentIndex, timeout=self.__netTimeOut,
                               headers=self._jwcPublicHeader) as check_login_response:
-                    url_parse = parse.urlparse(check_login_response.url)
-                    return 'Login.aspx' not in url_parse.path and '用户登录_南京审计大学教务管理系统' not in check_login_response.text
+                    return self.__save_login_check(self._has_jwc_login(check_login_response))
             except:
                 return False
         else:
+            return self.__save_login_check(False)
+
+    # Only one jwc request, body is not read unless it may be the login page
+    # Jwc session is refreshed by this request, exceptions of request will be raised
+    def probe_login(self) -> bool:
+        if not self.__loginState:
             return False
+        with self.get(self.__jwcStudentIndex, timeout=self.__netTimeOut, headers=self._jwcPublicHeader,
+                      stream=True) as probe_response:
+            return self.__save_login_check(self._has_jwc_login(probe_response))
+
+    @classmethod
+    def get_default_login_keeper(cls) -> LoginKeeper:
+        with cls.__defaultLoginKeeperLock:
+            if cls.__defaultLoginKeeper is None:
+                cls.__defaultLoginKeeper = LoginKeeper(cls.__loginKeeperRecallPeriod * 60)
+            return cls.__defaultLoginKeeper
+
+    # Probe login in background before jwc session times out, on_expired(client) is called if login is expired
+    # Default keeper is shared by all clients and probes every __loginKeeperRecallPeriod minutes
+    def start_login_keeper(self, on_expired=None, keeper: LoginKeeper = None, period: float = None):
+        self.stop_login_keeper()
+        if keeper is None:
+            keeper = self.get_default_login_keeper()
+        self.__loginKeeper = keeper
+        keeper.add(self, on_expired, period)
+        keeper.start()
+
+    def stop_login_keeper(self):
+        if self.__loginKeeper is not None:
+            self.__loginKeeper.remove(self)
+            self.__loginKeeper = None
+
+    @staticmethod
+    def __get_postback_key(url: str) -> str:
+        return parse.urldefrag(VPNInterceptor.get_vpn_url_builder().canonicalize_url(url))[0]
+
+    def get_postback_state(self, page_url: str):
+        with self.__postbackStateLock:
+            state = self.__postbackStates.get(self.__get_postback_key(page_url))
+            return dict(state) if state is not None else None
+
+    def __save_postback_state(self, key: str, state: dict):
+        with self.__postbackStateLock:
+            self.__postbackStates[key] = state
+            self.__postbackStates.move_to_end(key)
+            while len(self.__postbackStates) > self.postbackStateCacheSize:
+                self.__postbackStates.popitem(last=False)
+
+    def clear_postback_state(self, page_url: str = None):
+        with self.__postbackStateLock:
+            if page_url is None:
+                self.__postbackStates.clear()
+            else:
+                self.__postbackStates.pop(self.__get_postback_key(page_url), None)
+
+    # Hidden fields of ASP.NET UpdatePanel response: length|type|id|content|...
+    @staticmethod
+    def _parse_delta_hidden_fields(text: str) -> dict:
+        values = {}
+        index = 0
+        while index < len(text):
+            length_end = text.find('|', index)
+            type_end = text.find('|', length_end + 1)
+            id_end = text.find('|', type_end + 1)
+            if length_end < 0 or type_end < 0 or id_end < 0 or not text[index:length_end].isdigit():
+                break
+            content_start = id_end + 1
+            content_end = content_start + int(text[index:length_end])
+            if text[length_end + 1:type_end] == 'hiddenField' and id_end > type_end + 1:
+                values[text[type_end + 1:id_end]] = text[content_start:content_end]
+            index = content_end + 1
+        return values
+
+    # Only <input type="hidden"> are scanned, the page is not parsed
+    @classmethod
+    def _get_response_hidden_fields(cls, response: Response) -> dict:
+        text = response.text
+        if 'text/plain' in response.headers.get('Content-Type', '').lower() and text[:1].isdigit():
+            return cls._parse_delta_hidden_fields(text)
+        return HtmlParser.find_hidden_input_values(text, HtmlParserBackend.TARGETED)
+
+    # Response of another page, such as the login page, is not saved as state of this page
+    def __update_postback_state(self, key: str, response: Response, old_state: dict = None):
+        if response.status_code != 200 or self.__get_postback_key(response.url) != key:
+            return None
+        state = self._get_response_hidden_fields(response)
+        if old_state is not None:
+            state = dict(old_state, **state)
+        if '__VIEWSTATE' not in state.keys():
+            return None
+        self.__save_postback_state(key, state)
+        return state
+
+    def __is_postback_error(self, response: Response) -> bool:
+        if response.status_code != 500:
+            return False
+        text = response.text
+        return any(error_text in text for error_text in self.__postbackErrorTexts)
+
+    # Post back ASP.NET form of page_url, such as next page of grades or query with filters
+    # Hidden fields of the last response of this page are reused, page is only loaded when there is no state
+    # Fields override hidden fields, page is loaded again and posted once more if saved state is rejected
+    def postback(self, page_url: str, event_target: str = '', fields: dict = None, event_argument: str = '',
+                 timeout: float = None, **kwargs) -> Response:
+        if timeout is None:
+            timeout = self.__netTimeOut
+        headers = kwargs.pop('headers', self._jwcPublicHeader)
+        key = self.__get_postback_key(page_url)
+        state = self.get_postback_state(page_url)
+        is_saved_state = state is not None
+        while True:
+            if state is None:
+                with self.get(page_url, timeout=timeout, headers=headers) as page_response:
+                    state = self.__update_postback_state(key, page_response)
+                if state is None:
+                    raise ConnectionError('Postback state not found! Url: ' + page_url)
+            data = dict(state)
+            data['__EVENTTARGET'] = event_target
+            data['__EVENTARGUMENT'] = event_argument
+            if fields is not None:
+                data.update(fields)
+            response = self.post(page_url, data=data, timeout=timeout, headers=headers, **kwargs)
+            if is_saved_state and self.__is_postback_error(response):
+                response.close()
+                self.clear_postback_state(page_url)
+                state = None
+                is_saved_state = False
+                continue
+            self.__update_postback_state(key, response, state)
+            return response
+
+    # Url is returned as it is, path is names from the top of function dict, name is the first page with this name
+    def get_function_url(self, function_name_or_url) -> str:
+        if isinstance(function_name_or_url, str) and '://' in function_name_or_url:
+            return function_name_or_url
+        function_dict = self.get_function_dict()
+        if isinstance(function_name_or_url, (tuple, list)):
+            node = function_dict
+            for name in function_name_or_url:
+                node = node.get(name) if isinstance(node, dict) else None
+            if isinstance(node, str):
+                return node
+        else:
+            nodes = [function_dict]
+            while len(nodes) > 0:
+                node = nodes.pop(0)
+                for name, value in node.items():
+                    if isinstance(value, dict):
+                        nodes.append(value)
+                    elif name == function_name_or_url:
+                        return value
+        raise KeyError('Function not found! Function: ' + str(function_name_or_url))
+
+    # Yield rows of one table of a jwc page as {column name: typed value}, see TableStreamParser for options
+    # Page is parsed while it is downloaded, no DOM is built, and download stops when the table ends
+    # Column mappings of the same header and options are compiled once and shared by all pages
+    def fetch_table(self, function_name_or_url, table_id: str = None, table_index: int = 0, columns=None,
+                    types: dict = None, header_rows: int = 1, chunk_size: int = 16 * 1024, timeout: float = None,
+                    **kwargs):
+        url = self.get_function_url(function_name_or_url)
+        if timeout is None:
+            timeout = self.__netTimeOut
+        headers = kwargs.pop('headers', self._jwcPublicHeader)
+        parser = TableStreamParser(table_id, table_index, columns, types, header_rows)
+        with self.get(url, timeout=timeout, headers=headers, stream=True, **kwargs) as response:
+            if not self._has_jwc_login(response):
+                self.__save_login_check(False)
+                raise ConnectionError('Jwc login is expired!')
+            try:
+                decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')('replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            for chunk in response.iter_content(chunk_size):
+                parser.feed(decoder.decode(chunk))
+                yield from parser.pop_rows()
+                if parser.finished:
+                    break
+            else:
+                parser.feed(decoder.decode(b'', True))
+                parser.close()
+                yield from parser.pop_rows()
+        if not parser.found:
+            raise IOError('Table not found! Url: ' + url)
 
     def check_login_with_response(self, response: Response) -> bool:
         if super(JwcClient, self).check_login_with_response(response):
-            url_parse = parse.urlparse(response.url)
-            return 'Login.aspx' not in url_parse.path and '用户登录_南京审计大学教务管理系统' not in response.text
+            return self._has_jwc_login(response)
         else:
             return False
 
+    @classmethod
+    def _has_jwc_login(cls, response: Response) -> bool:
+        url_parse = parse.urlparse(response.url)
+        if 'Login.aspx' in url_parse.path:
+            return False
+        if ResponsePeeker.is_streaming(response):
+            # Login page title is at the beginning, downloads will not be read here
+            if 'html' not in response.headers.get('Content-Type', 'text/html').lower():
+                return True
+            return '用户登录_南京审计大学教务管理系统' not in ResponsePeeker.peek_text(response, cls.__loginCheckSize)
+        return '用户登录_南京审计大学教务管理系统' not in response.text
+
     def get_function_dict(self) -> dict:
         if self.__loginState:
+            if self.__jwcFunctionDict is None:
+                self.__jwcFunctionDict = self._get_jwc_function_dict(self.__jwcFunctionHtml, self.__jwcIndexPath)
             return self.__jwcFunctionDict
         else:
             raise ConnectionError('You must login once first!')
 
+    # Login state, parsed function dict, vpn interceptor state and full cookie jar
+    def snapshot(self, with_html: bool = False) -> dict:
+        snapshot = super(JwcClient, self).snapshot()
+        vpn_interceptor = self.get_interceptor(VPNInterceptor)
+        snapshot['vpn'] = vpn_interceptor.get_state() if vpn_interceptor is not None else None
+        snapshot['jwc'] = {
+            'login_state': self.__loginState,
+            'index_url': self.__jwcIndexUrl,
+            'index_path': self.__jwcIndexPath,
+            'function_dict': self.__jwcFunctionDict,
+            'function_html': self.__jwcFunctionHtml,
+            'last_login_success_html': self.__lastLoginSuccessHtml if with_html else None
+        }
+        return snapshot
+
+    # Vpn interceptor will be restored only when vpn password is provided
+    # Restored session will be checked with one request if validate is True
+    def restore_snapshot(self, snapshot: dict, vpn_user_pw: str = None, validate: bool = True) -> bool:
+        if not super(JwcClient, self).restore_snapshot(snapshot):
+            return False
+        vpn_state = snapshot.get('vpn')
+        if vpn_state is not None and vpn_user_pw is not None and not VPNUtils.is_use_school_vpn(self):
+            self.add_interceptor(VPNInterceptor.from_state(vpn_state, vpn_user_pw))
+        jwc_state = snapshot.get('jwc')
+        if jwc_state is None or not jwc_state.get('login_state'):
+            return False
+        self.__loginState = True
+        self.__jwcIndexUrl = jwc_state.get('index_url')
+        self.__jwcIndexPath = jwc_state.get('index_path')
+        self.__jwcFunctionDict = jwc_state.get('function_dict')
+        self.__jwcFunctionHtml = jwc_state.get('function_html')
+        self.__lastLoginSuccessHtml = jwc_state.get('last_login_success_html')
+        if validate:
+            # noinspection PyBroadException
+            try:
+                with self.get(self.__jwcStudentIndex, timeout=self.__netTimeOut,
+                              headers=self._jwcPublicHeader) as check_login_response:
+                    self.__loginState = self.__save_login_check(self._has_jwc_login(check_login_response))
+            except:
+                self.__loginState = False
+        return self.__loginState
+
+    # Login keeper is stopped only when user logs out, not when login logs out the already login session
     def logout(self) -> JwcNetState:
+        self.stop_login_keeper()
+        return self.__jwc_logout()
+
+    def __jwc_logout(self) -> JwcNetState:
+        self.clear_login_check_cache()
         # noinspection PyBroadException
         try:
             with self.get(self.__jwcLogoutUrl, timeout=self.__netTimeOut,
@@ -187,10 +520,11 @@ class JwcClient(SSOClient):
                     self.__jwcIndexUrl = None
                     self.__jwcIndexPath = None
                     self.__lastLoginSuccessHtml = None
+                    self.clear_postback_state()
                     return JwcNetState.SUCCESS
                 else:
                     return JwcNetState.SERVER_ERROR
-        except TimeoutError:
+        except (TimeoutError, Timeout):
             return JwcNetState.TIME_OUT
         except:
             return JwcNetState.REQUEST_ERROR
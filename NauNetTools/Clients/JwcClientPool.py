@@ -0,0 +1,278 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from enum import IntEnum
+from threading import Condition
+from urllib import parse
+
+from requests import Response
+
+from NauNetTools.Clients.JwcClient import JwcClient, JwcNetState
+from NauNetTools.Clients.LoginKeeper import LoginKeeper
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, RequestParam
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+
+class PoolSessionState(IntEnum):
+    # Waiting for login
+    LOGGING_IN = 0
+    # Logged in and not used
+    IDLE = 1
+    # Checked out by user
+    IN_USE = 2
+    # Login failed
+    FAILED = 3
+
+
+class PooledSession:
+    userId: str
+    client: JwcClient
+    state: PoolSessionState = PoolSessionState.LOGGING_IN
+    expired: bool = False
+    lastLoginState: JwcNetState = None
+    loginCount: int = 0
+    checkoutCount: int = 0
+
+    def __init__(self, user_id: str, user_pw: str, client: JwcClient):
+        self.userId = user_id
+        self.client = client
+        self.__userPw = user_pw
+
+    def _get_user_pw(self) -> str:
+        return self.__userPw
+
+
+# Mark pooled session as expired when a jwc page returns login page while it is checked out
+class _PoolSessionCheckInterceptor(NetInterceptor):
+    __pooledSession: PooledSession
+    __jwcHost: str = parse.urlparse(JwcClient.jwcServer).netloc
+
+    def __init__(self, pooled_session: PooledSession):
+        self.__pooledSession = pooled_session
+
+    def __is_jwc_url(self, url: str) -> bool:
+        url = VPNInterceptor.get_vpn_url_builder().canonicalize_url(url)
+        return parse.urlparse(url).netloc.lower() == self.__jwcHost
+
+    def request_intercept(self, session: NetworkClient, request_code: int, param: RequestParam):
+        pass
+
+    def response_intercept(self, session: NetworkClient, request_code: int, param: RequestParam,
+                           response: Response) -> Response:
+        if self.__pooledSession.state == PoolSessionState.IN_USE and response is not None \
+                and self.__is_jwc_url(param.url) \
+                and not JwcClient._has_jwc_login(response):
+            self.__pooledSession.expired = True
+        return response
+
+
+# Thread safe pool of logged in JwcClient for multi accounts
+# Sessions are logged in concurrently, and expired sessions are logged in again in background
+class JwcClientPool:
+    __sessionList: list
+    __sessionDict: dict
+    __nextIndex: int = 0
+    __closed: bool = False
+    __checkoutWaitTime: float = 0
+    __checkoutCount: int = 0
+    __checkoutTimeoutCount: int = 0
+    __reLoginCount: int = 0
+
+    # Accounts is a list of (user_id, user_pw)
+    # Client factory will be called without arguments, and should return a new JwcClient
+    # Idle sessions will be probed every keep_alive_period seconds if it is not None
+    # Transport policies is {host pattern: TransportPolicy}, they are shared by all sessions
+    def __init__(self, accounts: list, client_factory=None, login_workers: int = 8, time_out: int = 10,
+                 keep_alive_period: float = None, transport_policies: dict = None):
+        if client_factory is None:
+            def client_factory():
+                return JwcClient(time_out)
+        self.__sessionList = []
+        self.__sessionDict = {}
+        self.__condition = Condition()
+        self.__loginExecutor = ThreadPoolExecutor(max_workers=login_workers)
+        self.__loginKeeper = LoginKeeper(keep_alive_period) if keep_alive_period is not None else None
+        self.__transportPolicies: dict = dict(transport_policies) if transport_policies is not None else {}
+        for user_id, user_pw in accounts:
+            if user_id in self.__sessionDict.keys():
+                continue
+            client = client_factory()
+            if transport_policies is not None:
+                for pattern, policy in transport_policies.items():
+                    client.set_transport_policy(pattern, policy)
+            pooled_session = PooledSession(user_id, user_pw, client)
+            client.add_interceptor(_PoolSessionCheckInterceptor(pooled_session))
+            self.__sessionList.append(pooled_session)
+            self.__sessionDict[user_id] = pooled_session
+            if self.__loginKeeper is not None:
+                self.__loginKeeper.add(client, probe=self.__get_keep_alive_probe(pooled_session))
+
+    # Login all accounts concurrently, return {user_id: JwcNetState}
+    def start(self, wait_login: bool = True, timeout: float = None) -> dict:
+        futures = [self.__loginExecutor.submit(self.__login, pooled_session)
+                   for pooled_session in self.__sessionList if pooled_session.state == PoolSessionState.LOGGING_IN]
+        if self.__loginKeeper is not None:
+            self.__loginKeeper.start()
+        if wait_login:
+            wait(futures, timeout)
+        with self.__condition:
+            return {pooled_session.userId: pooled_session.lastLoginState for pooled_session in self.__sessionList}
+
+    def __login(self, pooled_session: PooledSession):
+        login_state = pooled_session.client.login(pooled_session.userId, pooled_session._get_user_pw())
+        with self.__condition:
+            pooled_session.lastLoginState = login_state
+            pooled_session.loginCount += 1
+            pooled_session.expired = False
+            if login_state == JwcNetState.SUCCESS:
+                pooled_session.state = PoolSessionState.IDLE
+            else:
+                pooled_session.state = PoolSessionState.FAILED
+            self.__condition.notify_all()
+        return login_state
+
+    def __submit_login(self, pooled_session: PooledSession):
+        pooled_session.state = PoolSessionState.LOGGING_IN
+        if not self.__closed:
+            self.__loginExecutor.submit(self.__login, pooled_session)
+
+    # Session is checked out during probe, so expired session will be logged in again after probe
+    def __get_keep_alive_probe(self, pooled_session: PooledSession):
+        def keep_alive_probe():
+            with self.__condition:
+                if self.__closed or pooled_session.state != PoolSessionState.IDLE:
+                    return None
+                pooled_session.state = PoolSessionState.IN_USE
+            try:
+                return pooled_session.client.probe_login()
+            finally:
+                self.__release(pooled_session)
+
+        return keep_alive_probe
+
+    # Login failed sessions again in background
+    def retry_failed(self):
+        with self.__condition:
+            for pooled_session in self.__sessionList:
+                if pooled_session.state == PoolSessionState.FAILED:
+                    self.__reLoginCount += 1
+                    self.__submit_login(pooled_session)
+
+    def __find_idle_session(self, user_id: str):
+        if user_id is not None:
+            pooled_session = self.__sessionDict.get(user_id)
+            if pooled_session is None:
+                raise KeyError('Unknown account: ' + user_id)
+            if pooled_session.state == PoolSessionState.IDLE:
+                return pooled_session
+            return None
+        size = len(self.__sessionList)
+        for i in range(size):
+            pooled_session = self.__sessionList[(self.__nextIndex + i) % size]
+            if pooled_session.state == PoolSessionState.IDLE:
+                self.__nextIndex = (self.__nextIndex + i + 1) % size
+                return pooled_session
+        return None
+
+    def __has_available_session(self, user_id: str) -> bool:
+        if user_id is not None:
+            return self.__sessionDict[user_id].state != PoolSessionState.FAILED
+        for pooled_session in self.__sessionList:
+            if pooled_session.state != PoolSessionState.FAILED:
+                return True
+        return False
+
+    def __acquire(self, user_id: str, timeout: float) -> PooledSession:
+        start_time = time.monotonic()
+        with self.__condition:
+            while True:
+                if self.__closed:
+                    raise ConnectionError('Pool has been closed!')
+                pooled_session = self.__find_idle_session(user_id)
+                if pooled_session is not None:
+                    pooled_session.state = PoolSessionState.IN_USE
+                    pooled_session.checkoutCount += 1
+                    self.__checkoutCount += 1
+                    self.__checkoutWaitTime += time.monotonic() - start_time
+                    return pooled_session
+                if not self.__has_available_session(user_id):
+                    raise ConnectionError('No logged in session is available!')
+                if timeout is None:
+                    self.__condition.wait()
+                else:
+                    remain_time = timeout - (time.monotonic() - start_time)
+                    if remain_time <= 0 or not self.__condition.wait(remain_time):
+                        self.__checkoutTimeoutCount += 1
+                        raise TimeoutError('Checkout session timeout!')
+
+    def __release(self, pooled_session: PooledSession):
+        with self.__condition:
+            if pooled_session.expired:
+                self.__reLoginCount += 1
+                self.__submit_login(pooled_session)
+            else:
+                pooled_session.state = PoolSessionState.IDLE
+            self.__condition.notify_all()
+
+    # Usage: with pool.checkout() as client
+    # Session will be validated with every jwc response, and logged in again after check in if it is expired
+    @contextmanager
+    def checkout(self, user_id: str = None, timeout: float = None) -> JwcClient:
+        pooled_session = self.__acquire(user_id, timeout)
+        try:
+            yield pooled_session.client
+        finally:
+            self.__release(pooled_session)
+
+    # Mark session as expired, it will be logged in again after check in
+    def invalidate(self, client: JwcClient):
+        with self.__condition:
+            for pooled_session in self.__sessionList:
+                if pooled_session.client is client:
+                    pooled_session.expired = True
+                    if pooled_session.state == PoolSessionState.IDLE:
+                        self.__reLoginCount += 1
+                        self.__submit_login(pooled_session)
+                    return
+
+    def get_metrics(self) -> dict:
+        with self.__condition:
+            state_count = {state.name.lower(): 0 for state in PoolSessionState}
+            for pooled_session in self.__sessionList:
+                state_count[pooled_session.state.name.lower()] += 1
+            size = len(self.__sessionList)
+            return {
+                'size': size,
+                'idle': state_count['idle'],
+                'in_use': state_count['in_use'],
+                'logging_in': state_count['logging_in'],
+                'failed': state_count['failed'],
+                'utilization': state_count['in_use'] / size if size > 0 else 0,
+                'checkout_count': self.__checkoutCount,
+                'checkout_timeout_count': self.__checkoutTimeoutCount,
+                'checkout_wait_time_avg': self.__checkoutWaitTime / self.__checkoutCount
+                if self.__checkoutCount > 0 else 0,
+                're_login_count': self.__reLoginCount,
+                'keep_alive': self.__loginKeeper.get_metrics() if self.__loginKeeper is not None else None,
+                'transport': {pattern: policy.get_metrics() for pattern, policy in self.__transportPolicies.items()}
+            }
+
+    def get_session_states(self) -> dict:
+        with self.__condition:
+            return {pooled_session.userId: pooled_session.state for pooled_session in self.__sessionList}
+
+    def close(self):
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        if self.__loginKeeper is not None:
+            self.__loginKeeper.stop()
+        self.__loginExecutor.shutdown(wait=True)
+        for pooled_session in self.__sessionList:
+            pooled_session.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,130 @@
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Condition, Thread
+
+
+class _KeeperEntry:
+    def __init__(self, client, period: float, probe, on_expired):
+        self.client = client
+        self.period = period
+        self.probe = probe
+        self.onExpired = on_expired
+
+
+# Keep many logged in clients alive with one scheduler thread
+# Every client is probed once per period, on_expired(client) is called when probe returns False
+# Probe returns None or raises exception means skip this round, such as the client is being used
+class LoginKeeper:
+    __period: float
+    __running: bool = False
+    __probeCount: int = 0
+    __expiredCount: int = 0
+    __errorCount: int = 0
+
+    def __init__(self, period: float = 300, workers: int = 4):
+        self.__period = period
+        self.__workers = workers
+        self.__entries: dict = {}
+        self.__schedule: list = []
+        self.__sequence = count()
+        self.__condition = Condition()
+        self.__thread = None
+        self.__executor = None
+
+    def add(self, client, on_expired=None, period: float = None, probe=None):
+        if probe is None:
+            probe = client.probe_login
+        entry = _KeeperEntry(client, self.__period if period is None else period, probe, on_expired)
+        with self.__condition:
+            self.__entries[id(client)] = entry
+            self.__push(entry)
+            self.__condition.notify_all()
+
+    def remove(self, client):
+        with self.__condition:
+            self.__entries.pop(id(client), None)
+            self.__condition.notify_all()
+
+    def has_client(self, client) -> bool:
+        with self.__condition:
+            return id(client) in self.__entries.keys()
+
+    def __push(self, entry: _KeeperEntry):
+        heapq.heappush(self.__schedule, (time.monotonic() + entry.period, next(self.__sequence), entry))
+
+    def start(self):
+        with self.__condition:
+            if self.__running:
+                return
+            self.__running = True
+            self.__executor = ThreadPoolExecutor(max_workers=self.__workers)
+            self.__thread = Thread(target=self.__run, name='LoginKeeper', daemon=True)
+            self.__thread.start()
+
+    def stop(self, wait: bool = True):
+        with self.__condition:
+            if not self.__running:
+                return
+            self.__running = False
+            self.__condition.notify_all()
+        if wait:
+            self.__thread.join()
+        self.__executor.shutdown(wait=wait)
+
+    def is_running(self) -> bool:
+        return self.__running
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while self.__running:
+                    # Removed clients are dropped here
+                    while len(self.__schedule) > 0 and self.__schedule[0][2] is not \
+                            self.__entries.get(id(self.__schedule[0][2].client)):
+                        heapq.heappop(self.__schedule)
+                    if len(self.__schedule) == 0:
+                        self.__condition.wait()
+                    else:
+                        remain_time = self.__schedule[0][0] - time.monotonic()
+                        if remain_time <= 0:
+                            break
+                        self.__condition.wait(remain_time)
+                if not self.__running:
+                    return
+                entry = heapq.heappop(self.__schedule)[2]
+            try:
+                self.__executor.submit(self.__probe, entry)
+            except RuntimeError:
+                # Executor has been shutdown by stop(wait=False)
+                return
+
+    def __probe(self, entry: _KeeperEntry):
+        # noinspection PyBroadException
+        try:
+            result = entry.probe()
+        except:
+            # Network error does not mean login is expired, try again next round
+            result = None
+            with self.__condition:
+                self.__errorCount += 1
+        with self.__condition:
+            if result is not None:
+                self.__probeCount += 1
+            if result is False:
+                self.__expiredCount += 1
+            if self.__entries.get(id(entry.client)) is entry:
+                self.__push(entry)
+                self.__condition.notify_all()
+        if result is False and entry.onExpired is not None:
+            entry.onExpired(entry.client)
+
+    def get_metrics(self) -> dict:
+        with self.__condition:
+            return {
+                'size': len(self.__entries),
+                'probe_count': self.__probeCount,
+                'expired_count': self.__expiredCount,
+                'error_count': self.__errorCount
+            }
@@ -1,10 +1,20 @@
 import json as json_parse
 import os
+import time
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import count
 from threading import Lock
+from urllib import parse
 
 from requests import Response
 from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.cookies import create_cookie
+
+from NauNetTools.Clients.Deadline import Deadline
+from NauNetTools.Clients.EncodingResolver import CachedEncodingResolver, EncodingResolver
+from NauNetTools.Clients.TransportPolicy import TransportPolicy, _PolicyAdapter
 
 
 class RequestParam:
@@ -26,9 +36,58 @@ class PostRequestParam(RequestParam):
         self.json = json
 
 
+# State of one request from request_intercept to chain_finished, dropped with the request even if it fails
+# Interceptors save their own state with set_state instead of keeping a dict of request codes
+class RequestContext(object):
+    __slots__ = ('session', 'code', 'param', 'resent', 'deadline', '__states')
+
+    def __init__(self, session, code: int, param: RequestParam, deadline: Deadline = None):
+        self.session = session
+        self.code = code
+        self.param = param
+        # Set when an interceptor sends the request again, such as after vpn login again
+        self.resent = False
+        # Waiting inside interceptors should not be longer than the deadline
+        self.deadline = deadline
+        self.__states = None
+
+    def get_state(self, interceptor, default=None):
+        if self.__states is None:
+            return default
+        return self.__states.get(interceptor, default)
+
+    def set_state(self, interceptor, state):
+        if self.__states is None:
+            self.__states = {}
+        self.__states[interceptor] = state
+
+    def pop_state(self, interceptor, default=None):
+        if self.__states is None:
+            return default
+        return self.__states.pop(interceptor, default)
+
+
 class NetInterceptor(object):
     __metaclass__ = ABCMeta
+    # Set to True to be told the time cost of every other interceptor and the end of the whole chain
+    observeChain: bool = False
+
+    # Clients only call the context hooks, by default they call the old hooks below
+    # So old interceptors work without change, and new interceptors could override context hooks only
+    def context_request_intercept(self, context: RequestContext):
+        return self.request_intercept(context.session, context.code, context.param)
+
+    def context_response_intercept(self, context: RequestContext, response: Response) -> Response:
+        return self.response_intercept(context.session, context.code, context.param, response)
 
+    def context_interceptor_timing(self, context: RequestContext, interceptor, seconds: float):
+        self.interceptor_timing(context.session, context.code, interceptor, seconds)
+
+    def context_chain_finished(self, context: RequestContext, response: Response, exception: Exception):
+        self.chain_finished(context.session, context.code, context.param, response, exception)
+
+    # Return a Response to skip the real request, then only interceptors before this one
+    # and this one will get the response
     @abstractmethod
     def request_intercept(self, session, request_code: int, param: RequestParam):
         pass
@@ -37,17 +96,51 @@ class NetInterceptor(object):
     def response_intercept(self, session, request_code: int, param: RequestParam, response: Response) -> Response:
         pass
 
+    # Only called when observeChain is True
+    def interceptor_timing(self, session, request_code: int, interceptor, seconds: float):
+        pass
+
+    # Only called when observeChain is True, after all response_intercept or when any exception is raised
+    def chain_finished(self, session, request_code: int, param: RequestParam, response: Response,
+                       exception: Exception):
+        pass
+
     def close(self, session):
         pass
 
 
+class FetchResult:
+    index: int
+    url: str
+    response: Response = None
+    exception: Exception = None
+
+    def __init__(self, index: int, url: str, response: Response = None, exception: Exception = None):
+        self.index = index
+        self.url = url
+        self.response = response
+        self.exception = exception
+
+    def is_success(self) -> bool:
+        return self.exception is None and self.response is not None
+
+
 class NetworkClient(Session):
-    __requestCode = 0
+    snapshotVersion: int = 1
+    # Shared by all clients, so that the per host charset cache is shared too
+    defaultEncodingResolver: EncodingResolver = CachedEncodingResolver()
 
-    def __init__(self):
+    def __init__(self, encoding_resolver: EncodingResolver = None):
         super(NetworkClient, self).__init__()
         self.__interceptorList = []
-        self.__requestCodeLock = Lock()
+        # next() of count is atomic, so request codes do not need a lock
+        self.__requestCode = count(1)
+        self.__poolSizeLock = Lock()
+        self.__transportPolicies: dict = {}
+        if encoding_resolver is None:
+            self.__encodingResolver = self.defaultEncodingResolver
+        else:
+            self.__encodingResolver = encoding_resolver
 
     # Only Support GET and POST method
     def add_interceptor(self, new_interceptor: NetInterceptor):
@@ -66,15 +159,85 @@ class NetworkClient(Session):
                 return True
         return False
 
-    def __get_new_request_code(self) -> int:
-        with self.__requestCodeLock:
-            self.__requestCode += 1
-            return self.__requestCode
+    def get_interceptor(self, use_interceptor: classmethod):
+        for interceptor in self.__interceptorList:
+            if type(interceptor) == use_interceptor:
+                return interceptor
+        return None
+
+    def set_encoding_resolver(self, encoding_resolver: EncodingResolver):
+        if encoding_resolver is None:
+            self.__encodingResolver = self.defaultEncodingResolver
+        else:
+            self.__encodingResolver = encoding_resolver
+
+    def __resolve_encoding(self, response: Response, last_response: Response = None) -> Response:
+        # Only resolve the responses which have not been resolved yet
+        if response is not None and response is not last_response:
+            response.encoding = self.__encodingResolver.resolve(response)
+        return response
+
+    # Full cookie jar with domain, path and expires
+    def get_cookie_list(self) -> list:
+        cookie_list = []
+        for cookie in self.cookies:
+            cookie_list.append({
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path,
+                'expires': cookie.expires,
+                'secure': cookie.secure,
+                'port': cookie.port,
+                'version': cookie.version,
+                # noinspection PyProtectedMember,PyUnresolvedReferences
+                'rest': dict(cookie._rest)
+            })
+        return cookie_list
+
+    def set_cookie_list(self, cookie_list: list):
+        for cookie in cookie_list:
+            self.cookies.set_cookie(create_cookie(**cookie))
+
+    def snapshot(self) -> dict:
+        return {
+            'version': self.snapshotVersion,
+            'cookies': self.get_cookie_list()
+        }
+
+    def restore_snapshot(self, snapshot: dict) -> bool:
+        if snapshot is None or snapshot.get('version') != self.snapshotVersion:
+            return False
+        self.set_cookie_list(snapshot.get('cookies', []))
+        return True
+
+    def save_snapshot_to_file(self, file_path: str = 'snapshot.json') -> bool:
+        # noinspection PyBroadException
+        try:
+            data = json_parse.dumps(self.snapshot(), ensure_ascii=False)
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.write(data)
+                file.flush()
+            return True
+        except:
+            return False
+
+    # Kwargs will be sent to restore_snapshot
+    def load_snapshot_from_file(self, file_path: str = 'snapshot.json', **kwargs) -> bool:
+        if os.path.isfile(file_path):
+            # noinspection PyBroadException
+            try:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    data = file.read()
+                return self.restore_snapshot(json_parse.loads(data), **kwargs)
+            except:
+                return False
+        return False
 
     def save_cookies_to_file(self, file_path: str = 'cookies.json') -> bool:
         # noinspection PyBroadException
         try:
-            data = json_parse.dumps(self.cookies.get_dict())
+            data = json_parse.dumps(self.get_cookie_list())
             with open(file_path, 'w', encoding='utf-8') as file:
                 file.write(data)
                 file.flush()
@@ -82,48 +245,226 @@ class NetworkClient(Session):
         except:
             return False
 
+    # Both full cookie list and old name-value dict are supported
     def load_cookies_from_file(self, file_path: str = 'cookies.json') -> bool:
         if os.path.isfile(file_path):
             # noinspection PyBroadException
             try:
                 with open(file_path, 'r', encoding='utf-8') as file:
-                    data = file.read()
-                    self.cookies.update(json_parse.loads(data))
+                    data = json_parse.loads(file.read())
+                if isinstance(data, list):
+                    self.set_cookie_list(data)
+                else:
+                    self.cookies.update(data)
                 return True
             except:
                 return False
         return False
 
-    def get(self, url: str, with_interceptor: bool = True, **kwargs) -> Response:
-        code = self.__get_new_request_code()
+    @staticmethod
+    def __call_interceptor(observer_list: list, context: RequestContext, interceptor: NetInterceptor, intercept,
+                           *args):
+        if len(observer_list) == 0:
+            return intercept(context, *args)
+        start_time = time.perf_counter()
+        try:
+            return intercept(context, *args)
+        finally:
+            cost_time = time.perf_counter() - start_time
+            for observer in observer_list:
+                if observer is not interceptor:
+                    observer.context_interceptor_timing(context, interceptor, cost_time)
+
+    def __intercept(self, param: RequestParam, send_request) -> Response:
+        context = RequestContext(self, next(self.__requestCode), param, Deadline.current())
+        interceptor_list = list(self.__interceptorList)
+        observer_list = [interceptor for interceptor in interceptor_list if interceptor.observeChain]
+        response = None
+        try:
+            for i in range(len(interceptor_list)):
+                result = self.__call_interceptor(observer_list, context, interceptor_list[i],
+                                                 interceptor_list[i].context_request_intercept)
+                if isinstance(result, Response):
+                    response = result
+                    interceptor_list = interceptor_list[0:i + 1]
+                    break
+            if response is None:
+                response = send_request()
+            response = self.__resolve_encoding(response)
+            for interceptor in reversed(interceptor_list):
+                last_response = response
+                response = self.__call_interceptor(observer_list, context, interceptor,
+                                                   interceptor.context_response_intercept, response)
+                response = self.__resolve_encoding(response, last_response)
+        except Exception as e:
+            for observer in observer_list:
+                observer.context_chain_finished(context, None, e)
+            raise
+        for observer in observer_list:
+            observer.context_chain_finished(context, response, None)
+        return response
+
+    # All requests sent inside this request, including redirects and interceptors, are limited by deadline
+    def get(self, url: str, with_interceptor: bool = True, deadline: Deadline = None, **kwargs) -> Response:
+        if deadline is not None:
+            with Deadline.use(deadline):
+                return self.get(url, with_interceptor, **kwargs)
         if with_interceptor:
             param = RequestParam(url, **kwargs)
-            for interceptor in self.__interceptorList:
-                interceptor.request_intercept(self, code, param)
-            response = super(NetworkClient, self).get(param.url, **param.kwargs)
-            response.encoding = response.apparent_encoding
-            for interceptor in reversed(self.__interceptorList):
-                response = interceptor.response_intercept(self, code, param, response)
-                response.encoding = response.apparent_encoding
-            return response
+            return self.__intercept(param,
+                                    lambda: super(NetworkClient, self).get(param.url, **param.kwargs))
         else:
             return super(NetworkClient, self).get(url, **kwargs)
 
-    def post(self, url: str, data=None, json=None, with_interceptor: bool = True, **kwargs) -> Response:
-        code = self.__get_new_request_code()
+    def post(self, url: str, data=None, json=None, with_interceptor: bool = True, deadline: Deadline = None,
+             **kwargs) -> Response:
+        if deadline is not None:
+            with Deadline.use(deadline):
+                return self.post(url, data, json, with_interceptor, **kwargs)
         if with_interceptor:
             param = PostRequestParam(url, data, json, **kwargs)
-            for interceptor in self.__interceptorList:
-                interceptor.request_intercept(self, code, param)
-            response = super(NetworkClient, self).post(param.url, param.data, param.json, **param.kwargs)
-            response.encoding = response.apparent_encoding
-            for interceptor in reversed(self.__interceptorList):
-                interceptor.response_intercept(self, code, param, response)
-                response.encoding = response.apparent_encoding
-            return response
+            return self.__intercept(param,
+                                    lambda: super(NetworkClient, self).post(param.url, param.data, param.json,
+                                                                            **param.kwargs))
         else:
             return super(NetworkClient, self).post(url, data, json, **kwargs)
 
+    # Save response body to file with constant memory, body is written to file_path.part first
+    # Return saved size, HTTPError will be raised if response is not successful
+    def download_to(self, url: str, file_path: str, chunk_size: int = 64 * 1024, data=None, json=None,
+                    with_interceptor: bool = True, **kwargs) -> int:
+        kwargs['stream'] = True
+        if data is None and json is None:
+            response = self.get(url, with_interceptor, **kwargs)
+        else:
+            response = self.post(url, data, json, with_interceptor, **kwargs)
+        temp_file_path = file_path + '.part'
+        saved_size = 0
+        with response:
+            response.raise_for_status()
+            try:
+                with open(temp_file_path, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size):
+                        file.write(chunk)
+                        saved_size += len(chunk)
+                os.replace(temp_file_path, file_path)
+            except:
+                if os.path.exists(temp_file_path):
+                    os.remove(temp_file_path)
+                raise
+        return saved_size
+
+    # Pattern is a host such as jwc.nau.edu.cn, or *.nau.edu.cn for all sub domains
+    # Requests through vpn are limited by policy of vpn.nau.edu.cn, because they are sent to vpn host
+    def set_transport_policy(self, pattern: str, policy: TransportPolicy):
+        pattern = pattern.strip().lower()
+        transport_policies = dict(self.__transportPolicies)
+        transport_policies[pattern] = policy
+        self.__transportPolicies = transport_policies
+        if policy.get_pool_size() > 0:
+            self.ensure_pool_size(policy.get_pool_size())
+
+    def remove_transport_policy(self, pattern: str):
+        transport_policies = dict(self.__transportPolicies)
+        transport_policies.pop(pattern.strip().lower(), None)
+        self.__transportPolicies = transport_policies
+
+    # Exact host first, then the longest *.suffix
+    def get_transport_policy(self, netloc: str):
+        transport_policies = self.__transportPolicies
+        netloc = netloc.lower()
+        policy = transport_policies.get(netloc)
+        if policy is not None:
+            return policy
+        host = netloc.rsplit('@', 1)[-1]
+        if not host.endswith(']') and ':' in host:
+            host = host.rsplit(':', 1)[0]
+            policy = transport_policies.get(host)
+            if policy is not None:
+                return policy
+        index = host.find('.')
+        while index >= 0:
+            policy = transport_policies.get('*' + host[index:])
+            if policy is not None:
+                return policy
+            index = host.find('.', index + 1)
+        return None
+
+    # Return {pattern: {host: counters}}
+    def get_transport_metrics(self) -> dict:
+        return {pattern: policy.get_metrics() for pattern, policy in self.__transportPolicies.items()}
+
+    # Every redirect is sent here, so it only gets the remaining time of current deadline
+    def send(self, request, **kwargs) -> Response:
+        deadline = Deadline.current()
+        if deadline is not None:
+            kwargs['timeout'] = deadline.get_timeout(kwargs.get('timeout'))
+        return super(NetworkClient, self).send(request, **kwargs)
+
+    def get_adapter(self, url: str):
+        adapter = super(NetworkClient, self).get_adapter(url)
+        if len(self.__transportPolicies) == 0:
+            return adapter
+        host = parse.urlsplit(url).netloc.lower()
+        policy = self.get_transport_policy(host)
+        if policy is None:
+            return adapter
+        return _PolicyAdapter(adapter, policy, host)
+
+    # Connection pool should be large enough for concurrent requests, otherwise connections will be discarded
+    # Mounted HTTPAdapters of all prefixes are resized in place, so their retries and other options are kept
+    def ensure_pool_size(self, pool_max_size: int):
+        with self.__poolSizeLock:
+            for adapter in self.adapters.values():
+                # noinspection PyProtectedMember
+                if isinstance(adapter, HTTPAdapter) and adapter._pool_maxsize < pool_max_size:
+                    self.__resize_adapter(adapter, pool_max_size)
+
+    # Old pools are closed, connections still in use are closed when they are returned to old pools
+    @staticmethod
+    def __resize_adapter(adapter: HTTPAdapter, pool_max_size: int):
+        old_pool_manager = adapter.poolmanager
+        old_proxy_managers = adapter.proxy_manager
+        # noinspection PyProtectedMember
+        adapter.init_poolmanager(adapter._pool_connections, pool_max_size, block=adapter._pool_block)
+        # Proxy managers are created again with the new size when they are used
+        adapter.proxy_manager = {}
+        old_pool_manager.clear()
+        for proxy_manager in old_proxy_managers.values():
+            proxy_manager.clear()
+
+    def __fetch(self, index: int, url: str, with_interceptor: bool, kwargs: dict) -> FetchResult:
+        # noinspection PyBroadException
+        try:
+            return FetchResult(index, url, self.get(url, with_interceptor, **kwargs))
+        except Exception as e:
+            return FetchResult(index, url, exception=e)
+
+    # GET urls concurrently with the same session and interceptors, yield FetchResult
+    # Results are yielded as they complete, or in the same order of urls if ordered is True
+    # Failed requests are returned with exception instead of raising it
+    def fetch_many(self, urls, max_workers: int = 8, ordered: bool = False, with_interceptor: bool = True,
+                   **kwargs):
+        urls = list(urls)
+        if len(urls) == 0:
+            return
+        max_workers = max(1, min(max_workers, len(urls)))
+        self.ensure_pool_size(max_workers)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [executor.submit(self.__fetch, index, url, with_interceptor, kwargs)
+                   for index, url in enumerate(urls)]
+        try:
+            if ordered:
+                for future in futures:
+                    yield future.result()
+            else:
+                for future in as_completed(futures):
+                    yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
     def close(self):
         for interceptor in self.__interceptorList:
             interceptor.close(self)
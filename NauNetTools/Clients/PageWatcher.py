@@ -0,0 +1,441 @@
+import hashlib
+import heapq
+import re
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser as _TagParser
+from itertools import count
+from threading import Condition, Lock, Thread
+
+from NauNetTools.Clients.HtmlParser import HtmlParser
+from NauNetTools.Clients.JwcClient import JwcClient
+
+
+# Collect rows of region html, a row is cells of <tr> or text of <li>
+# Nested rows are collected separately, such as <li> of function tree
+class _RegionRowParser(_TagParser):
+    __rowTags = ('tr', 'li')
+    __cellTags = ('td', 'th')
+
+    def __init__(self):
+        super(_RegionRowParser, self).__init__(convert_charrefs=True)
+        self.rows = []
+        # [tag, cells, current cell texts]
+        self.__openRows = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.__rowTags:
+            self.__openRows.append([tag, [], None if tag == 'tr' else []])
+        elif tag in self.__cellTags and len(self.__openRows) > 0:
+            self.__close_cell()
+            self.__openRows[-1][2] = []
+
+    def handle_endtag(self, tag):
+        if tag in self.__cellTags:
+            self.__close_cell()
+        elif tag in self.__rowTags and any(row[0] == tag for row in self.__openRows):
+            while len(self.__openRows) > 0:
+                row_tag = self.__openRows[-1][0]
+                self.__close_row()
+                if row_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        if len(self.__openRows) > 0 and self.__openRows[-1][2] is not None:
+            self.__openRows[-1][2].append(data)
+
+    def __close_cell(self):
+        if len(self.__openRows) > 0 and self.__openRows[-1][2] is not None:
+            row = self.__openRows[-1]
+            row[1].append(' '.join(''.join(row[2]).split()))
+            row[2] = None if row[0] == 'tr' else []
+
+    def __close_row(self):
+        self.__close_cell()
+        row_tag, cells, _ = self.__openRows.pop()
+        if any(len(cell) > 0 for cell in cells):
+            self.rows.append(tuple(cells))
+
+    def close(self):
+        super(_RegionRowParser, self).close()
+        while len(self.__openRows) > 0:
+            self.__close_row()
+
+    def error(self, message):
+        pass
+
+
+# Page to watch, region is (tag, element_id) or function(html) -> region html, None means the whole page
+# Rows with the same key_column are reported as changed rows, otherwise rows are only added or removed
+class WatchTarget:
+    name: str
+    url: str
+    region = None
+    keyColumn: int = None
+    interval: float
+    minInterval: float
+    maxInterval: float
+    etag: str = None
+    lastModified: str = None
+    bodyHash: bytes = None
+    regionHash: bytes = None
+    regionHtml: str = None
+    regionRows: list = None
+    pollCount: int = 0
+    changeCount: int = 0
+    lastPollTime: float = None
+    lastChangeTime: float = None
+
+    def __init__(self, name: str, url: str, region=None, key_column: int = None, min_interval: float = 60,
+                 max_interval: float = 3600, interval: float = None):
+        self.name = name
+        self.url = url
+        self.region = region
+        self.keyColumn = key_column
+        self.minInterval = min_interval
+        self.maxInterval = max(min_interval, max_interval)
+        self.interval = min_interval if interval is None else min(self.maxInterval, max(min_interval, interval))
+        self.lock = Lock()
+
+    def get_change_rate(self) -> float:
+        return self.changeCount / self.pollCount if self.pollCount > 0 else 0
+
+
+class PageChange:
+    target: WatchTarget
+    url: str
+    # Rows only in the new page
+    added: list
+    # Rows only in the old page
+    removed: list
+    # [(old row, new row)] of the same key, only when key_column is set
+    changed: list
+    time: float
+
+    def __init__(self, target: WatchTarget, url: str, added: list, removed: list, changed: list):
+        self.target = target
+        self.url = url
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.time = time.time()
+
+    def is_empty(self) -> bool:
+        return len(self.added) == 0 and len(self.removed) == 0 and len(self.changed) == 0
+
+
+# Poll many jwc pages with one logged in client and report changed rows of every page
+# Unchanged pages are found without parsing: 304 of conditional request, same body hash or same region hash
+# Region html is only parsed into rows when its hash is changed, then diffed with the rows of last change
+# Interval of every page is multiplied by slow_down when page is unchanged, and by speed_up when it is changed,
+# so pages changed often are polled often, and pages never changed are polled once per max_interval
+# on_change(change) and on_expired(client) are called in worker threads
+# Usage:
+#   watcher = PageWatcher(client, on_change=print)
+#   watcher.watch_function(('成绩查询', '课程成绩'), region=('table', 'grade'), key_column=1)
+#   watcher.start()
+class PageWatcher:
+    # Hidden inputs such as __VIEWSTATE are changed on every request and do not show anything
+    __hiddenInputPattern = re.compile(r'<input\b[^>]*\btype\s*=\s*["\']?hidden\b[^>]*>', re.IGNORECASE)
+    __whitespacePattern = re.compile(r'\s+')
+    __running: bool = False
+    __pollCount: int = 0
+    __notModifiedCount: int = 0
+    __sameBodyCount: int = 0
+    __sameRegionCount: int = 0
+    __sameRowsCount: int = 0
+    __changeCount: int = 0
+    __parseCount: int = 0
+    __expiredCount: int = 0
+    __errorCount: int = 0
+    __byteCount: int = 0
+
+    def __init__(self, client: JwcClient, on_change=None, on_expired=None, workers: int = 4, time_out: int = 10,
+                 speed_up: float = 0.5, slow_down: float = 1.5):
+        self.__client = client
+        self.__onChange = on_change
+        self.__onExpired = on_expired
+        self.__workers = workers
+        self.__timeOut = time_out
+        self.speedUp = speed_up
+        self.slowDown = slow_down
+        self.__targets: OrderedDict = OrderedDict()
+        self.__schedule: list = []
+        self.__sequence = count()
+        self.__condition = Condition()
+        self.__thread = None
+        self.__executor = None
+
+    def watch(self, url: str, region=None, key_column: int = None, min_interval: float = 60,
+              max_interval: float = 3600, name: str = None) -> WatchTarget:
+        target = WatchTarget(url if name is None else name, url, region, key_column, min_interval, max_interval)
+        with self.__condition:
+            self.__targets.pop(target.name, None)
+            self.__targets[target.name] = target
+            # First poll is scheduled now, so later changes could be diffed with it
+            heapq.heappush(self.__schedule, (time.monotonic(), next(self.__sequence), target))
+            self.__condition.notify_all()
+        return target
+
+    # Path is the names from the top of jwc function dict to the page, such as ('成绩查询', '课程成绩')
+    def watch_function(self, path: tuple, region=None, key_column: int = None, min_interval: float = 60,
+                       max_interval: float = 3600) -> WatchTarget:
+        node = self.__client.get_function_dict()
+        for name in path:
+            if not isinstance(node, dict) or name not in node.keys():
+                raise KeyError('Function not found! Path: ' + '/'.join(path))
+            node = node[name]
+        if not isinstance(node, str):
+            raise KeyError('Function is not a page! Path: ' + '/'.join(path))
+        return self.watch(node, region, key_column, min_interval, max_interval, '/'.join(path))
+
+    def unwatch(self, name: str) -> bool:
+        with self.__condition:
+            target = self.__targets.pop(name, None)
+            self.__condition.notify_all()
+        return target is not None
+
+    def get_targets(self) -> list:
+        with self.__condition:
+            return list(self.__targets.values())
+
+    def __region_html(self, target: WatchTarget, html: str) -> str:
+        if target.region is None:
+            region_html = html
+        elif callable(target.region):
+            region_html = target.region(html)
+        else:
+            region_html = HtmlParser.extract_element_html(html, target.region[0], target.region[1])
+        if region_html is None:
+            return None
+        region_html = self.__hiddenInputPattern.sub('', region_html)
+        return self.__whitespacePattern.sub(' ', region_html).strip()
+
+    @staticmethod
+    def parse_rows(region_html: str) -> list:
+        parser = _RegionRowParser()
+        parser.feed(region_html)
+        parser.close()
+        return parser.rows
+
+    # Return (added, removed, changed) rows, order of rows in page is kept
+    @staticmethod
+    def diff_rows(old_rows: list, new_rows: list, key_column: int = None) -> tuple:
+        changed = []
+        if key_column is not None:
+            old_keyed = OrderedDict((row[key_column], row) for row in old_rows if len(row) > key_column)
+            new_keyed = OrderedDict((row[key_column], row) for row in new_rows if len(row) > key_column)
+            for key, new_row in new_keyed.items():
+                old_row = old_keyed.get(key)
+                if old_row is not None and old_row != new_row:
+                    changed.append((old_row, new_row))
+            changed_keys = set(new_row[key_column] for _, new_row in changed)
+            old_rows = [row for row in old_rows if len(row) <= key_column or row[key_column] not in changed_keys]
+            new_rows = [row for row in new_rows if len(row) <= key_column or row[key_column] not in changed_keys]
+        old_counter = Counter(old_rows)
+        new_counter = Counter(new_rows)
+        added = []
+        for row in new_rows:
+            if old_counter[row] > 0:
+                old_counter[row] -= 1
+            else:
+                added.append(row)
+        removed = []
+        for row in old_rows:
+            if new_counter[row] > 0:
+                new_counter[row] -= 1
+            else:
+                removed.append(row)
+        return added, removed, changed
+
+    # Poll one target now, return PageChange if rows are changed, otherwise return None
+    def poll(self, target: WatchTarget):
+        with target.lock:
+            change = self.__poll(target)
+        if change is not None and self.__onChange is not None:
+            self.__onChange(change)
+        return change
+
+    def __poll(self, target: WatchTarget):
+        headers = {}
+        if target.etag is not None:
+            headers['If-None-Match'] = target.etag
+        if target.lastModified is not None:
+            headers['If-Modified-Since'] = target.lastModified
+        with self.__condition:
+            self.__pollCount += 1
+        target.pollCount += 1
+        target.lastPollTime = time.time()
+        with self.__client.get(target.url, timeout=self.__timeOut, headers=headers) as response:
+            if response.status_code == 304:
+                with self.__condition:
+                    self.__notModifiedCount += 1
+                return self.__update_interval(target, False)
+            if not JwcClient._has_jwc_login(response):
+                with self.__condition:
+                    self.__expiredCount += 1
+                if self.__onExpired is not None:
+                    self.__onExpired(self.__client)
+                return None
+            if response.status_code != 200:
+                # Error pages are not the watched page, try again after the same interval
+                with self.__condition:
+                    self.__errorCount += 1
+                return None
+            content = response.content
+            encoding = response.encoding
+            url = response.url
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        with self.__condition:
+            self.__byteCount += len(content)
+        body_hash = hashlib.blake2b(content, digest_size=16).digest()
+        if body_hash == target.bodyHash:
+            with self.__condition:
+                self.__sameBodyCount += 1
+            return self.__update_interval(target, False)
+        region_html = self.__region_html(target, content.decode(encoding or 'utf-8', 'replace'))
+        if region_html is None:
+            # Region is not found, such as an error page with status 200, rows should not be diffed with nothing
+            with self.__condition:
+                self.__errorCount += 1
+            return None
+        target.etag, target.lastModified, target.bodyHash = etag, last_modified, body_hash
+        region_hash = hashlib.blake2b(region_html.encode('utf-8'), digest_size=16).digest()
+        if region_hash == target.regionHash:
+            with self.__condition:
+                self.__sameRegionCount += 1
+            return self.__update_interval(target, False)
+        old_hash, old_html = target.regionHash, target.regionHtml
+        target.regionHash, target.regionHtml = region_hash, region_html
+        if old_hash is None:
+            # First poll is the baseline, rows are parsed when it is changed
+            return self.__update_interval(target, False)
+        old_rows = target.regionRows
+        if old_rows is None:
+            old_rows = self.__parse(old_html)
+        new_rows = self.__parse(region_html)
+        target.regionRows = new_rows
+        added, removed, changed = self.diff_rows(old_rows, new_rows, target.keyColumn)
+        change = PageChange(target, url, added, removed, changed)
+        if change.is_empty():
+            # Only attributes or layout are changed
+            with self.__condition:
+                self.__sameRowsCount += 1
+            return self.__update_interval(target, False)
+        with self.__condition:
+            self.__changeCount += 1
+        target.changeCount += 1
+        target.lastChangeTime = target.lastPollTime
+        self.__update_interval(target, True)
+        return change
+
+    def __parse(self, region_html: str) -> list:
+        with self.__condition:
+            self.__parseCount += 1
+        return self.parse_rows(region_html)
+
+    def __update_interval(self, target: WatchTarget, changed: bool):
+        interval = target.interval * (self.speedUp if changed else self.slowDown)
+        target.interval = min(target.maxInterval, max(target.minInterval, interval))
+        return None
+
+    # Poll all targets whose time is up in the calling thread, used without start()
+    def poll_due(self) -> list:
+        changes = []
+        now = time.monotonic()
+        while True:
+            with self.__condition:
+                target = self.__pop_due(now)
+            if target is None:
+                return changes
+            try:
+                change = self.poll(target)
+                if change is not None:
+                    changes.append(change)
+            finally:
+                self.__reschedule(target)
+
+    def __pop_due(self, now: float):
+        # Removed and watched again targets are dropped here
+        while len(self.__schedule) > 0 and self.__schedule[0][2] is not self.__targets.get(self.__schedule[0][2].name):
+            heapq.heappop(self.__schedule)
+        if len(self.__schedule) == 0 or self.__schedule[0][0] > now:
+            return None
+        return heapq.heappop(self.__schedule)[2]
+
+    def __reschedule(self, target: WatchTarget):
+        with self.__condition:
+            if self.__targets.get(target.name) is target:
+                heapq.heappush(self.__schedule, (time.monotonic() + target.interval, next(self.__sequence), target))
+                self.__condition.notify_all()
+
+    def start(self):
+        with self.__condition:
+            if self.__running:
+                return
+            self.__running = True
+            self.__executor = ThreadPoolExecutor(max_workers=self.__workers)
+            self.__thread = Thread(target=self.__run, name='PageWatcher', daemon=True)
+            self.__thread.start()
+
+    def stop(self, wait: bool = True):
+        with self.__condition:
+            if not self.__running:
+                return
+            self.__running = False
+            self.__condition.notify_all()
+        if wait:
+            self.__thread.join()
+        self.__executor.shutdown(wait=wait)
+
+    def is_running(self) -> bool:
+        return self.__running
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                target = None
+                while self.__running:
+                    target = self.__pop_due(time.monotonic())
+                    if target is not None:
+                        break
+                    if len(self.__schedule) == 0:
+                        self.__condition.wait()
+                    else:
+                        self.__condition.wait(self.__schedule[0][0] - time.monotonic())
+                if not self.__running:
+                    return
+            try:
+                self.__executor.submit(self.__poll_scheduled, target)
+            except RuntimeError:
+                # Executor has been shutdown by stop(wait=False)
+                return
+
+    def __poll_scheduled(self, target: WatchTarget):
+        # noinspection PyBroadException
+        try:
+            self.poll(target)
+        except:
+            # Network error does not mean page is changed, try again after the same interval
+            with self.__condition:
+                self.__errorCount += 1
+        finally:
+            self.__reschedule(target)
+
+    def get_metrics(self) -> dict:
+        with self.__condition:
+            return {
+                'targets': len(self.__targets),
+                'polls': self.__pollCount,
+                'not_modified': self.__notModifiedCount,
+                'same_body': self.__sameBodyCount,
+                'same_region': self.__sameRegionCount,
+                'same_rows': self.__sameRowsCount,
+                'changes': self.__changeCount,
+                'parses': self.__parseCount,
+                'expired': self.__expiredCount,
+                'errors': self.__errorCount,
+                'bytes': self.__byteCount
+            }
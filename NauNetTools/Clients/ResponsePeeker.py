@@ -0,0 +1,84 @@
+from requests import Response
+
+
+# Give back the peeked prefix first, then read the rest from the real raw response
+class _PeekedRaw(object):
+    def __init__(self, raw, prefix: bytes):
+        self.__raw = raw
+        self.__prefix = prefix
+
+    def __take_prefix(self, amt: int = None) -> bytes:
+        if amt is None or amt < 0 or amt >= len(self.__prefix):
+            data, self.__prefix = self.__prefix, b''
+        else:
+            data, self.__prefix = self.__prefix[:amt], self.__prefix[amt:]
+        return data
+
+    def __read_raw(self, amt: int) -> bytes:
+        try:
+            return self.__raw.read(amt, decode_content=True)
+        except TypeError:
+            return self.__raw.read(amt)
+
+    def peek(self, size: int) -> bytes:
+        while len(self.__prefix) < size:
+            chunk = self.__read_raw(size - len(self.__prefix))
+            if not chunk:
+                break
+            self.__prefix += chunk
+        return self.__prefix[:size]
+
+    def stream(self, amt: int = 2 ** 16, decode_content: bool = None):
+        while len(self.__prefix) > 0:
+            yield self.__take_prefix(amt)
+        if hasattr(self.__raw, 'stream'):
+            for chunk in self.__raw.stream(amt, decode_content=True):
+                yield chunk
+        else:
+            while True:
+                chunk = self.__read_raw(amt)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read(self, amt: int = None, *args, **kwargs) -> bytes:
+        data = self.__take_prefix(amt)
+        if amt is None or amt < 0:
+            return data + self.__raw.read(None, *args, **kwargs)
+        if len(data) < amt:
+            data += self.__raw.read(amt - len(data), *args, **kwargs)
+        return data
+
+    def __getattr__(self, item):
+        return getattr(self.__raw, item)
+
+
+# Look at the beginning of a stream=True response without reading the whole body
+class ResponsePeeker:
+    # Body has not been read yet, usually because of stream=True
+    @staticmethod
+    def is_streaming(response: Response) -> bool:
+        # noinspection PyProtectedMember
+        return response is not None and response._content is False and not response._content_consumed
+
+    # Return at most size bytes of decoded content, the response could still be read from beginning
+    @staticmethod
+    def peek_content(response: Response, size: int) -> bytes:
+        if not ResponsePeeker.is_streaming(response):
+            content = response.content
+            return content[:size] if content is not None else b''
+        if response.raw is None:
+            return b''
+        if not isinstance(response.raw, _PeekedRaw):
+            response.raw = _PeekedRaw(response.raw, b'')
+        return response.raw.peek(size)
+
+    @staticmethod
+    def peek_text(response: Response, size: int) -> str:
+        if not ResponsePeeker.is_streaming(response):
+            return response.text[:size]
+        encoding = response.encoding if response.encoding is not None else 'utf-8'
+        try:
+            return ResponsePeeker.peek_content(response, size).decode(encoding, 'ignore')
+        except LookupError:
+            return ResponsePeeker.peek_content(response, size).decode('utf-8', 'ignore')
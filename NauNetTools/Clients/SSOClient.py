@@ -1,8 +1,9 @@
 from urllib import parse
 
-from bs4 import BeautifulSoup
 from requests import Response
 
+from NauNetTools.Clients.Deadline import Deadline
+from NauNetTools.Clients.HtmlParser import HtmlParser
 from NauNetTools.Clients.NetworkClient import NetworkClient
 from NauNetTools.Clients._UAPool import _UAPool
 
@@ -59,17 +60,28 @@ class SSOClient(NetworkClient):
         else:
             self.__requestLoginClient = request_login_client
 
-    def __get_login_post_form(self, sso_html_content: str, user_id: str, user_pw: str) -> dict:
+    @classmethod
+    def _get_login_post_form(cls, sso_html_content: str, user_id: str, user_pw: str) -> dict:
         form = {'username': user_id, 'password': user_pw}
-
-        soup = BeautifulSoup(sso_html_content, "html.parser")
-        for node in soup.find_all('input'):
-            name = node.get('name')
-            if name in self.__loginParam:
-                form[name] = node.get('value')
+        form.update(HtmlParser.find_input_values(sso_html_content, cls.__loginParam))
         return form
 
-    def login(self, user_id: str, user_pw: str, sso_response: Response = None) -> ClientServiceResponse:
+    # Service ticket is granted by TGT cookie and service page is returned, so no form is needed
+    @staticmethod
+    def _is_service_jumped(url: str, is_service_login: bool) -> bool:
+        return is_service_login and url is not None and not parse.urlparse(url).path.lower().endswith('/sso/login')
+
+    @staticmethod
+    def _is_login_success_text(text: str) -> bool:
+        return '登录成功' in text and '密码错误' not in text and '请勿输入非法字符' not in text
+
+    # All requests of login share the deadline, each request gets the remaining time if it is less than time_out
+    def login(self, user_id: str, user_pw: str, sso_response: Response = None,
+              deadline: Deadline = None) -> ClientServiceResponse:
+        with Deadline.use(deadline):
+            return self.__sso_login(user_id, user_pw, sso_response)
+
+    def __sso_login(self, user_id: str, user_pw: str, sso_response: Response = None) -> ClientServiceResponse:
         try:
             if sso_response is None:
                 sso_response = self.__requestLoginClient.get(self.__ssoLoginUrl, with_interceptor=self.__useInterceptor,
@@ -77,15 +89,13 @@ class SSOClient(NetworkClient):
                                                              timeout=self.__netTimeOut, headers=self._ssoPublicHeader)
             response = ClientServiceResponse()
             response.is_service_login = len(self.__ssoLoginUrlParam) > 0
-            if self.__useInterceptor or not self.__ssoHostCheck \
-                    or self._has_same_host(sso_response.url, self.__ssoLoginUrl):
-                if '登录成功' in sso_response.text and \
-                        '密码错误' not in sso_response.text and \
-                        '请勿输入非法字符' not in sso_response.text and \
-                        not response.is_service_login:
+            if (self.__useInterceptor or not self.__ssoHostCheck
+                or self._has_same_host(sso_response.url, self.__ssoLoginUrl)) \
+                    and not self._is_service_jumped(sso_response.url, response.is_service_login):
+                if self._is_login_success_text(sso_response.text) and not response.is_service_login:
                     response.is_success = True
                 else:
-                    post_form = self.__get_login_post_form(sso_response.text, user_id, user_pw)
+                    post_form = self._get_login_post_form(sso_response.text, user_id, user_pw)
                     with self.__requestLoginClient.post(sso_response.url, post_form,
                                                         with_interceptor=self.__useInterceptor,
                                                         timeout=self.__netTimeOut,
@@ -94,9 +104,7 @@ class SSOClient(NetworkClient):
                         if (self.__useInterceptor or not self.__ssoHostCheck
                             or self._has_same_host(login_result_response.url, self.__ssoLoginUrl)) \
                                 and not response.is_service_login:
-                            response.is_success = '登录成功' in login_result_response.text and \
-                                                  '密码错误' not in login_result_response.text and \
-                                                  '请勿输入非法字符' not in login_result_response.text
+                            response.is_success = self._is_login_success_text(login_result_response.text)
                         elif self.__useInterceptor or not self.__ssoJumpHostCheck \
                                 or self._has_same_host(login_result_response.url, self.__ssoLoginUrlParam['service']):
                             response.status_code = login_result_response.status_code
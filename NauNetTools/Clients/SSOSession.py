@@ -0,0 +1,89 @@
+from threading import Lock
+
+from NauNetTools.Clients.NetworkClient import NetworkClient
+from NauNetTools.Clients.SSOClient import SSOClient
+
+
+# Login sso once and share the TGT cookie with other clients
+# Attached client gets its service ticket with one GET, sso login form is not parsed and password is not posted
+# Usage:
+#   sso_session = SSOSession(user_id, user_pw)
+#   sso_session.login()
+#   sso_session.login_client(JwcClient())
+class SSOSession:
+    ssoHost: str = SSOClient.ssoHost
+    __userId: str
+    __userPw: str
+    __loginCount: int = 0
+    __attachCount: int = 0
+
+    def __init__(self, user_id: str, user_pw: str, time_out: int = 10):
+        self.__userId = user_id
+        self.__userPw = user_pw
+        self.__ssoClient = SSOClient(time_out=time_out, with_interceptor=False)
+        self.__loginLock = Lock()
+
+    def get_user_id(self) -> str:
+        return self.__userId
+
+    def get_sso_client(self) -> SSOClient:
+        return self.__ssoClient
+
+    def is_login(self) -> bool:
+        return len(self.get_tgt_cookies()) > 0
+
+    # Login only when there is no TGT cookie, unless force is True
+    def login(self, force: bool = False) -> bool:
+        with self.__loginLock:
+            if not force and self.is_login():
+                return True
+            self.__loginCount += 1
+            # noinspection PyBroadException
+            try:
+                return self.__ssoClient.login(self.__userId, self.__userPw).is_success and self.is_login()
+            except:
+                return False
+
+    # All cookies of sso host, including CASTGC
+    def get_tgt_cookies(self) -> list:
+        return [cookie for cookie in self.__ssoClient.get_cookie_list()
+                if cookie['domain'].lstrip('.').lower() == self.ssoHost]
+
+    # Copy TGT cookies to client, so sso login page will jump to service with ticket directly
+    # Not work for clients whose sso requests are sent through vpn, they will login with password as usual
+    def attach(self, client: NetworkClient) -> bool:
+        if not self.login():
+            return False
+        client.set_cookie_list(self.get_tgt_cookies())
+        with self.__loginLock:
+            self.__attachCount += 1
+        return True
+
+    # Attach TGT and login client, client will still login with password if TGT has expired
+    def login_client(self, client: SSOClient):
+        self.attach(client)
+        return client.login(self.__userId, self.__userPw)
+
+    def get_metrics(self) -> dict:
+        with self.__loginLock:
+            return {
+                'login_count': self.__loginCount,
+                'attach_count': self.__attachCount
+            }
+
+    def logout(self) -> bool:
+        # noinspection PyBroadException
+        try:
+            return self.__ssoClient.logout()
+        except:
+            return False
+
+    def close(self):
+        self.__ssoClient.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.logout()
+        self.close()
@@ -0,0 +1,269 @@
+import json as json_parse
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from threading import Lock
+
+from NauNetTools.Clients.Deadline import Deadline
+from NauNetTools.Clients.JwcClient import JwcNetState
+from NauNetTools.Clients.NetworkClient import NetworkClient
+
+
+class StoredSession:
+    service: str
+    userId: str
+    snapshot: dict
+    version: int
+    updatedAt: float
+    expiresAt: float
+
+    def __init__(self, service: str, user_id: str, snapshot: dict, version: int, updated_at: float,
+                 expires_at: float):
+        self.service = service
+        self.userId = user_id
+        self.snapshot = snapshot
+        self.version = version
+        self.updatedAt = updated_at
+        self.expiresAt = expires_at
+
+    def is_expired(self) -> bool:
+        return time.time() >= self.expiresAt
+
+
+# Connection which is closed after with block, BEGIN IMMEDIATE locks the database file until commit
+class _Transaction(object):
+    def __init__(self, connection: sqlite3.Connection):
+        self.__connection = connection
+        self.__inTransaction = False
+
+    def begin(self):
+        self.__connection.execute('BEGIN IMMEDIATE')
+        self.__inTransaction = True
+
+    def execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        return self.__connection.execute(sql, parameters)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self.__inTransaction:
+                self.__connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        finally:
+            self.__connection.close()
+
+
+# Share logged in sessions of JwcClient and AlstuClient between processes with one SQLite file
+# Only one process logs in an account at a time with a login lease, others wait and restore the saved snapshot
+# Saved session expires after session_ttl seconds unless it is renewed, passwords are never saved
+# Usage:
+#   store = SessionStore('sessions.db')
+#   client = JwcClient()
+#   success, version = store.borrow_client(client, user_id, user_pw)
+#   if success:
+#       client.get(...)
+#       store.renew_client(client, user_id, version)
+class SessionStore:
+    __createTableSql = '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            service TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            snapshot TEXT,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL DEFAULT 0,
+            expires_at REAL NOT NULL DEFAULT 0,
+            lease_token TEXT,
+            lease_owner TEXT,
+            lease_expires_at REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (service, user_id)
+        )
+    '''
+    __dbPath: str
+    __borrowCount: int = 0
+    __loginCount: int = 0
+    __borrowWaitTime: float = 0
+    __invalidateCount: int = 0
+
+    def __init__(self, db_path: str = 'sessions.db', session_ttl: float = 1200, login_lease_time: float = 60,
+                 poll_interval: float = 0.2, busy_timeout: float = 30):
+        self.__dbPath = db_path
+        self.sessionTtl = session_ttl
+        self.loginLeaseTime = login_lease_time
+        self.pollInterval = poll_interval
+        self.__busyTimeout = busy_timeout
+        self.__owner = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.__metricsLock = Lock()
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self.__connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(self.__createTableSql)
+
+    # One connection for each operation, so store could be used by many threads and processes
+    def __connect(self) -> _Transaction:
+        connection = sqlite3.connect(self.__dbPath, timeout=self.__busyTimeout, isolation_level=None)
+        return _Transaction(connection)
+
+    @staticmethod
+    def get_service_name(client: NetworkClient) -> str:
+        return type(client).__name__
+
+    def get_session(self, service: str, user_id: str):
+        with self.__connect() as connection:
+            row = connection.execute('SELECT snapshot, version, updated_at, expires_at FROM sessions '
+                                     'WHERE service = ? AND user_id = ?', (service, user_id)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return StoredSession(service, user_id, json_parse.loads(row[0]), row[1], row[2], row[3])
+
+    # Return new version of session
+    def save_session(self, service: str, user_id: str, snapshot: dict) -> int:
+        now = time.time()
+        with self.__connect() as connection:
+            connection.begin()
+            connection.execute('INSERT OR IGNORE INTO sessions (service, user_id) VALUES (?, ?)', (service, user_id))
+            connection.execute('UPDATE sessions SET snapshot = ?, version = version + 1, updated_at = ?, '
+                               'expires_at = ? WHERE service = ? AND user_id = ?',
+                               (json_parse.dumps(snapshot, ensure_ascii=False), now, now + self.sessionTtl,
+                                service, user_id))
+            return connection.execute('SELECT version FROM sessions WHERE service = ? AND user_id = ?',
+                                      (service, user_id)).fetchone()[0]
+
+    # Keep session alive for another session_ttl, cookies are updated if snapshot is provided
+    # Return False if session has been replaced or invalidated
+    def renew_session(self, service: str, user_id: str, version: int, snapshot: dict = None) -> bool:
+        now = time.time()
+        with self.__connect() as connection:
+            if snapshot is None:
+                cursor = connection.execute('UPDATE sessions SET expires_at = ? WHERE service = ? AND user_id = ? '
+                                            'AND version = ? AND snapshot IS NOT NULL',
+                                            (now + self.sessionTtl, service, user_id, version))
+            else:
+                cursor = connection.execute('UPDATE sessions SET snapshot = ?, updated_at = ?, expires_at = ? '
+                                            'WHERE service = ? AND user_id = ? AND version = ? '
+                                            'AND snapshot IS NOT NULL',
+                                            (json_parse.dumps(snapshot, ensure_ascii=False), now,
+                                             now + self.sessionTtl, service, user_id, version))
+            return cursor.rowcount > 0
+
+    # Only the same version is removed, so a late report will not remove the session logged in again
+    def invalidate_session(self, service: str, user_id: str, version: int = None) -> bool:
+        with self.__connect() as connection:
+            if version is None:
+                cursor = connection.execute('UPDATE sessions SET snapshot = NULL WHERE service = ? AND user_id = ?',
+                                            (service, user_id))
+            else:
+                cursor = connection.execute('UPDATE sessions SET snapshot = NULL WHERE service = ? AND user_id = ? '
+                                            'AND version = ?', (service, user_id, version))
+            changed = cursor.rowcount > 0
+        if changed:
+            with self.__metricsLock:
+                self.__invalidateCount += 1
+        return changed
+
+    # Return lease token if no other process is logging in this account and there is no live session,
+    # otherwise return None, so a session saved just before this call will not be logged in again
+    def acquire_login_lease(self, service: str, user_id: str):
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self.__connect() as connection:
+            connection.begin()
+            connection.execute('INSERT OR IGNORE INTO sessions (service, user_id) VALUES (?, ?)', (service, user_id))
+            cursor = connection.execute('UPDATE sessions SET lease_token = ?, lease_owner = ?, lease_expires_at = ? '
+                                        'WHERE service = ? AND user_id = ? '
+                                        'AND (lease_token IS NULL OR lease_expires_at <= ?) '
+                                        'AND (snapshot IS NULL OR expires_at <= ?)',
+                                        (token, self.__owner, now + self.loginLeaseTime, service, user_id, now, now))
+            return token if cursor.rowcount > 0 else None
+
+    def renew_login_lease(self, service: str, user_id: str, token: str) -> bool:
+        with self.__connect() as connection:
+            cursor = connection.execute('UPDATE sessions SET lease_expires_at = ? '
+                                        'WHERE service = ? AND user_id = ? AND lease_token = ?',
+                                        (time.time() + self.loginLeaseTime, service, user_id, token))
+            return cursor.rowcount > 0
+
+    def release_login_lease(self, service: str, user_id: str, token: str) -> bool:
+        with self.__connect() as connection:
+            cursor = connection.execute('UPDATE sessions SET lease_token = NULL, lease_owner = NULL, '
+                                        'lease_expires_at = 0 WHERE service = ? AND user_id = ? AND lease_token = ?',
+                                        (service, user_id, token))
+            return cursor.rowcount > 0
+
+    def remove_session(self, service: str, user_id: str):
+        with self.__connect() as connection:
+            connection.execute('DELETE FROM sessions WHERE service = ? AND user_id = ?', (service, user_id))
+
+    @staticmethod
+    def __is_login_success(result) -> bool:
+        if isinstance(result, JwcNetState):
+            return result == JwcNetState.SUCCESS
+        return result is True
+
+    # Restore saved session to client, or login and save it if this process gets the login lease
+    # Client should be new and support snapshot() and restore_snapshot(snapshot, vpn_user_pw, validate)
+    # Return (success, version), version could be used to renew or invalidate the session later
+    def borrow_client(self, client: NetworkClient, user_id: str, user_pw: str, vpn_user_pw: str = None,
+                      timeout: float = 60, validate: bool = False, service: str = None) -> tuple:
+        if service is None:
+            service = self.get_service_name(client)
+        if vpn_user_pw is None:
+            vpn_user_pw = user_pw
+        start_time = time.monotonic()
+        while True:
+            stored_session = self.get_session(service, user_id)
+            if stored_session is not None and not stored_session.is_expired():
+                if client.restore_snapshot(stored_session.snapshot, vpn_user_pw=vpn_user_pw, validate=validate):
+                    with self.__metricsLock:
+                        self.__borrowCount += 1
+                        self.__borrowWaitTime += time.monotonic() - start_time
+                    return True, stored_session.version
+                self.invalidate_session(service, user_id, stored_session.version)
+            token = self.acquire_login_lease(service, user_id)
+            if token is not None:
+                try:
+                    return self.__login_client(client, service, user_id, user_pw)
+                finally:
+                    self.release_login_lease(service, user_id, token)
+            if time.monotonic() - start_time >= timeout:
+                return False, None
+            stored_session = self.get_session(service, user_id)
+            if stored_session is not None and not stored_session.is_expired():
+                # Session is saved by another process after the check above, restore it now
+                continue
+            time.sleep(self.pollInterval)
+
+    def __login_client(self, client: NetworkClient, service: str, user_id: str, user_pw: str) -> tuple:
+        with self.__metricsLock:
+            self.__loginCount += 1
+        # Login should finish before lease is expired, otherwise another process may login too
+        if not self.__is_login_success(client.login(user_id, user_pw, deadline=Deadline(self.loginLeaseTime))):
+            return False, None
+        return True, self.save_session(service, user_id, client.snapshot())
+
+    # Save cookies of borrowed client and keep the session alive
+    def renew_client(self, client: NetworkClient, user_id: str, version: int, service: str = None) -> bool:
+        if service is None:
+            service = self.get_service_name(client)
+        return self.renew_session(service, user_id, version, client.snapshot())
+
+    def get_metrics(self) -> dict:
+        now = time.time()
+        with self.__connect() as connection:
+            size, alive, leased = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(snapshot IS NOT NULL AND expires_at > ?), 0), '
+                'COALESCE(SUM(lease_token IS NOT NULL AND lease_expires_at > ?), 0) FROM sessions',
+                (now, now)).fetchone()
+        with self.__metricsLock:
+            return {
+                'size': size,
+                'alive': alive,
+                'logging_in': leased,
+                'borrow_count': self.__borrowCount,
+                'login_count': self.__loginCount,
+                'invalidate_count': self.__invalidateCount,
+                'borrow_wait_time_avg': self.__borrowWaitTime / self.__borrowCount if self.__borrowCount > 0 else 0
+            }
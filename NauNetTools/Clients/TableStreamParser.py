@@ -0,0 +1,243 @@
+import re
+from collections import OrderedDict
+from html.parser import HTMLParser as _TagParser
+from threading import Lock
+
+
+# Compiled column mapping of one table layout, rows are converted to {name: typed value}
+# Columns is a list of header names to keep, or {header name: output name}, None means all columns
+# Types is {header name: function(text) -> value}, other columns are converted by convert_cell
+class TableLayout:
+    __intPattern = re.compile(r'-?(0|[1-9]\d*)')
+    __floatPattern = re.compile(r'-?\d+\.\d+')
+    # Layouts shared by all tables in process, key is header and column options
+    __layoutCache: OrderedDict = OrderedDict()
+    __layoutCacheLock: Lock = Lock()
+    layoutCacheSize: int = 256
+    header: tuple
+    # ((cell index, output name, converter), ...)
+    columns: tuple
+
+    def __init__(self, header: tuple, columns=None, types: dict = None):
+        self.header = header
+        if types is None:
+            types = {}
+        if columns is None:
+            columns = OrderedDict((name, name) for name in header)
+        elif not isinstance(columns, dict):
+            columns = OrderedDict((name, name) for name in columns)
+        indexes = {}
+        for index, name in enumerate(header):
+            indexes.setdefault(name, index)
+        mapping = []
+        for name, output_name in columns.items():
+            index = indexes.get(name)
+            if index is None:
+                raise KeyError('Column not found! Column: ' + str(name))
+            mapping.append((index, output_name, types.get(name, self.convert_cell)))
+        self.columns = tuple(mapping)
+
+    # Integers and decimals become int and float, numbers with leading zeros such as course codes are kept
+    @classmethod
+    def convert_cell(cls, text: str):
+        if len(text) == 0:
+            return None
+        if cls.__intPattern.fullmatch(text) is not None:
+            return int(text)
+        if cls.__floatPattern.fullmatch(text) is not None:
+            return float(text)
+        return text
+
+    def convert(self, cells: list) -> dict:
+        row = {}
+        for index, name, converter in self.columns:
+            row[name] = converter(cells[index]) if index < len(cells) else None
+        return row
+
+    # Same header and options always get the same compiled layout
+    @classmethod
+    def get_layout(cls, header: tuple, columns=None, types: dict = None):
+        key = (header, tuple(columns.items()) if isinstance(columns, dict) else
+               (tuple(columns) if columns is not None else None),
+               tuple(types.items()) if types is not None else None)
+        with cls.__layoutCacheLock:
+            layout = cls.__layoutCache.get(key)
+            if layout is not None:
+                cls.__layoutCache.move_to_end(key)
+                return layout
+        layout = cls(header, columns, types)
+        with cls.__layoutCacheLock:
+            cls.__layoutCache[key] = layout
+            while len(cls.__layoutCache) > cls.layoutCacheSize:
+                cls.__layoutCache.popitem(last=False)
+        return layout
+
+    @classmethod
+    def clear_layout_cache(cls):
+        with cls.__layoutCacheLock:
+            cls.__layoutCache.clear()
+
+
+# Incremental parser of one <table>, html is fed in chunks and rows are taken out as soon as they end
+# Table is chosen by id, or by its index among all tables of page, nested tables are kept as text of cells
+# Header_rows rows are joined as column names with '/', names are column indexes if header_rows is 0
+# Colspan and rowspan cells are copied to every column and row they cover
+class TableStreamParser(_TagParser):
+    __cellTags = ('td', 'th')
+    # Texts of these tags inside a cell are separated by a space, such as cells of a nested table
+    __separatorTags = ('table', 'tr', 'td', 'th', 'br', 'p', 'div', 'li')
+
+    def __init__(self, table_id: str = None, table_index: int = 0, columns=None, types: dict = None,
+                 header_rows: int = 1):
+        super(TableStreamParser, self).__init__(convert_charrefs=True)
+        self.__tableId = table_id
+        self.__tableIndex = table_index
+        self.__columns = columns
+        self.__types = types
+        self.__headerRows = header_rows
+        self.__tableCount = 0
+        # Depth of tables inside the target table, None before the target table
+        self.__depth = None
+        self.__cells = None
+        self.__cellTexts = None
+        self.__cellSpan = (1, 1)
+        # {column index: [remaining rows, text]} of rowspan cells
+        self.__rowSpans = {}
+        self.__header = []
+        self.__readyRows = []
+        self.layout = None
+        self.found = False
+        self.finished = False
+
+    def __is_target(self, attrs: list) -> bool:
+        index = self.__tableCount
+        self.__tableCount += 1
+        if self.__tableId is not None:
+            return any(key == 'id' and value == self.__tableId for key, value in attrs)
+        return index == self.__tableIndex
+
+    @staticmethod
+    def __get_span(attrs: list, name: str) -> int:
+        for key, value in attrs:
+            if key == name and value is not None and value.strip().isdigit():
+                return max(1, int(value))
+        return 1
+
+    def handle_starttag(self, tag, attrs):
+        if self.finished:
+            return
+        if self.__depth is None:
+            if tag == 'table' and self.__is_target(attrs):
+                self.__depth = 0
+                self.found = True
+            return
+        self.__separate(tag)
+        if tag == 'table':
+            self.__depth += 1
+        elif self.__depth > 0:
+            return
+        elif tag == 'tr':
+            self.__close_row()
+            self.__cells = []
+        elif tag in self.__cellTags:
+            self.__close_cell()
+            if self.__cells is None:
+                self.__cells = []
+            self.__cellTexts = []
+            self.__cellSpan = (self.__get_span(attrs, 'colspan'), self.__get_span(attrs, 'rowspan'))
+
+    def handle_endtag(self, tag):
+        if self.finished or self.__depth is None:
+            return
+        self.__separate(tag)
+        if tag == 'table':
+            if self.__depth > 0:
+                self.__depth -= 1
+            else:
+                self.__close_row()
+                self.finished = True
+        elif self.__depth > 0:
+            return
+        elif tag in self.__cellTags:
+            self.__close_cell()
+        elif tag == 'tr':
+            self.__close_row()
+
+    # Rows and cells of the target table are not inside a cell, so only nested tags are separated
+    def __separate(self, tag: str):
+        if self.__cellTexts is not None and tag in self.__separatorTags \
+                and (self.__depth > 0 or tag not in ('tr', 'td', 'th')):
+            self.__cellTexts.append(' ')
+
+    def handle_data(self, data):
+        if self.__cellTexts is not None and not self.finished:
+            self.__cellTexts.append(data)
+
+    # Rowspan cells of former rows are inserted before the cell at their column
+    def __fill_row_spans(self):
+        while True:
+            span = self.__rowSpans.get(len(self.__cells))
+            if span is None:
+                return
+            self.__cells.append(span[1])
+            span[0] -= 1
+            if span[0] <= 0:
+                self.__rowSpans.pop(len(self.__cells) - 1)
+
+    def __close_cell(self):
+        if self.__cellTexts is None:
+            return
+        text = ' '.join(''.join(self.__cellTexts).split())
+        self.__cellTexts = None
+        col_span, row_span = self.__cellSpan
+        for _ in range(col_span):
+            self.__fill_row_spans()
+            if row_span > 1:
+                self.__rowSpans[len(self.__cells)] = [row_span - 1, text]
+            self.__cells.append(text)
+
+    def __close_row(self):
+        self.__close_cell()
+        if self.__cells is None:
+            return
+        self.__fill_row_spans()
+        cells, self.__cells = self.__cells, None
+        if len(cells) == 0:
+            return
+        if self.layout is None:
+            if len(self.__header) < self.__headerRows:
+                self.__header.append(cells)
+                if len(self.__header) < self.__headerRows:
+                    return
+                cells = None
+            self.layout = TableLayout.get_layout(self.__get_header_names(len(cells or [])), self.__columns,
+                                                 self.__types)
+            if cells is None:
+                return
+        self.__readyRows.append(self.layout.convert(cells))
+
+    def __get_header_names(self, width: int) -> tuple:
+        if len(self.__header) == 0:
+            return tuple(range(width))
+        names = []
+        for index in range(max(len(cells) for cells in self.__header)):
+            parts = []
+            for cells in self.__header:
+                if index < len(cells) and len(cells[index]) > 0 and (len(parts) == 0 or parts[-1] != cells[index]):
+                    parts.append(cells[index])
+            names.append('/'.join(parts))
+        return tuple(names)
+
+    # Return rows finished since last call
+    def pop_rows(self) -> list:
+        rows, self.__readyRows = self.__readyRows, []
+        return rows
+
+    def close(self):
+        super(TableStreamParser, self).close()
+        if not self.finished and self.__depth is not None:
+            self.__close_row()
+            self.finished = True
+
+    def error(self, message):
+        pass
@@ -0,0 +1,196 @@
+import random
+import time
+from threading import BoundedSemaphore, Lock
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError as RequestConnectionError
+from requests.exceptions import Timeout
+
+from NauNetTools.Clients.Deadline import Deadline, DeadlineExceeded
+
+
+# Token bucket of one host, waiting time is reserved under lock and slept outside
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.lastTime = time.monotonic()
+        self.lock = Lock()
+
+    # Return seconds to wait before sending
+    def take(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.lastTime) * self.rate)
+            self.lastTime = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+# Limits and counters of one host under a policy
+class _HostTransport:
+    def __init__(self, policy):
+        self.bucket = _TokenBucket(policy.rate, policy.burst) if policy.rate > 0 else None
+        self.semaphore = BoundedSemaphore(policy.maxInFlight) if policy.maxInFlight > 0 else None
+        self.lock = Lock()
+        self.requestCount = 0
+        self.retryCount = 0
+        self.errorCount = 0
+        self.rateLimitedCount = 0
+        self.rateWaitTime = 0.0
+        self.inFlightWaitTime = 0.0
+        self.inFlight = 0
+        self.peakInFlight = 0
+
+    def acquire(self):
+        rate_wait_time = self.bucket.take() if self.bucket is not None else 0.0
+        if rate_wait_time > 0:
+            time.sleep(rate_wait_time)
+        in_flight_wait_time = 0.0
+        if self.semaphore is not None and not self.semaphore.acquire(blocking=False):
+            start_time = time.monotonic()
+            self.semaphore.acquire()
+            in_flight_wait_time = time.monotonic() - start_time
+        with self.lock:
+            self.requestCount += 1
+            if rate_wait_time > 0:
+                self.rateLimitedCount += 1
+                self.rateWaitTime += rate_wait_time
+            self.inFlightWaitTime += in_flight_wait_time
+            self.inFlight += 1
+            self.peakInFlight = max(self.peakInFlight, self.inFlight)
+
+    def release(self):
+        with self.lock:
+            self.inFlight -= 1
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.requestCount,
+                'retries': self.retryCount,
+                'errors': self.errorCount,
+                'rate_limited': self.rateLimitedCount,
+                'rate_wait_time': self.rateWaitTime,
+                'in_flight_wait_time': self.inFlightWaitTime,
+                'in_flight': self.inFlight,
+                'peak_in_flight': self.peakInFlight
+            }
+
+
+# Rate limit, concurrency cap and retry of requests to one host
+# Every host has its own token bucket and in flight limit, even if the policy is set for *.suffix
+# Set the same policy to many clients to share the limits, such as all sessions of JwcClientPool
+# Rate <= 0 or max_in_flight <= 0 means no limit, max_retries = 0 means no retry
+# Only idempotent methods are sent again, after connection errors, timeouts or retry statuses
+# Retry-After header of retry statuses is followed if it is not longer than backoff_max
+class TransportPolicy:
+    defaultRetryStatuses: tuple = (429, 500, 502, 503, 504)
+    defaultRetryMethods: tuple = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, rate: float = 0, burst: int = 1, max_in_flight: int = 0, max_retries: int = 0,
+                 backoff_factor: float = 0.5, backoff_max: float = 30.0, jitter: float = 0.5,
+                 retry_statuses: tuple = None, retry_methods: tuple = None, pool_size: int = 0):
+        self.rate = rate
+        self.burst = burst
+        self.maxInFlight = max_in_flight
+        self.maxRetries = max_retries
+        self.backoffFactor = backoff_factor
+        self.backoffMax = backoff_max
+        self.jitter = min(1.0, max(0.0, jitter))
+        self.retryStatuses = frozenset(self.defaultRetryStatuses if retry_statuses is None else retry_statuses)
+        self.retryMethods = frozenset(method.upper() for method in
+                                      (self.defaultRetryMethods if retry_methods is None else retry_methods))
+        self.poolSize = pool_size
+        self.__hostTransports: dict = {}
+        self.__hostLock = Lock()
+
+    # Connection pool should not be smaller than max in flight, otherwise connections will be discarded
+    def get_pool_size(self) -> int:
+        return max(self.poolSize, self.maxInFlight)
+
+    def _get_host_transport(self, host: str) -> _HostTransport:
+        host_transport = self.__hostTransports.get(host)
+        if host_transport is None:
+            with self.__hostLock:
+                host_transport = self.__hostTransports.get(host)
+                if host_transport is None:
+                    host_transport = _HostTransport(self)
+                    self.__hostTransports[host] = host_transport
+        return host_transport
+
+    # Exponential backoff with jitter, attempt starts from 0
+    def get_backoff_time(self, attempt: int, response: Response = None) -> float:
+        backoff_time = min(self.backoffMax, self.backoffFactor * (2 ** attempt))
+        backoff_time *= 1 - self.jitter * random.random()
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None and retry_after.strip().isdigit():
+                retry_after = float(retry_after)
+                if retry_after <= self.backoffMax:
+                    backoff_time = max(backoff_time, retry_after)
+        return backoff_time
+
+    def is_retry_method(self, method: str) -> bool:
+        return method is not None and method.upper() in self.retryMethods
+
+    def get_metrics(self) -> dict:
+        with self.__hostLock:
+            host_transports = dict(self.__hostTransports)
+        return {host: host_transport.get_metrics() for host, host_transport in host_transports.items()}
+
+
+# Wrap the mounted adapter of NetworkClient, so every redirect is limited too
+class _PolicyAdapter(BaseAdapter):
+    def __init__(self, adapter: BaseAdapter, policy: TransportPolicy, host: str):
+        super(_PolicyAdapter, self).__init__()
+        self.__adapter = adapter
+        self.__policy = policy
+        self.__hostTransport = policy._get_host_transport(host)
+
+    def send(self, request, **kwargs) -> Response:
+        policy = self.__policy
+        host_transport = self.__hostTransport
+        can_retry = policy.maxRetries > 0 and policy.is_retry_method(request.method)
+        deadline = Deadline.current()
+        attempt = 0
+        while True:
+            if deadline is not None and attempt > 0:
+                kwargs['timeout'] = deadline.get_timeout(kwargs.get('timeout'))
+            host_transport.acquire()
+            try:
+                response = self.__adapter.send(request, **kwargs)
+            except (RequestConnectionError, Timeout):
+                if not can_retry or attempt >= policy.maxRetries:
+                    with host_transport.lock:
+                        host_transport.errorCount += 1
+                    raise
+                response = None
+            finally:
+                host_transport.release()
+            if response is not None and (not can_retry or attempt >= policy.maxRetries
+                                         or response.status_code not in policy.retryStatuses):
+                return response
+            backoff_time = policy.get_backoff_time(attempt, response)
+            if deadline is not None and backoff_time >= deadline.remaining():
+                # No time to send again, return the last failed response
+                if response is not None:
+                    return response
+                with host_transport.lock:
+                    host_transport.errorCount += 1
+                raise DeadlineExceeded('Deadline exceeded before retry!')
+            if response is not None:
+                response.close()
+            with host_transport.lock:
+                host_transport.retryCount += 1
+            time.sleep(backoff_time)
+            attempt += 1
+
+    def close(self):
+        self.__adapter.close()
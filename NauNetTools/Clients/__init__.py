@@ -1 +1,3 @@
-__all__ = ["JwcClient", "NetworkClient", "SSOClient"]
+__all__ = ["CrawlEngine", "Deadline", "EncodingResolver", "HtmlParser", "JwcClient", "JwcClientPool", "LoginKeeper",
+           "NetworkClient", "PageWatcher", "ResponsePeeker", "SessionStore", "SSOClient", "SSOSession",
+           "TableStreamParser", "TransportPolicy"]
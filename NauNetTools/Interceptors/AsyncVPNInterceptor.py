@@ -0,0 +1,74 @@
+import asyncio
+
+from requests import Response
+
+from NauNetTools.AsyncClients.AsyncNetworkClient import AsyncNetworkClient
+from NauNetTools.AsyncClients.AsyncSSOClient import AsyncSSOClient
+from NauNetTools.Clients.Deadline import DeadlineExceeded
+from NauNetTools.Clients.NetworkClient import RequestContext
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor, VPNRouteTable, VPNUtils
+
+
+# Asyncio version of VPNInterceptor, only could be used with AsyncNetworkClient
+# Request rewriting is the same, vpn login again is awaited and shared by concurrent tasks of one session
+class AsyncVPNInterceptor(VPNInterceptor):
+    __vpnLogoutUrl = VPNInterceptor.vpnServer + '/logout'
+
+    async def context_response_intercept(self, context: RequestContext, response: Response) -> Response:
+        session, param = context.session, context.param
+        login_method = self._get_vpn_login_method(context, response)
+        if login_method is not None:
+            last_request_method, generation, need_login = login_method
+            context.resent = True
+            if need_login:
+                flight, is_leader = self._join_login_flight(session, generation, asyncio.Event)
+            else:
+                flight, is_leader = None, False
+            if flight is None:
+                success = True
+            elif is_leader:
+                success = False
+                try:
+                    success = await self.__vpn_login(session, response)
+                finally:
+                    self._finish_login_flight(session, flight, success)
+            else:
+                if context.deadline is None:
+                    await flight.event.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(flight.event.wait(), max(0.0, context.deadline.remaining()))
+                    except asyncio.TimeoutError:
+                        raise DeadlineExceeded('Deadline exceeded when waiting for vpn login!')
+                success = flight.success
+            if success:
+                response = await session.request(last_request_method, param.url, **self._get_replay_kwargs(param))
+        return response
+
+    async def __vpn_login(self, session: AsyncNetworkClient, response: Response) -> bool:
+        sso_client = AsyncSSOClient(service_url=self._get_vpn_sso_login_service(), sso_host_check=False,
+                                    sso_jump_host_check=False, request_login_client=session,
+                                    with_interceptor=False)
+        user_id, user_pw = self._get_vpn_account()
+        return (await sso_client.login(user_id, user_pw, response)).is_success
+
+    async def close(self, session: AsyncNetworkClient):
+        await session.get(self.__vpnLogoutUrl, with_interceptor=False)
+
+
+class AsyncVPNUtils:
+    @staticmethod
+    def is_use_school_vpn(client: AsyncNetworkClient) -> bool:
+        return client.has_interceptor_type(AsyncVPNInterceptor)
+
+    # Should be used before add other interceptors
+    @staticmethod
+    def use_school_vpn(client: AsyncNetworkClient, user_id: str, user_pw: str, use_none_vpn_list: bool = True,
+                       route_table: VPNRouteTable = None):
+        if not AsyncVPNUtils.is_use_school_vpn(client):
+            interceptor = AsyncVPNInterceptor(user_id, user_pw, route_table=route_table)
+            if use_none_vpn_list:
+                interceptor.set_none_vpn_host(VPNUtils.noneVPNHost)
+            client.add_interceptor(interceptor)
+            return interceptor
+        return None
@@ -0,0 +1,261 @@
+import base64
+import hashlib
+import json as json_parse
+import os
+import re
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from threading import Lock
+
+from requests import PreparedRequest, Response
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, RequestContext, RequestParam
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+
+class CacheRule:
+    pattern: str
+    ttl: float
+    shared: bool
+    revalidate: bool
+
+    # Url which matches pattern will be cached for ttl seconds
+    # Shared cache will be used by all sessions and saved on disk, so only use it for public pages
+    # Stale response will be revalidated with ETag or Last-Modified if revalidate is True
+    def __init__(self, pattern: str, ttl: float, shared: bool = False, revalidate: bool = True):
+        self.pattern = pattern
+        self.ttl = ttl
+        self.shared = shared
+        self.revalidate = revalidate
+        self.__compiledPattern = re.compile(pattern, re.IGNORECASE)
+
+    def match(self, url: str) -> bool:
+        return self.__compiledPattern.search(url) is not None
+
+
+class CacheEntry:
+    url: str
+    statusCode: int
+    reason: str
+    headers: dict
+    content: bytes
+    encoding: str
+    expiresAt: float
+    etag: str = None
+    lastModified: str = None
+
+    def __init__(self, response: Response, ttl: float):
+        self.url = response.url
+        self.statusCode = response.status_code
+        self.reason = response.reason
+        self.headers = dict(response.headers)
+        self.content = response.content
+        self.encoding = response.encoding
+        self.expiresAt = time.time() + ttl
+        self.etag = response.headers.get('ETag')
+        self.lastModified = response.headers.get('Last-Modified')
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expiresAt
+
+    def has_validator(self) -> bool:
+        return self.etag is not None or self.lastModified is not None
+
+    def to_response(self) -> Response:
+        response = Response()
+        response.url = self.url
+        response.status_code = self.statusCode
+        response.reason = self.reason
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        # noinspection PyProtectedMember
+        response._content = self.content
+        # noinspection PyProtectedMember
+        response._content_consumed = True
+        return response
+
+    def to_dict(self) -> dict:
+        return {
+            'url': self.url,
+            'status_code': self.statusCode,
+            'reason': self.reason,
+            'headers': self.headers,
+            'content': base64.b64encode(self.content).decode('ascii'),
+            'encoding': self.encoding,
+            'expires_at': self.expiresAt,
+            'etag': self.etag,
+            'last_modified': self.lastModified
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        entry = cls.__new__(cls)
+        entry.url = data['url']
+        entry.statusCode = data['status_code']
+        entry.reason = data['reason']
+        entry.headers = data['headers']
+        entry.content = base64.b64decode(data['content'])
+        entry.encoding = data['encoding']
+        entry.expiresAt = data['expires_at']
+        entry.etag = data['etag']
+        entry.lastModified = data['last_modified']
+        return entry
+
+
+# Cache GET responses in memory, and shared responses also on disk
+# Should be added after VPNInterceptor, cache key always uses the real url
+# Pages are private for each session unless the matched rule is shared
+class CacheInterceptor(NetInterceptor):
+    __maxEntries: int
+    __diskDir: str
+    # Counters are changed under cache lock
+    hitCount: int = 0
+    missCount: int = 0
+    revalidateCount: int = 0
+    diskHitCount: int = 0
+
+    def __init__(self, rules: list, max_entries: int = 512, disk_dir: str = None):
+        self.__rules = list(rules)
+        self.__maxEntries = max_entries
+        self.__diskDir = disk_dir
+        self.__memoryCache: OrderedDict = OrderedDict()
+        self.__cacheLock = Lock()
+        self.__sessionScope = weakref.WeakKeyDictionary()
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def add_rule(self, rule: CacheRule):
+        self.__rules.append(rule)
+
+    def __match_rule(self, url: str):
+        for rule in self.__rules:
+            if rule.match(url):
+                return rule
+        return None
+
+    def __get_session_scope(self, session: NetworkClient) -> str:
+        with self.__cacheLock:
+            scope = self.__sessionScope.get(session)
+            if scope is None:
+                scope = uuid.uuid4().hex
+                self.__sessionScope[session] = scope
+            return scope
+
+    @staticmethod
+    def get_cache_url(url: str, params=None) -> str:
+        url = VPNInterceptor.get_vpn_url_builder().canonicalize_url(url)
+        if params:
+            request = PreparedRequest()
+            request.prepare_url(url, params)
+            url = request.url
+        return url
+
+    def __get_disk_path(self, key: str) -> str:
+        return os.path.join(self.__diskDir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def __load(self, key: str, shared: bool):
+        with self.__cacheLock:
+            entry = self.__memoryCache.get(key)
+            if entry is not None:
+                self.__memoryCache.move_to_end(key)
+                return entry
+        if shared and self.__diskDir is not None:
+            # noinspection PyBroadException
+            try:
+                with open(self.__get_disk_path(key), 'r', encoding='utf-8') as file:
+                    entry = CacheEntry.from_dict(json_parse.loads(file.read()))
+                with self.__cacheLock:
+                    self.diskHitCount += 1
+                self.__save(key, entry, False)
+                return entry
+            except:
+                return None
+        return None
+
+    def __save(self, key: str, entry: CacheEntry, shared: bool):
+        with self.__cacheLock:
+            self.__memoryCache[key] = entry
+            self.__memoryCache.move_to_end(key)
+            while len(self.__memoryCache) > self.__maxEntries:
+                self.__memoryCache.popitem(last=False)
+        if shared and self.__diskDir is not None:
+            # noinspection PyBroadException
+            try:
+                path = self.__get_disk_path(key)
+                with open(path + '.tmp', 'w', encoding='utf-8') as file:
+                    file.write(json_parse.dumps(entry.to_dict()))
+                os.replace(path + '.tmp', path)
+            except:
+                pass
+
+    def context_request_intercept(self, context: RequestContext):
+        session, param = context.session, context.param
+        if type(param) != RequestParam or param.kwargs.get('stream'):
+            return None
+        url = self.get_cache_url(param.url, param.kwargs.get('params'))
+        rule = self.__match_rule(url)
+        if rule is None or rule.ttl <= 0:
+            return None
+        if rule.shared:
+            key = 'shared:' + url
+        else:
+            key = self.__get_session_scope(session) + ':' + url
+        entry = self.__load(key, rule.shared)
+        if entry is not None and entry.is_fresh():
+            with self.__cacheLock:
+                self.hitCount += 1
+            return entry.to_response()
+        if entry is not None and rule.revalidate and entry.has_validator():
+            headers = dict(param.kwargs.get('headers') or {})
+            if entry.etag is not None:
+                headers['If-None-Match'] = entry.etag
+            if entry.lastModified is not None:
+                headers['If-Modified-Since'] = entry.lastModified
+            param.kwargs['headers'] = headers
+        else:
+            entry = None
+        with self.__cacheLock:
+            self.missCount += 1
+        context.set_state(self, (key, url, rule, entry))
+        return None
+
+    def context_response_intercept(self, context: RequestContext, response: Response) -> Response:
+        state = context.pop_state(self)
+        if state is None or response is None:
+            return response
+        key, url, rule, entry = state
+        if entry is not None and response.status_code == 304:
+            with self.__cacheLock:
+                self.revalidateCount += 1
+            entry.expiresAt = time.time() + rule.ttl
+            self.__save(key, entry, rule.shared)
+            response.close()
+            return entry.to_response()
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        # Redirected responses may be login pages, so they will not be cached
+        if response.status_code == 200 and 'no-store' not in cache_control \
+                and self.get_cache_url(response.url) == url:
+            self.__save(key, CacheEntry(response, rule.ttl), rule.shared)
+        return response
+
+    def get_cache_info(self) -> dict:
+        with self.__cacheLock:
+            return {
+                'hits': self.hitCount,
+                'misses': self.missCount,
+                'revalidated': self.revalidateCount,
+                'disk_hits': self.diskHitCount,
+                'size': len(self.__memoryCache),
+                'max_size': self.__maxEntries
+            }
+
+    def clear(self, with_disk: bool = False):
+        with self.__cacheLock:
+            self.__memoryCache.clear()
+        if with_disk and self.__diskDir is not None:
+            for name in os.listdir(self.__diskDir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.__diskDir, name))
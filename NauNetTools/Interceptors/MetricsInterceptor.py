@@ -0,0 +1,334 @@
+import re
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from urllib import parse
+
+from requests import Response
+
+from NauNetTools.Clients.NetworkClient import NetInterceptor, PostRequestParam, RequestContext, RequestParam
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+
+class Histogram:
+    # Seconds, from interceptor cost to slow page
+    defaultBuckets: tuple = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                             1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets: tuple = None):
+        self.buckets = tuple(sorted(self.defaultBuckets if buckets is None else buckets))
+        # Last one is +Inf
+        self.bucketCounts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i in range(len(self.buckets)):
+            if value <= self.buckets[i]:
+                index = i
+                break
+        self.bucketCounts[index] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.buckets != self.buckets:
+            raise ValueError('Histograms with different buckets could not be merged!')
+        for i in range(len(self.bucketCounts)):
+            self.bucketCounts[i] += other.bucketCounts[i]
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    # Estimated by linear interpolation inside the bucket, percentile is between 0 and 100
+    def percentile(self, percentile: float):
+        if self.count == 0:
+            return None
+        rank = self.count * min(max(percentile, 0.0), 100.0) / 100
+        cumulative = 0
+        for i in range(len(self.bucketCounts)):
+            bucket_count = self.bucketCounts[i]
+            if bucket_count > 0 and cumulative + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                value = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(max(value, self.min), self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def mean(self):
+        return self.sum / self.count if self.count > 0 else None
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean(),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99)
+        }
+
+
+class _MetricSeries:
+    def __init__(self, buckets: tuple):
+        self.latency = Histogram(buckets)
+        self.interceptorTime: dict = {}
+        self.errorCount = 0
+        self.requestBytes = 0
+        self.responseBytes = 0
+        self.redirectCount = 0
+        self.vpnReLoginCount = 0
+        self.statusCodes: dict = {}
+
+
+# Record latency, interceptor cost, bytes, redirects and vpn login again of every request
+# Results are grouped by real host (vpn url is decoded) and logical operation
+# Operation is decided by MetricsInterceptor.operation() first, then by operation rules, otherwise it is page_fetch
+class MetricsInterceptor(NetInterceptor):
+    observeChain: bool = True
+    defaultOperation: str = 'page_fetch'
+    # (url regex, operation), url is the real url without vpn
+    defaultOperationRules: list = [
+        (r'^https?://sso\.nau\.edu\.cn/sso/login', 'sso_login'),
+        (r'^https?://sso\.nau\.edu\.cn/sso/logout', 'sso_logout'),
+        (r'^https?://jwc\.nau\.edu\.cn/Login_Single\.aspx', 'jwc_login'),
+        (r'^https?://jwc\.nau\.edu\.cn/Students/StudentIndex\.aspx', 'jwc_check_login'),
+        (r'^https?://jwc\.nau\.edu\.cn/LoginOut\.aspx', 'jwc_logout'),
+        (r'^https?://vpn\.nau\.edu\.cn/login', 'vpn_login'),
+        (r'^https?://vpn\.nau\.edu\.cn/logout', 'vpn_logout')
+    ]
+    __currentOperation: ContextVar = ContextVar('nau_net_operation', default=None)
+
+    def __init__(self, buckets: tuple = None, use_default_rules: bool = True):
+        self.__buckets = tuple(sorted(Histogram.defaultBuckets if buckets is None else buckets))
+        self.__operationRules = []
+        if use_default_rules:
+            for pattern, operation in self.defaultOperationRules:
+                self.add_operation_rule(pattern, operation)
+        self.__series: OrderedDict = OrderedDict()
+        self.__metricsLock = Lock()
+
+    def add_operation_rule(self, pattern: str, operation: str):
+        self.__operationRules.append((re.compile(pattern, re.IGNORECASE), operation))
+
+    # All requests sent inside this block will use this operation name, works with threads and asyncio tasks
+    @classmethod
+    @contextmanager
+    def operation(cls, name: str):
+        token = cls.__currentOperation.set(name)
+        try:
+            yield
+        finally:
+            cls.__currentOperation.reset(token)
+
+    def __get_operation(self, url: str) -> str:
+        operation = self.__currentOperation.get()
+        if operation is not None:
+            return operation
+        for pattern, operation in self.__operationRules:
+            if pattern.search(url) is not None:
+                return operation
+        return self.defaultOperation
+
+    # State is only used by the thread or task of this request, so it is not locked
+    def context_request_intercept(self, context: RequestContext):
+        url = VPNInterceptor.get_vpn_url_builder().canonicalize_url(context.param.url)
+        host = parse.urlparse(url).netloc.lower()
+        context.set_state(self, {'start_time': time.perf_counter(), 'host': host,
+                                 'operation': self.__get_operation(url), 'interceptor_time': {}})
+        return None
+
+    def context_response_intercept(self, context: RequestContext, response: Response) -> Response:
+        return response
+
+    def context_interceptor_timing(self, context: RequestContext, interceptor, seconds: float):
+        state = context.get_state(self)
+        if state is not None:
+            name = type(interceptor).__name__
+            state['interceptor_time'][name] = state['interceptor_time'].get(name, 0.0) + seconds
+
+    def context_chain_finished(self, context: RequestContext, response: Response, exception: Exception):
+        end_time = time.perf_counter()
+        state = context.pop_state(self)
+        if state is None:
+            return
+        # Only VPNInterceptor sends requests again now, after vpn login again
+        vpn_re_login = context.resent
+        request_bytes = self.__get_request_bytes(context.param, response)
+        response_bytes = self.__get_response_bytes(response)
+        with self.__metricsLock:
+            series = self.__get_series(state['host'], state['operation'])
+            series.latency.observe(end_time - state['start_time'])
+            for name, seconds in state['interceptor_time'].items():
+                if name not in series.interceptorTime.keys():
+                    series.interceptorTime[name] = Histogram(self.__buckets)
+                series.interceptorTime[name].observe(seconds)
+            series.requestBytes += request_bytes
+            series.responseBytes += response_bytes
+            if vpn_re_login:
+                series.vpnReLoginCount += 1
+            if response is None:
+                series.errorCount += 1
+            else:
+                series.redirectCount += len(response.history)
+                series.statusCodes[response.status_code] = series.statusCodes.get(response.status_code, 0) + 1
+
+    @staticmethod
+    def __get_body_size(body) -> int:
+        if body is None:
+            return 0
+        if isinstance(body, (bytes, bytearray)):
+            return len(body)
+        if isinstance(body, str):
+            return len(body.encode('utf-8'))
+        if isinstance(body, dict):
+            return len(parse.urlencode(body))
+        return 0
+
+    def __get_request_bytes(self, param: RequestParam, response: Response) -> int:
+        if response is not None and response.request is not None:
+            size = 0
+            for history_response in list(response.history) + [response]:
+                request = history_response.request
+                if request is not None:
+                    size += len(request.method or '') + len(request.url or '') + 11
+                    size += sum(len(k) + len(v) + 4 for k, v in request.headers.items())
+                    size += self.__get_body_size(request.body)
+            return size
+        # Async responses do not keep the sent request
+        if isinstance(param, PostRequestParam):
+            if param.json is not None:
+                return len(str(param.json))
+            return self.__get_body_size(param.data)
+        return 0
+
+    @staticmethod
+    def __get_response_bytes(response: Response) -> int:
+        if response is None:
+            return 0
+        size = 0
+        for history_response in response.history:
+            size += int(history_response.headers.get('Content-Length', 0) or 0)
+        # Stream response body is not read yet, so Content-Length is used
+        # noinspection PyProtectedMember
+        if response._content is not False and response._content is not None:
+            # noinspection PyProtectedMember
+            size += len(response._content)
+        else:
+            size += int(response.headers.get('Content-Length', 0) or 0)
+        return size
+
+    def __get_series(self, host: str, operation: str) -> _MetricSeries:
+        key = (host, operation)
+        series = self.__series.get(key)
+        if series is None:
+            series = _MetricSeries(self.__buckets)
+            self.__series[key] = series
+        return series
+
+    def get_stats(self) -> list:
+        stats = []
+        with self.__metricsLock:
+            for (host, operation), series in self.__series.items():
+                stats.append({
+                    'host': host,
+                    'operation': operation,
+                    'latency': series.latency.to_dict(),
+                    'errors': series.errorCount,
+                    'status_codes': dict(series.statusCodes),
+                    'request_bytes': series.requestBytes,
+                    'response_bytes': series.responseBytes,
+                    'redirects': series.redirectCount,
+                    'vpn_re_login': series.vpnReLoginCount,
+                    'interceptors': {name: histogram.to_dict()
+                                     for name, histogram in series.interceptorTime.items()}
+                })
+        return stats
+
+    # Merged latency histogram of all matched hosts and operations, None means all
+    def get_latency_histogram(self, host: str = None, operation: str = None) -> Histogram:
+        histogram = Histogram(self.__buckets)
+        with self.__metricsLock:
+            for (series_host, series_operation), series in self.__series.items():
+                if (host is None or host == series_host) and (operation is None or operation == series_operation):
+                    histogram.merge(series.latency)
+        return histogram
+
+    def get_percentile(self, percentile: float, host: str = None, operation: str = None):
+        return self.get_latency_histogram(host, operation).percentile(percentile)
+
+    @staticmethod
+    def __escape_label(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def __format_labels(self, labels: dict) -> str:
+        return '{' + ','.join('%s="%s"' % (key, self.__escape_label(value)) for key, value in labels.items()) + '}'
+
+    def __format_histogram(self, lines: list, name: str, labels: dict, histogram: Histogram):
+        cumulative = 0
+        for i in range(len(histogram.buckets)):
+            cumulative += histogram.bucketCounts[i]
+            bucket_labels = dict(labels, le=repr(histogram.buckets[i]))
+            lines.append('%s_bucket%s %d' % (name, self.__format_labels(bucket_labels), cumulative))
+        lines.append('%s_bucket%s %d' % (name, self.__format_labels(dict(labels, le='+Inf')), histogram.count))
+        lines.append('%s_sum%s %r' % (name, self.__format_labels(labels), histogram.sum))
+        lines.append('%s_count%s %d' % (name, self.__format_labels(labels), histogram.count))
+
+    # Prometheus text exposition format
+    def to_prometheus(self, prefix: str = 'nau_net') -> str:
+        counters = [
+            ('request_errors_total', 'Requests failed with exception', lambda s: s.errorCount),
+            ('request_bytes_total', 'Estimated bytes sent', lambda s: s.requestBytes),
+            ('response_bytes_total', 'Bytes received', lambda s: s.responseBytes),
+            ('redirects_total', 'Redirects followed', lambda s: s.redirectCount),
+            ('vpn_re_login_total', 'Requests which made vpn login again', lambda s: s.vpnReLoginCount)
+        ]
+        lines = []
+        with self.__metricsLock:
+            series_items = list(self.__series.items())
+            name = prefix + '_request_duration_seconds'
+            lines.append('# HELP %s Request latency including all interceptors' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for (host, operation), series in series_items:
+                self.__format_histogram(lines, name, {'host': host, 'operation': operation}, series.latency)
+            name = prefix + '_interceptor_duration_seconds'
+            lines.append('# HELP %s Time spent inside each interceptor' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for (host, operation), series in series_items:
+                for interceptor_name, histogram in series.interceptorTime.items():
+                    labels = {'host': host, 'operation': operation, 'interceptor': interceptor_name}
+                    self.__format_histogram(lines, name, labels, histogram)
+            name = prefix + '_responses_total'
+            lines.append('# HELP %s Responses by status code' % name)
+            lines.append('# TYPE %s counter' % name)
+            for (host, operation), series in series_items:
+                for status_code, status_count in series.statusCodes.items():
+                    labels = {'host': host, 'operation': operation, 'code': status_code}
+                    lines.append('%s%s %d' % (name, self.__format_labels(labels), status_count))
+            for counter_name, counter_help, getter in counters:
+                name = prefix + '_' + counter_name
+                lines.append('# HELP %s %s' % (name, counter_help))
+                lines.append('# TYPE %s counter' % name)
+                for (host, operation), series in series_items:
+                    labels = {'host': host, 'operation': operation}
+                    lines.append('%s%s %d' % (name, self.__format_labels(labels), getter(series)))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.__metricsLock:
+            self.__series.clear()
@@ -1,25 +1,53 @@
-from binascii import hexlify
+import json as json_parse
+import os
+import re
+import weakref
+from binascii import hexlify, unhexlify
+from collections import OrderedDict
+from enum import IntEnum
+from threading import Event, Lock
 from urllib import parse
 
 from Crypto.Cipher import AES
 from requests import Response
 
-from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, PostRequestParam, RequestParam
+from NauNetTools.Clients.Deadline import DeadlineExceeded
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, PostRequestParam, RequestContext, \
+    RequestParam
+from NauNetTools.Clients.ResponsePeeker import ResponsePeeker
 from NauNetTools.Clients.SSOClient import SSOClient
 
 
 class VPNUrlBuilder:
+    vpnHost = 'vpn.nau.edu.cn'
     __vpnUrlEncryptKey = 'wrdvpnisthebest!'
     __vpnUrlEncryptIV = 'wrdvpnisthebest!'
     __vpnUrlEncryptIVHex: str
     __vpnUrlEncryptIVByte: bytes
     __vpnUrlEncryptKeyByte: bytes
+    __cacheSize: int
+    # Encrypt and decrypt caches are counted separately
+    encryptCacheHits: int = 0
+    encryptCacheMisses: int = 0
+    decryptCacheHits: int = 0
+    decryptCacheMisses: int = 0
 
-    def __init__(self):
+    # Cache size <= 0 means no cache
+    def __init__(self, cache_size: int = 256):
         self.__vpnUrlEncryptKeyByte = self.__vpnUrlEncryptKey.encode('utf-8')
         self.__vpnUrlEncryptIVByte = self.__vpnUrlEncryptIV.encode('utf-8')
         self.__vpnUrlEncryptIVHex = hexlify(self.__vpnUrlEncryptIVByte).decode()
 
+        self.__cacheSize = cache_size
+        self.__encryptCache: OrderedDict = OrderedDict()
+        self.__decryptCache: OrderedDict = OrderedDict()
+        self.__cacheLock = Lock()
+        # Matches absolute, protocol relative and root relative vpn urls, such as
+        # http://vpn.nau.edu.cn/http-8080/<iv hex><host hex>/path
+        self.__vpnUrlPattern = re.compile(r'(?:https?:)?(?://' + re.escape(self.vpnHost) + r')?'
+                                          r'/([a-z]+)(?:-(\d+))?/' + self.__vpnUrlEncryptIVHex + r'((?:[0-9a-f]{2})+)',
+                                          re.IGNORECASE)
+
     @staticmethod
     def __text_right_append(text: str, mode: str) -> str:
         if mode == 'utf-8':
@@ -32,7 +60,7 @@ class VPNUrlBuilder:
         text += '0' * append_length
         return text
 
-    def encrypt_vpn_url(self, host: str):
+    def __encrypt_host(self, host: str) -> str:
         text_len = len(host)
         host = self.__text_right_append(host, 'utf-8')
         host = host.encode('utf-8')
@@ -41,69 +69,544 @@ class VPNUrlBuilder:
         encrypted_host = cipher.encrypt(host)
         return self.__vpnUrlEncryptIVHex + hexlify(encrypted_host).decode()[0:text_len * 2]
 
+    def encrypt_vpn_url(self, host: str) -> str:
+        if self.__cacheSize <= 0:
+            return self.__encrypt_host(host)
+        with self.__cacheLock:
+            encrypted_host = self.__encryptCache.get(host)
+            if encrypted_host is not None:
+                self.__encryptCache.move_to_end(host)
+                self.encryptCacheHits += 1
+                return encrypted_host
+            self.encryptCacheMisses += 1
+        encrypted_host = self.__encrypt_host(host)
+        with self.__cacheLock:
+            self.__encryptCache[host] = encrypted_host
+            self.__encryptCache.move_to_end(host)
+            while len(self.__encryptCache) > self.__cacheSize:
+                self.__encryptCache.popitem(last=False)
+        return encrypted_host
+
+    def __decrypt_host(self, encrypted_host: str) -> str:
+        encrypted_host = unhexlify(encrypted_host)
+        cipher: AES = AES.new(self.__vpnUrlEncryptKeyByte, AES.MODE_CFB, iv=self.__vpnUrlEncryptIVByte,
+                              segment_size=128)
+        return cipher.decrypt(encrypted_host).decode('utf-8')
+
+    # Inverse of encrypt_vpn_url
+    def decrypt_vpn_url(self, encrypted_host: str) -> str:
+        encrypted_host = encrypted_host.lower()
+        if encrypted_host.startswith(self.__vpnUrlEncryptIVHex):
+            encrypted_host = encrypted_host[len(self.__vpnUrlEncryptIVHex):]
+        if self.__cacheSize <= 0:
+            return self.__decrypt_host(encrypted_host)
+        with self.__cacheLock:
+            host = self.__decryptCache.get(encrypted_host)
+            if host is not None:
+                self.__decryptCache.move_to_end(encrypted_host)
+                self.decryptCacheHits += 1
+                return host
+            self.decryptCacheMisses += 1
+        host = self.__decrypt_host(encrypted_host)
+        with self.__cacheLock:
+            self.__decryptCache[encrypted_host] = host
+            self.__decryptCache.move_to_end(encrypted_host)
+            while len(self.__decryptCache) > self.__cacheSize:
+                self.__decryptCache.popitem(last=False)
+        return host
+
+    def __restore_vpn_match(self, match) -> str:
+        scheme, port, encrypted_host = match.group(1, 2, 3)
+        # noinspection PyBroadException
+        try:
+            host = self.decrypt_vpn_url(encrypted_host)
+        except:
+            return match.group(0)
+        if port is not None and ':' not in host:
+            host += ':' + port
+        return scheme.lower() + '://' + host
+
+    def is_vpn_url(self, url: str) -> bool:
+        return url is not None and self.__vpnUrlPattern.match(url) is not None
+
+    # Translate vpn url into real url, other urls will be returned directly
+    def canonicalize_url(self, url: str) -> str:
+        if url is None:
+            return url
+        match = self.__vpnUrlPattern.match(url)
+        if match is None:
+            return url
+        return self.__restore_vpn_match(match) + url[match.end():]
+
+    # Translate all vpn urls in text into real urls
+    def canonicalize_links(self, text: str) -> str:
+        return self.__vpnUrlPattern.sub(self.__restore_vpn_match, text)
+
+    # Rewrite str chunks in one pass, such as response.iter_content(decode_unicode=True)
+    # Hold back size must be longer than any vpn url prefix
+    def iter_canonicalize_links(self, chunks, hold_back: int = 1024):
+        buffer = ''
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffer += chunk
+            if len(buffer) <= hold_back * 2:
+                continue
+            cut = len(buffer) - hold_back
+            parts = []
+            end = 0
+            for match in self.__vpnUrlPattern.finditer(buffer):
+                if match.start() >= cut:
+                    break
+                parts.append(buffer[end:match.start()])
+                parts.append(self.__restore_vpn_match(match))
+                end = match.end()
+            cut = max(cut, end)
+            parts.append(buffer[end:cut])
+            buffer = buffer[cut:]
+            yield ''.join(parts)
+        if len(buffer) > 0:
+            yield self.canonicalize_links(buffer)
+
+    # Also could be used to warm the cache
+    def encrypt_vpn_urls(self, hosts) -> dict:
+        return {host: self.encrypt_vpn_url(host) for host in hosts}
+
+    def get_cache_info(self) -> dict:
+        with self.__cacheLock:
+            return {
+                'encrypt_hits': self.encryptCacheHits,
+                'encrypt_misses': self.encryptCacheMisses,
+                'encrypt_size': len(self.__encryptCache),
+                'decrypt_hits': self.decryptCacheHits,
+                'decrypt_misses': self.decryptCacheMisses,
+                'decrypt_size': len(self.__decryptCache),
+                'max_size': self.__cacheSize
+            }
+
+    def clear_cache(self):
+        with self.__cacheLock:
+            self.__encryptCache.clear()
+            self.__decryptCache.clear()
+            self.encryptCacheHits = 0
+            self.encryptCacheMisses = 0
+            self.decryptCacheHits = 0
+            self.decryptCacheMisses = 0
+
+
+class VPNRouteAction(IntEnum):
+    # Send through vpn
+    VPN = 0
+    # Send to the real host directly
+    DIRECT = 1
+    # Refuse to send
+    DENY = 2
+
+
+# Decide how requests of a host are sent, exact host rule first, then the longest *.suffix rule
+# Rule host could have a port, such as jwc.nau.edu.cn:8080, otherwise it matches all ports
+# Fallback rules are only used when no rule matches, they are not saved in config and never change the rules
+# Decisions are cached by netloc, and the cache is cleared when rules are changed
+# Config example: {"default": "vpn", "direct": ["*.nau.edu.cn"], "vpn": ["alstu.nau.edu.cn"], "deny": []}
+class VPNRouteTable:
+    __defaultAction: VPNRouteAction
+    __cacheSize: int
+
+    def __init__(self, default_action: VPNRouteAction = VPNRouteAction.VPN, cache_size: int = 1024):
+        self.__defaultAction = VPNRouteAction(default_action)
+        self.__cacheSize = cache_size
+        self.__exactRules: dict = {}
+        self.__suffixRules: dict = {}
+        self.__fallbackExactRules: dict = {}
+        self.__fallbackSuffixRules: dict = {}
+        self.__routeCache: dict = {}
+        self.__ruleLock = Lock()
+
+    @staticmethod
+    def __parse_action(action) -> VPNRouteAction:
+        if isinstance(action, str):
+            return VPNRouteAction[action.strip().upper()]
+        return VPNRouteAction(action)
+
+    def get_default_action(self) -> VPNRouteAction:
+        return self.__defaultAction
+
+    def set_default_action(self, action):
+        with self.__ruleLock:
+            self.__defaultAction = self.__parse_action(action)
+            self.__routeCache = {}
+
+    # Pattern is a host such as jwc.nau.edu.cn, or *.nau.edu.cn for all sub domains without nau.edu.cn itself
+    def add_rule(self, pattern: str, action):
+        self.add_rules([pattern], action)
+
+    def add_rules(self, patterns, action):
+        action = self.__parse_action(action)
+        with self.__ruleLock:
+            self.__put_rules(self.__exactRules, self.__suffixRules, patterns, action)
+            self.__routeCache = {}
+
+    @staticmethod
+    def __put_rules(exact_rules: dict, suffix_rules: dict, patterns, action: VPNRouteAction):
+        for pattern in patterns:
+            pattern = pattern.strip().lower()
+            if pattern.startswith('*.'):
+                suffix_rules[pattern[1:]] = action
+            else:
+                exact_rules[pattern] = action
+
+    # All fallback rules are replaced, such as the default none vpn hosts of VPNUtils
+    def set_fallback_rules(self, patterns, action):
+        action = self.__parse_action(action)
+        with self.__ruleLock:
+            self.__fallbackExactRules = {}
+            self.__fallbackSuffixRules = {}
+            self.__put_rules(self.__fallbackExactRules, self.__fallbackSuffixRules, patterns, action)
+            self.__routeCache = {}
+
+    def get_fallback_rules(self) -> dict:
+        with self.__ruleLock:
+            rules = dict(self.__fallbackExactRules)
+            for suffix, action in self.__fallbackSuffixRules.items():
+                rules['*' + suffix] = action
+            return rules
+
+    def remove_rule(self, pattern: str):
+        pattern = pattern.strip().lower()
+        with self.__ruleLock:
+            if pattern.startswith('*.'):
+                self.__suffixRules.pop(pattern[1:], None)
+            else:
+                self.__exactRules.pop(pattern, None)
+            self.__routeCache = {}
+
+    def get_rules(self) -> dict:
+        with self.__ruleLock:
+            rules = dict(self.__exactRules)
+            for suffix, action in self.__suffixRules.items():
+                rules['*' + suffix] = action
+            return rules
+
+    @staticmethod
+    def __match_rules(exact_rules: dict, suffix_rules: dict, netloc: str):
+        action = exact_rules.get(netloc)
+        if action is not None:
+            return action
+        host = netloc.rsplit('@', 1)[-1]
+        if not host.endswith(']') and ':' in host:
+            host = host.rsplit(':', 1)[0]
+            action = exact_rules.get(host)
+            if action is not None:
+                return action
+        # From the longest suffix to the shortest one
+        index = host.find('.')
+        while index >= 0:
+            action = suffix_rules.get(host[index:])
+            if action is not None:
+                return action
+            index = host.find('.', index + 1)
+        return None
+
+    def __match(self, netloc: str) -> VPNRouteAction:
+        action = self.__match_rules(self.__exactRules, self.__suffixRules, netloc)
+        if action is None:
+            action = self.__match_rules(self.__fallbackExactRules, self.__fallbackSuffixRules, netloc)
+        return self.__defaultAction if action is None else action
+
+    def resolve_host(self, netloc: str) -> VPNRouteAction:
+        netloc = netloc.lower()
+        action = self.__routeCache.get(netloc)
+        if action is not None:
+            return action
+        with self.__ruleLock:
+            action = self.__match(netloc)
+            if len(self.__routeCache) >= self.__cacheSize:
+                self.__routeCache = {}
+            self.__routeCache[netloc] = action
+        return action
+
+    def resolve(self, url: str) -> VPNRouteAction:
+        return self.resolve_host(parse.urlsplit(url).netloc)
+
+    # Return {url: action} for all urls
+    def resolve_many(self, urls) -> dict:
+        return {url: self.resolve(url) for url in urls}
+
+    def clear_cache(self):
+        with self.__ruleLock:
+            self.__routeCache = {}
+
+    def get_cache_info(self) -> dict:
+        return {
+            'size': len(self.__routeCache),
+            'max_size': self.__cacheSize
+        }
+
+    # Rules and fallback rules are copied, so the copy could be changed without changing this table
+    def copy(self):
+        with self.__ruleLock:
+            route_table = type(self)(self.__defaultAction, self.__cacheSize)
+            route_table.__exactRules = dict(self.__exactRules)
+            route_table.__suffixRules = dict(self.__suffixRules)
+            route_table.__fallbackExactRules = dict(self.__fallbackExactRules)
+            route_table.__fallbackSuffixRules = dict(self.__fallbackSuffixRules)
+        return route_table
+
+    def to_config(self) -> dict:
+        config = {'default': self.__defaultAction.name.lower()}
+        for action in VPNRouteAction:
+            config[action.name.lower()] = []
+        for pattern, action in self.get_rules().items():
+            config[action.name.lower()].append(pattern)
+        return config
+
+    # Rules of config are added to this table, unknown action names will raise KeyError
+    def load_config(self, config: dict):
+        if 'default' in config.keys():
+            self.set_default_action(config['default'])
+        for action in VPNRouteAction:
+            patterns = config.get(action.name.lower())
+            if patterns:
+                self.add_rules(patterns, action)
+
+    @classmethod
+    def from_config(cls, config: dict, cache_size: int = 1024):
+        route_table = cls(cache_size=cache_size)
+        route_table.load_config(config)
+        return route_table
+
+    def load_config_file(self, file_path: str) -> bool:
+        if os.path.isfile(file_path):
+            # noinspection PyBroadException
+            try:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    self.load_config(json_parse.loads(file.read()))
+                return True
+            except:
+                return False
+        return False
+
+    def save_config_file(self, file_path: str) -> bool:
+        # noinspection PyBroadException
+        try:
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.write(json_parse.dumps(self.to_config(), indent=2))
+            return True
+        except:
+            return False
+
+
+class _VPNLoginFlight:
+    success: bool = False
+
+    def __init__(self, event):
+        self.event = event
+
 
 # For http://vpn.nau.edu.cn
 # Use as interceptor to translate real request into vpn request
 # Only support GET and POST method
 # Should be added as first interceptor
+# Vpn login again is done once for each session, other requests wait for it and then send again
 class VPNInterceptor(NetInterceptor):
     __user_id: str
     __user_pw: str
     __netTimeOut: int
+    # Count of successful and failed vpn login again, concurrent requests share one login
+    reLoginCount: int = 0
+    reLoginFailedCount: int = 0
 
-    vpnHost = 'vpn.nau.edu.cn'
+    vpnHost = VPNUrlBuilder.vpnHost
     vpnServer = 'http://' + vpnHost + ''
     __vpnSSOLoginService = vpnServer + '/login?cas_login=true&fromUrl=/'
     __vpnLogoutUrl = vpnServer + '/logout'
-    __vpnUrlBuilder: VPNUrlBuilder
+    # Only this size of streaming response is read to check vpn login page
+    __vpnLoginCheckSize: int = 64 * 1024
+    # Host encryption is stable, so all interceptors share one cached builder
+    __vpnUrlBuilder: VPNUrlBuilder = VPNUrlBuilder()
 
-    def __init__(self, user_id: str, user_pw: str, time_out: int = 10):
-        self.__requestUseVpn: dict = {}
+    # TGT of sso_session will be used to login vpn before posting password
+    # All hosts are sent through vpn if route_table is None, except hosts of set_none_vpn_host
+    # Route table is copied, so one table could be used to create many interceptors
+    def __init__(self, user_id: str, user_pw: str, time_out: int = 10, sso_session=None,
+                 route_table: VPNRouteTable = None):
+        self.__ssoSession = sso_session
+        self.__reLoginLock = Lock()
+        # Login generation increases after every successful login, requests sent before it only need to send again
+        self.__loginGeneration = weakref.WeakKeyDictionary()
+        self.__loginFlight = weakref.WeakKeyDictionary()
 
         self.__user_id = user_id
         self.__user_pw = user_pw
         self.__netTimeOut = time_out
-        self.__vpnUrlBuilder = VPNUrlBuilder()
         self.__noneVPNHost = []
+        self.set_route_table(route_table)
+
+    @classmethod
+    def get_vpn_url_builder(cls) -> VPNUrlBuilder:
+        return cls.__vpnUrlBuilder
+
+    # Password will not be saved in state
+    def get_state(self) -> dict:
+        return {
+            'user_id': self.__user_id,
+            'time_out': self.__netTimeOut,
+            'none_vpn_host': list(self.__noneVPNHost),
+            'route_table': self.__routeTable.to_config()
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, user_pw: str):
+        interceptor = cls(state['user_id'], user_pw, state.get('time_out', 10))
+        if 'route_table' in state.keys():
+            interceptor.set_route_table(VPNRouteTable.from_config(state['route_table']))
+        interceptor.set_none_vpn_host(state.get('none_vpn_host', []))
+        return interceptor
 
+    def set_sso_session(self, sso_session):
+        self.__ssoSession = sso_session
+
+    # Vpn host is always sent directly, table is copied and none vpn hosts are kept
+    def set_route_table(self, route_table: VPNRouteTable):
+        route_table = VPNRouteTable() if route_table is None else route_table.copy()
+        route_table.set_fallback_rules(self.__noneVPNHost, VPNRouteAction.DIRECT)
+        self.__routeTable = route_table
+
+    # Table of this interceptor, changes of it only affect this interceptor
+    def get_route_table(self) -> VPNRouteTable:
+        return self.__routeTable
+
+    # Hosts are sent directly unless rules of route table decide another action for them
     def set_none_vpn_host(self, host_list: list):
         if host_list is None:
             host_list = []
-        else:
-            self.__noneVPNHost = host_list
+        self.__noneVPNHost = [host.lower() for host in host_list]
+        self.__routeTable.set_fallback_rules(self.__noneVPNHost, VPNRouteAction.DIRECT)
 
-    def request_intercept(self, session: NetworkClient, request_code: int, param: RequestParam):
-        if not self.__is_none_vpn_site(param):
+    # Login generation of session is saved in context for requests sent through vpn
+    def context_request_intercept(self, context: RequestContext):
+        param = context.param
+        action = self.get_route_action(param.url, param.kwargs.get('params'))
+        if action == VPNRouteAction.DENY:
+            raise ConnectionError('Host is denied by vpn route table! Url: ' + param.url)
+        if action == VPNRouteAction.VPN:
             param.url = self.__build_vpn_url(param.url)
-            self.__requestUseVpn[request_code] = True
-        else:
-            self.__requestUseVpn[request_code] = False
-
-    def response_intercept(self, session: NetworkClient, request_code: int, param: RequestParam,
-                           response: Response) -> Response:
-        if response is not None and param is not None and request_code in self.__requestUseVpn.keys():
-            if self.__requestUseVpn.pop(request_code):
-                if type(param) == RequestParam:
-                    last_request_method = 'GET'
-                elif type(param) == PostRequestParam:
-                    last_request_method = 'POST'
-                else:
-                    last_request_method = None
-                if last_request_method is not None and not self._has_vpn_login(response):
-                    sso_client = SSOClient(service_url=self.__vpnSSOLoginService, sso_host_check=False,
-                                           sso_jump_host_check=False, request_login_client=session,
-                                           with_interceptor=False)
-                    vpn_response = sso_client.login(self.__user_id, self.__user_pw, response)
-                    if vpn_response.is_success:
-                        response = session.request(last_request_method, vpn_response.url, **param.kwargs)
+            with self.__reLoginLock:
+                context.set_state(self, self.__loginGeneration.get(context.session, 0))
+
+    def context_response_intercept(self, context: RequestContext, response: Response) -> Response:
+        session, param = context.session, context.param
+        login_method = self._get_vpn_login_method(context, response)
+        if login_method is not None:
+            last_request_method, generation, need_login = login_method
+            context.resent = True
+            if need_login:
+                flight, is_leader = self._join_login_flight(session, generation, Event)
+            else:
+                flight, is_leader = None, False
+            if flight is None:
+                success = True
+            elif is_leader:
+                success = False
+                try:
+                    success = self.__vpn_login(session, response)
+                finally:
+                    self._finish_login_flight(session, flight, success)
+            else:
+                # Vpn login of other request is not limited by the deadline of this request
+                if not flight.event.wait(context.deadline.remaining() if context.deadline is not None else None):
+                    raise DeadlineExceeded('Deadline exceeded when waiting for vpn login!')
+                success = flight.success
+            if success:
+                response.close()
+                response = session.request(last_request_method, param.url, **self._get_replay_kwargs(param))
         return response
 
+    def __vpn_login(self, session: NetworkClient, response: Response) -> bool:
+        if self.__ssoSession is not None and self.__ssoSession.attach(session):
+            # Sso login page will jump to vpn with ticket directly
+            response = session.get(response.url, with_interceptor=False, timeout=self.__netTimeOut)
+        sso_client = SSOClient(service_url=self.__vpnSSOLoginService, sso_host_check=False,
+                               sso_jump_host_check=False, request_login_client=session,
+                               with_interceptor=False)
+        return sso_client.login(self.__user_id, self.__user_pw, response).is_success
+
+    # Return (method, login generation, need login) to send again, otherwise return None
+    # Vpn may login again by itself with TGT cookie and jump to vpn index, then request only need to send again
+    def _get_vpn_login_method(self, context: RequestContext, response: Response):
+        param = context.param
+        generation = context.pop_state(self)
+        if response is not None and param is not None and generation is not None:
+            if type(param) == RequestParam:
+                last_request_method = 'GET'
+            elif type(param) == PostRequestParam:
+                last_request_method = 'POST'
+            else:
+                last_request_method = None
+            if last_request_method is not None:
+                if not self._has_vpn_login(response):
+                    return last_request_method, generation, True
+                if self.__is_vpn_index_jump(param.url, response):
+                    return last_request_method, generation, False
+        return None
+
+    def __is_vpn_index_jump(self, url: str, response: Response) -> bool:
+        return len(response.history) > 0 and response.url.rstrip('/') == self.vpnServer \
+               and url.rstrip('/') != self.vpnServer
+
+    # Return (None, False) if session has logged in again after the request was sent
+    # Otherwise return (flight, True) for the first request which should login, (flight, False) for others
+    def _join_login_flight(self, session, generation: int, event_factory) -> tuple:
+        with self.__reLoginLock:
+            if self.__loginGeneration.get(session, 0) != generation:
+                return None, False
+            flight = self.__loginFlight.get(session)
+            if flight is not None:
+                return flight, False
+            flight = _VPNLoginFlight(event_factory())
+            self.__loginFlight[session] = flight
+            return flight, True
+
+    def _finish_login_flight(self, session, flight: _VPNLoginFlight, success: bool):
+        with self.__reLoginLock:
+            flight.success = success
+            if success:
+                self.reLoginCount += 1
+                self.__loginGeneration[session] = self.__loginGeneration.get(session, 0) + 1
+            else:
+                self.reLoginFailedCount += 1
+            self.__loginFlight.pop(session, None)
+        flight.event.set()
+
+    # Original url and body will be sent again, url has been changed to vpn url already
     @staticmethod
-    def _has_vpn_login(response: Response) -> bool:
+    def _get_replay_kwargs(param: RequestParam) -> dict:
+        kwargs = dict(param.kwargs)
+        if isinstance(param, PostRequestParam):
+            kwargs['data'] = param.data
+            kwargs['json'] = param.json
+        return kwargs
+
+    def _get_vpn_sso_login_service(self) -> str:
+        return self.__vpnSSOLoginService
+
+    def _get_vpn_account(self) -> tuple:
+        return self.__user_id, self.__user_pw
+
+    @classmethod
+    def _has_vpn_login(cls, response: Response) -> bool:
         parse_result = parse.urlparse(response.url)
         if parse_result.netloc == SSOClient.ssoHost:
             return False
-        if '南京审计大学统一身份认证登录' in response.text and 'vpn_hostname_data' in response.text:
+        if ResponsePeeker.is_streaming(response):
+            # Login page is always html, downloads will not be read here
+            content_type = response.headers.get('Content-Type', 'text/html').lower()
+            if 'html' not in content_type:
+                return True
+            text = ResponsePeeker.peek_text(response, cls.__vpnLoginCheckSize)
+        else:
+            text = response.text
+        if '南京审计大学统一身份认证登录' in text and 'vpn_hostname_data' in text:
             return False
         return True
 
@@ -116,33 +619,37 @@ class VPNInterceptor(NetInterceptor):
         vpn_url += url[url.rindex(parse_result.path):len(url)]
         return vpn_url
 
-    def __is_none_vpn_site(self, param: RequestParam) -> bool:
-        url = param.url
+    # Sso requests follow the route of their service host, sso logout is always sent directly
+    def get_route_action(self, url: str, params: dict = None) -> VPNRouteAction:
         if url is None or url.isspace():
-            return True
-        parse_result = parse.urlparse(url)
-        if parse_result.netloc.lower() == self.vpnHost:
-            return True
-        if parse_result.netloc.lower() in self.__noneVPNHost:
-            return True
-        if parse_result.netloc.lower() == SSOClient.ssoHost:
-            if self.__vpnSSOLoginService.lower() in parse_result.params.lower():
-                return True
-            if 'logout' in parse_result.path.lower():
-                return True
-            if 'params' in param.kwargs.keys() and 'service' in param.kwargs['params'].keys():
-                sso_service_url = param.kwargs['params']['service'].lower()
-                sso_parse_result = parse.urlparse(sso_service_url)
-                if sso_parse_result.netloc in self.__noneVPNHost:
-                    return True
-            if not parse_result.query.isspace():
-                query_parse_result = parse.parse_qs(parse_result.query)
-                if 'service' in query_parse_result.keys() and len(query_parse_result['service']) > 0:
-                    sso_service_url = query_parse_result['service'][0].lower()
-                    sso_parse_result = parse.urlparse(sso_service_url)
-                    if sso_parse_result.netloc in self.__noneVPNHost:
-                        return True
-        return False
+            return VPNRouteAction.DIRECT
+        split_result = parse.urlsplit(url)
+        netloc = split_result.netloc.lower()
+        if netloc == SSOClient.ssoHost:
+            if 'logout' in split_result.path.lower():
+                return VPNRouteAction.DIRECT
+            service_url = None
+            if isinstance(params, dict) and 'service' in params.keys():
+                service_url = params['service']
+            elif 'service=' in split_result.query:
+                service_list = parse.parse_qs(split_result.query).get('service')
+                if service_list is not None and len(service_list) > 0:
+                    service_url = service_list[0]
+            if service_url is not None:
+                service_action = self.__resolve_netloc(parse.urlsplit(service_url).netloc.lower())
+                if service_action != VPNRouteAction.VPN:
+                    return service_action
+        return self.__resolve_netloc(netloc)
+
+    # Vpn host is always sent directly, even if it is sso service
+    def __resolve_netloc(self, netloc: str) -> VPNRouteAction:
+        if netloc == self.vpnHost:
+            return VPNRouteAction.DIRECT
+        return self.__routeTable.resolve_host(netloc)
+
+    # Return {url: action} for all urls, without sending them
+    def check_routes(self, urls) -> dict:
+        return {url: self.get_route_action(url) for url in urls}
 
     def close(self, session: NetworkClient):
         session.get(self.__vpnLogoutUrl)
@@ -167,9 +674,10 @@ class VPNUtils:
 
     # Should be used before add other interceptors
     @staticmethod
-    def use_school_vpn(client: NetworkClient, user_id: str, user_pw: str, use_none_vpn_list: bool = True):
+    def use_school_vpn(client: NetworkClient, user_id: str, user_pw: str, use_none_vpn_list: bool = True,
+                       sso_session=None, route_table: VPNRouteTable = None):
         if not VPNUtils.is_use_school_vpn(client):
-            interceptor = VPNInterceptor(user_id, user_pw)
+            interceptor = VPNInterceptor(user_id, user_pw, sso_session=sso_session, route_table=route_table)
             if use_none_vpn_list:
                 interceptor.set_none_vpn_host(VPNUtils.noneVPNHost)
             client.add_interceptor(interceptor)
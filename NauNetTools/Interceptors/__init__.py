@@ -1 +1 @@
-__all__ = ["VPNInterceptor"]
+__all__ = ["AsyncVPNInterceptor", "CacheInterceptor", "MetricsInterceptor", "VPNInterceptor"]
@@ -1 +1 @@
-__all__ = ["Clients", "Interceptors"]
+__all__ = ["AsyncClients", "Clients", "Interceptors"]
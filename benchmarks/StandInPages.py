@@ -0,0 +1,50 @@
+# Pages with the same structure and roughly the same size as the real sso and jwc pages
+
+SSO_LOGIN_PAGE = '''<!DOCTYPE html><html><head><meta charset="UTF-8"/>
+<title>南京审计大学统一身份认证登录</title>%(head)s</head><body>
+<div class="login-box"><span class="error">%(message)s</span>
+<form id="fm1" action="/sso/login" method="post">
+<input id="username" name="username" type="text" value=""/>
+<input id="password" name="password" type="password" value=""/>
+<input type="hidden" name="lt" value="%(lt)s"/>
+<input type="hidden" name="execution" value="e1s1"/>
+<input type="hidden" name="_eventId" value="submit"/>
+<input type="hidden" name="useVCode" value=""/>
+<input type="hidden" name="isUseVCode" value="false"/>
+<input type="hidden" name="sessionVcode" value=""/>
+<input type="hidden" name="errorCount" value=""/>
+</form></div>%(extra)s</body></html>'''
+
+# Real login page is about 30KB with inline styles and scripts
+SSO_PAGE_HEAD = '<style>' + '.login-box .item{margin:0 auto;padding:4px;}\n' * 300 + '</style>' + \
+                '<script>' + 'var config_item = {"key": "value", "enable": true};\n' * 200 + '</script>'
+
+
+def build_sso_login_page(lt: str = 'LT-0', message: str = '', extra: str = '') -> str:
+    return SSO_LOGIN_PAGE % {'head': SSO_PAGE_HEAD, 'message': message, 'lt': lt, 'extra': extra}
+
+
+# Real student index page is about 200KB, most of it is not the function tree
+def build_jwc_index_page(leaf_count: int = 80) -> str:
+    items = []
+    for group in range((leaf_count + 9) // 10):
+        leaves = ''.join('<li><a href="javascript:Direct(\'Grade/Page%d_%d.aspx\')">功能%d_%d</a></li>'
+                         % (group, n, group, n) for n in range(min(10, leaf_count - group * 10)))
+        items.append('<li><span>分组%d</span><ul>%s</ul></li>' % (group, leaves))
+    padding = ''.join('<tr><td class="c%d">学生信息%d</td><td><a href="#">查看</a></td></tr>' % (n % 5, n)
+                      for n in range(2500))
+    return '<!DOCTYPE html><html><head><meta charset="utf-8"/><title>南京审计大学教务管理系统</title></head><body>' \
+           '<div class="main"><table>' + padding + '</table></div>' \
+           '<div class="menu"><ul id="tt">' + ''.join(items) + '</ul></div></body></html>'
+
+
+def build_jwc_login_page() -> str:
+    return '<html><head><title>用户登录_南京审计大学教务管理系统</title></head><body></body></html>'
+
+
+def build_jwc_grade_page(row_count: int = 60) -> str:
+    rows = ''.join('<tr><td>%d</td><td>课程%d</td><td>%.1f</td><td>%d</td></tr>' % (n, n, 2 + n % 3 * 0.5, 60 + n % 40)
+                   for n in range(row_count))
+    return '<html><head><meta charset="utf-8"/><title>成绩查询</title></head><body>' \
+           '<table id="grade"><tr><th>序号</th><th>课程</th><th>学分</th><th>成绩</th></tr>' + rows + \
+           '</table></body></html>'
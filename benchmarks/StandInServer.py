@@ -0,0 +1,246 @@
+# Local stand-in for sso, jwc, alstu and vpn servers, used as http proxy by clients:
+#   client.trust_env = False
+#   client.proxies = {'http': proxy_url}
+import sys
+import threading
+import uuid
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+from StandInPages import build_jwc_grade_page, build_jwc_index_page, build_jwc_login_page, build_sso_login_page
+
+SSO_HOST = 'sso.nau.edu.cn'
+JWC_HOST = 'jwc.nau.edu.cn'
+ALSTU_HOST = 'alstu.nau.edu.cn'
+VPN_HOST = 'vpn.nau.edu.cn'
+
+
+class StandInState:
+    def __init__(self, users: dict = None, jwc_leaf_count: int = 80):
+        self.users = users if users is not None else {'2020000000': 'password'}
+        self.lock = threading.Lock()
+        self.tgt = {}
+        self.tickets = {}
+        self.services = {}
+        self.vpnSessions = set()
+        self.jwcIndex = build_jwc_index_page(jwc_leaf_count)
+        self.jwcPage = build_jwc_grade_page()
+        self.requestCount = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid the delayed ack stall on keep-alive connections
+    disable_nagle_algorithm = True
+    state: StandInState = None
+    vpnMode: bool = False
+
+    def log_message(self, *args):
+        pass
+
+    def __cookies(self) -> dict:
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        return {k: v.value for k, v in cookie.items()}
+
+    def __send(self, status: int, body: str = '', headers: list = None,
+               content_type: str = 'text/html; charset=utf-8'):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers or []:
+            if self.vpnMode and key == 'Location':
+                value = self.__to_vpn_url(value)
+            elif self.vpnMode and key == 'Set-Cookie':
+                value = value.replace('Path=/sso', 'Path=/')
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def __to_vpn_url(url: str) -> str:
+        real = parse.urlsplit(url)
+        if real.netloc.lower() == VPN_HOST:
+            return url
+        vpn_url = 'http://' + VPN_HOST + '/' + real.scheme + '/' + \
+                  VPNInterceptor.get_vpn_url_builder().encrypt_vpn_url(real.netloc) + real.path
+        if len(real.query) > 0:
+            vpn_url += '?' + real.query
+        return vpn_url
+
+    def __redirect(self, location: str, headers: list = None):
+        self.__send(302, '', [('Location', location)] + (headers or []))
+
+    def __read_form(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8') if length > 0 else ''
+        return {k: v[0] for k, v in parse.parse_qs(body).items()}
+
+    def __issue_ticket(self, user: str, service: str) -> str:
+        ticket = 'ST-' + uuid.uuid4().hex
+        with self.state.lock:
+            self.state.tickets[ticket] = user
+        return service + ('&' if '?' in service else '?') + 'ticket=' + ticket
+
+    def __use_ticket(self, query: dict):
+        ticket = query.get('ticket', [None])[0]
+        with self.state.lock:
+            return self.state.tickets.pop(ticket, None)
+
+    def __handle(self, method: str):
+        with self.state.lock:
+            self.state.requestCount += 1
+        url = parse.urlsplit(self.path)
+        host = url.netloc or self.headers.get('Host', '')
+        host = host.split(':')[0].lower()
+        cookies = self.__cookies()
+        form = self.__read_form() if method == 'POST' else {}
+        self.vpnMode = False
+        if host == VPN_HOST and self.__vpn_check(url, parse.parse_qs(url.query), cookies):
+            return
+        if host == VPN_HOST:
+            # Forward request to real host inside the vpn
+            url = parse.urlsplit(VPNInterceptor.get_vpn_url_builder().canonicalize_url(url.path) +
+                                 ('?' + url.query if len(url.query) > 0 else ''))
+            host = url.netloc.split(':')[0].lower()
+            self.vpnMode = True
+        path = url.path
+        query = parse.parse_qs(url.query)
+        if host == SSO_HOST:
+            self.__handle_sso(method, path, query, cookies, form)
+        elif host == JWC_HOST:
+            self.__handle_jwc(path, query, cookies)
+        elif host == ALSTU_HOST:
+            self.__handle_alstu(path, query, cookies)
+        else:
+            self.__send(404, 'not found')
+
+    def __handle_sso(self, method: str, path: str, query: dict, cookies: dict, form: dict):
+        service = query.get('service', [None])[0]
+        if path == '/sso/logout':
+            with self.state.lock:
+                self.state.tgt.pop(cookies.get('CASTGC'), None)
+            self.__send(200, '注销成功', [('Set-Cookie', 'CASTGC=; Path=/sso; Max-Age=0')])
+            return
+        if path != '/sso/login':
+            self.__send(404, 'not found')
+            return
+        user = self.state.tgt.get(cookies.get('CASTGC'))
+        extra_headers = []
+        message = ''
+        if method == 'POST':
+            username = form.get('username')
+            if username in self.state.users and self.state.users[username] == form.get('password') \
+                    and form.get('lt', '').startswith('LT-'):
+                tgt = 'TGT-' + uuid.uuid4().hex
+                with self.state.lock:
+                    self.state.tgt[tgt] = username
+                user = username
+                extra_headers.append(('Set-Cookie', 'CASTGC=' + tgt + '; Path=/sso'))
+            else:
+                message = '密码错误'
+        if user is not None:
+            if service is not None:
+                self.__redirect(self.__issue_ticket(user, service), extra_headers)
+            else:
+                self.__send(200, '<html><body>登录成功</body></html>', extra_headers)
+        else:
+            extra = ''
+            if service is not None and VPN_HOST in service:
+                extra = '<script>var vpn_hostname_data = {};</script>'
+            self.__send(200, build_sso_login_page('LT-' + uuid.uuid4().hex, message, extra))
+
+    def __handle_jwc(self, path: str, query: dict, cookies: dict):
+        session = cookies.get('ASP.NET_SessionId')
+        logged_in = session is not None and session in self.state.services
+        if path == '/Login_Single.aspx':
+            user = self.__use_ticket(query)
+            if user is None:
+                self.__redirect('http://' + JWC_HOST + '/login.aspx')
+                return
+            session = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.services[session] = user
+            self.__redirect('http://' + JWC_HOST + '/Students/StudentIndex.aspx',
+                            [('Set-Cookie', 'ASP.NET_SessionId=' + session + '; Path=/')])
+        elif path == '/login.aspx':
+            self.__send(200, build_jwc_login_page())
+        elif path == '/LoginOut.aspx':
+            with self.state.lock:
+                self.state.services.pop(session, None)
+            self.__redirect('http://' + JWC_HOST + '/login.aspx')
+        elif not logged_in:
+            self.__redirect('http://' + JWC_HOST + '/login.aspx')
+        elif path == '/Students/StudentIndex.aspx':
+            self.__send(200, self.state.jwcIndex)
+        else:
+            self.__send(200, self.state.jwcPage)
+
+    def __handle_alstu(self, path: str, query: dict, cookies: dict):
+        user = self.__use_ticket(query)
+        if user is None and cookies.get('alstu') not in self.state.services:
+            self.__redirect('http://' + SSO_HOST + '/sso/login?service=' +
+                            parse.quote('http://' + ALSTU_HOST + '/default.aspx'))
+            return
+        headers = []
+        if user is not None:
+            session = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.services[session] = user
+            headers.append(('Set-Cookie', 'alstu=' + session + '; Path=/'))
+        self.__send(200, '<html><body><div class="top_nav"><a href="Main.aspx">奥蓝信息系统</a>'
+                         '<a href="Info.aspx">信息</a></div></body></html>', headers)
+
+    # Return True if the request is handled by vpn itself
+    def __vpn_check(self, url, query: dict, cookies: dict) -> bool:
+        vpn_service = 'http://' + VPN_HOST + '/login?cas_login=true&fromUrl=/'
+        if url.path == '/login':
+            user = self.__use_ticket(query)
+            if user is None:
+                self.__redirect('http://' + SSO_HOST + '/sso/login?service=' + parse.quote(vpn_service))
+                return True
+            session = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.vpnSessions.add(session)
+            self.__redirect('http://' + VPN_HOST + query.get('fromUrl', ['/'])[0],
+                            [('Set-Cookie', 'wengine_vpn_ticket=' + session + '; Path=/')])
+            return True
+        if url.path == '/logout':
+            with self.state.lock:
+                self.state.vpnSessions.discard(cookies.get('wengine_vpn_ticket'))
+            self.__send(200, 'logout')
+            return True
+        if cookies.get('wengine_vpn_ticket') not in self.state.vpnSessions:
+            self.__redirect('http://' + SSO_HOST + '/sso/login?service=' + parse.quote(vpn_service))
+            return True
+        if url.path == '/':
+            self.__send(200, '<html><body>vpn index</body></html>')
+            return True
+        return False
+
+    def do_GET(self):
+        self.__handle('GET')
+
+    def do_POST(self):
+        self.__handle('POST')
+
+
+class _StandInHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients close streaming responses without reading the body, which is expected
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super(_StandInHTTPServer, self).handle_error(request, client_address)
+
+
+def start_stand_in_server(state: StandInState = None, port: int = 0):
+    if state is None:
+        state = StandInState()
+    handler = type('BoundStandInHandler', (StandInHandler,), {'state': state})
+    server = _StandInHTTPServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:' + str(server.server_address[1])
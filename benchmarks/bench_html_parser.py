@@ -0,0 +1,46 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from NauNetTools.Clients.HtmlParser import HtmlParser, HtmlParserBackend, lxml_html
+from NauNetTools.Clients.JwcClient import JwcClient
+from NauNetTools.Clients.SSOClient import SSOClient
+from StandInPages import build_jwc_index_page, build_sso_login_page
+
+
+def run(repeat: int = 20) -> bool:
+    sso_page = build_sso_login_page('LT-123')
+    jwc_page = build_jwc_index_page()
+    print('SSO page: %d KB, Jwc index page: %d KB' % (len(sso_page) // 1024, len(jwc_page) // 1024))
+    backends = [HtmlParserBackend.HTML_PARSER, HtmlParserBackend.TARGETED]
+    if lxml_html is not None:
+        backends.append(HtmlParserBackend.LXML)
+
+    expected_form = None
+    expected_tree = None
+    base_time = None
+    identical = True
+    for backend in backends:
+        HtmlParser.set_backend(backend)
+        form = SSOClient._get_login_post_form(sso_page, 'user', 'pw')
+        tree = JwcClient._parse_jwc_function_dict(jwc_page, 'Students/')
+        if expected_form is None:
+            expected_form, expected_tree = form, tree
+        elif form != expected_form or tree != expected_tree:
+            identical = False
+            print('%s: results are different!' % backend.name)
+        form_time = timeit.timeit(lambda: SSOClient._get_login_post_form(sso_page, 'user', 'pw'), number=repeat)
+        tree_time = timeit.timeit(lambda: JwcClient._parse_jwc_function_dict(jwc_page, 'Students/'), number=repeat)
+        total_time = form_time + tree_time
+        if base_time is None:
+            base_time = total_time
+        print('%-12s login form %7.2f ms  function tree %7.2f ms  speedup %5.1fx' %
+              (backend.name, form_time * 1000 / repeat, tree_time * 1000 / repeat, base_time / total_time))
+    HtmlParser.set_backend(HtmlParserBackend.AUTO)
+    return identical
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run() else 1)
@@ -0,0 +1,293 @@
+# Offline benchmarks for NauNetTools, all requests are sent to a local stand-in server
+# Usage: python benchmarks/run_benchmarks.py [--scale 2.0] [--json result.json] [--only name ...]
+# Exit code is 1 if any result is worse than its threshold
+import argparse
+import json as json_parse
+import os
+import socket
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.AlstuClient import AlstuClient
+from NauNetTools.Clients.JwcClient import JwcClient, JwcNetState
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, RequestContext, RequestParam
+from NauNetTools.Clients.SSOClient import SSOClient
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor, VPNUtils
+from StandInServer import StandInState, start_stand_in_server
+
+# Name: (direction, threshold, unit)
+# max means result should be lower than threshold, min means result should be higher than threshold
+THRESHOLDS = {
+    'sso_login_latency': ('max', 25.0, 'ms'),
+    'jwc_login_latency': ('max', 40.0, 'ms'),
+    'alstu_login_latency': ('max', 25.0, 'ms'),
+    'vpn_re_login_latency': ('max', 40.0, 'ms'),
+    'interceptor_chain_overhead': ('max', 50.0, 'us'),
+    'vpn_rewrite_cost': ('max', 40.0, 'us'),
+    'multi_session_throughput': ('min', 150.0, 'pages/s'),
+    'async_multi_session_throughput': ('min', 150.0, 'pages/s')
+}
+
+USER_ID = '2020000000'
+USER_PW = 'password'
+SESSION_COUNT = 20
+PAGE_COUNT = 400
+
+
+# Return canned response without network, used to measure the library overhead only
+class _LocalAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = b'<html><body>ok</body></html>'
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class _PassInterceptor(NetInterceptor):
+    def request_intercept(self, session, request_code: int, param: RequestParam):
+        pass
+
+    def response_intercept(self, session, request_code: int, param: RequestParam, response: Response) -> Response:
+        return response
+
+
+# Proxy connections of urllib3 are created without TCP_NODELAY, which adds a delayed ack stall to every post
+# Direct connections to the real servers always use TCP_NODELAY, so keep the same behaviour here
+class _NoDelayProxyAdapter(HTTPAdapter):
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        proxy_kwargs.setdefault('socket_options', [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)])
+        return super(_NoDelayProxyAdapter, self).proxy_manager_for(proxy, **proxy_kwargs)
+
+
+def _make_client(client, proxy: str):
+    client.trust_env = False
+    client.proxies = {'http': proxy}
+    client.mount('http://', _NoDelayProxyAdapter(pool_maxsize=SESSION_COUNT))
+    return client
+
+
+def _average_time(action, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        action()
+    return (time.perf_counter() - start) / count
+
+
+def bench_sso_login(proxy: str, count: int = 20) -> float:
+    def action():
+        with _make_client(SSOClient(), proxy) as client:
+            if not client.login(USER_ID, USER_PW).is_success:
+                raise AssertionError('SSO login failed!')
+
+    return _average_time(action, count) * 1000
+
+
+def bench_jwc_login(proxy: str, count: int = 20) -> float:
+    def action():
+        client = _make_client(JwcClient(), proxy)
+        if client.login(USER_ID, USER_PW) != JwcNetState.SUCCESS:
+            raise AssertionError('Jwc login failed!')
+        client.close()
+
+    return _average_time(action, count) * 1000
+
+
+def bench_alstu_login(proxy: str, count: int = 20) -> float:
+    def action():
+        client = _make_client(AlstuClient(use_vpn=False), proxy)
+        if not client.login(USER_ID, USER_PW):
+            raise AssertionError('Alstu login failed!')
+        client.close()
+
+    return _average_time(action, count) * 1000
+
+
+def bench_vpn_re_login(proxy: str, count: int = 20) -> float:
+    def action():
+        client = _make_client(NetworkClient(), proxy)
+        client.add_interceptor(VPNInterceptor(USER_ID, USER_PW))
+        response = client.get('http://alstu.nau.edu.cn/default.aspx')
+        if response.status_code != 200 or VPNInterceptor.vpnHost not in response.url:
+            raise AssertionError('VPN login failed!')
+
+    return _average_time(action, count) * 1000
+
+
+def bench_interceptor_chain_overhead(count: int = 300, rounds: int = 15) -> float:
+    client = NetworkClient()
+    client.mount('http://', _LocalAdapter())
+    for _ in range(4):
+        client.add_interceptor(_PassInterceptor())
+    url = 'http://jwc.nau.edu.cn/Students/StudentIndex.aspx'
+    # Requests with and without interceptors are interleaved and the median round is used,
+    # because the cost of requests itself is much larger and more noisy than the interceptor chain
+    round_results = []
+    for _ in range(rounds):
+        base_time = chain_time = 0.0
+        for _ in range(count):
+            start = time.perf_counter()
+            client.get(url, with_interceptor=False)
+            middle = time.perf_counter()
+            client.get(url)
+            base_time += middle - start
+            chain_time += time.perf_counter() - middle
+        round_results.append((chain_time - base_time) / count)
+    return max(0.0, statistics.median(round_results)) * 1000000
+
+
+def bench_vpn_rewrite_cost(count: int = 20000) -> float:
+    interceptor = VPNInterceptor(USER_ID, USER_PW)
+    interceptor.set_none_vpn_host(VPNUtils.noneVPNHost)
+    session = NetworkClient()
+    urls = ['http://alstu.nau.edu.cn/default.aspx?page=%d' % (n % 50) for n in range(count)]
+
+    start = time.perf_counter()
+    for code in range(count):
+        context = RequestContext(session, code, RequestParam(urls[code]))
+        interceptor.context_request_intercept(context)
+        interceptor._get_vpn_login_method(context, None)
+    return (time.perf_counter() - start) / count * 1000000
+
+
+def _login_jwc_clients(proxy: str, count: int) -> list:
+    clients = [_make_client(JwcClient(), proxy) for _ in range(count)]
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        results = list(executor.map(lambda c: c.login(USER_ID, USER_PW), clients))
+    if any(result != JwcNetState.SUCCESS for result in results):
+        raise AssertionError('Jwc login failed!')
+    return clients
+
+
+def bench_multi_session_throughput(proxy: str) -> float:
+    clients = _login_jwc_clients(proxy, SESSION_COUNT)
+    urls = [url for group in clients[0].get_function_dict().values() for url in group.values()]
+
+    def fetch(index: int):
+        response = clients[index % SESSION_COUNT].get(urls[index % len(urls)])
+        if response.status_code != 200:
+            raise AssertionError('Fetch page failed!')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=SESSION_COUNT) as executor:
+        list(executor.map(fetch, range(PAGE_COUNT)))
+    result = PAGE_COUNT / (time.perf_counter() - start)
+    for client in clients:
+        client.close()
+    return result
+
+
+def bench_async_multi_session_throughput(proxy: str):
+    try:
+        import asyncio
+        import aiohttp
+        from NauNetTools.AsyncClients.AsyncJwcClient import AsyncJwcClient
+    except ImportError:
+        return None
+
+    async def run() -> float:
+        connector = aiohttp.TCPConnector(limit=SESSION_COUNT)
+        clients = []
+        for _ in range(SESSION_COUNT):
+            client = AsyncJwcClient(connector=connector)
+            client.proxy = proxy
+            clients.append(client)
+        results = await asyncio.gather(*[client.login(USER_ID, USER_PW) for client in clients])
+        if any(result != JwcNetState.SUCCESS for result in results):
+            raise AssertionError('Jwc login failed!')
+        urls = [url for group in clients[0].get_function_dict().values() for url in group.values()]
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[clients[n % SESSION_COUNT].get(urls[n % len(urls)])
+                                           for n in range(PAGE_COUNT)])
+        result = PAGE_COUNT / (time.perf_counter() - start)
+        if any(response.status_code != 200 for response in responses):
+            raise AssertionError('Fetch page failed!')
+        for client in clients:
+            await client.close()
+        await connector.close()
+        return result
+
+    return asyncio.run(run())
+
+
+def run_all(scale: float = 1.0, only: list = None) -> dict:
+    state = StandInState(users={USER_ID: USER_PW})
+    server, proxy = start_stand_in_server(state)
+    benchmarks = {
+        'sso_login_latency': lambda: bench_sso_login(proxy),
+        'jwc_login_latency': lambda: bench_jwc_login(proxy),
+        'alstu_login_latency': lambda: bench_alstu_login(proxy),
+        'vpn_re_login_latency': lambda: bench_vpn_re_login(proxy),
+        'interceptor_chain_overhead': bench_interceptor_chain_overhead,
+        'vpn_rewrite_cost': bench_vpn_rewrite_cost,
+        'multi_session_throughput': lambda: bench_multi_session_throughput(proxy),
+        'async_multi_session_throughput': lambda: bench_async_multi_session_throughput(proxy)
+    }
+    results = {}
+    try:
+        for name, benchmark in benchmarks.items():
+            if only and name not in only:
+                continue
+            direction, threshold, unit = THRESHOLDS[name]
+            threshold = threshold * scale if direction == 'max' else threshold / scale
+            error = None
+            # noinspection PyBroadException
+            try:
+                value = benchmark()
+            except Exception as e:
+                value = None
+                error = repr(e)
+            if value is None and error is None:
+                status = 'SKIP'
+            elif value is None:
+                status = 'FAIL'
+            elif direction == 'max':
+                status = 'PASS' if value <= threshold else 'FAIL'
+            else:
+                status = 'PASS' if value >= threshold else 'FAIL'
+            results[name] = {'value': value, 'threshold': threshold, 'direction': direction, 'unit': unit,
+                             'status': status, 'error': error}
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description='Offline benchmarks for NauNetTools')
+    arg_parser.add_argument('--scale', type=float, default=1.0, help='Relax all thresholds for slow machines')
+    arg_parser.add_argument('--json', help='Save results to json file')
+    arg_parser.add_argument('--only', nargs='*', help='Only run these benchmarks')
+    args = arg_parser.parse_args()
+
+    results = run_all(args.scale, args.only)
+    for name, result in results.items():
+        if result['value'] is None:
+            value = result['error'] or '-'
+        else:
+            value = '%.2f %s' % (result['value'], result['unit'])
+        limit = '%s %.2f %s' % ('<=' if result['direction'] == 'max' else '>=', result['threshold'], result['unit'])
+        print('%-4s %-32s %-24s %s' % (result['status'], name, value, limit))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            file.write(json_parse.dumps(results, indent=2))
+    return 1 if any(result['status'] == 'FAIL' for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -25,6 +25,9 @@ setup(
     include_package_data=True,
     platforms='any',
     install_requires=['requests', 'bs4', 'pycryptodome'],
+    extras_require={
+        'async': ['aiohttp']
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GPLv3 License",
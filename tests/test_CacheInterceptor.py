@@ -0,0 +1,120 @@
+import io
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.NetworkClient import NetworkClient
+from NauNetTools.Interceptors.CacheInterceptor import CacheInterceptor, CacheRule
+
+
+# Returns the count of requests of url as page, and 304 if If-None-Match is the page ETag
+class _PageAdapter(BaseAdapter):
+    def __init__(self):
+        super(_PageAdapter, self).__init__()
+        self.requests = []
+
+    def send(self, request, **kwargs) -> Response:
+        self.requests.append(request)
+        response = Response()
+        response.url = request.url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8', 'ETag': '"v1"'})
+        if request.headers.get('If-None-Match') == '"v1"':
+            response.status_code = 304
+            content = b''
+        else:
+            response.status_code = 200
+            content = ('page %d' % len(self.requests)).encode()
+        # noinspection PyProtectedMember
+        response._content = content
+        response.raw = io.BytesIO(b'')
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+class CacheInterceptorTest(unittest.TestCase):
+    def setUp(self):
+        self.adapter = _PageAdapter()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+
+    def __create_client(self, interceptor: CacheInterceptor) -> NetworkClient:
+        client = NetworkClient()
+        client.mount('http://', self.adapter)
+        client.add_interceptor(interceptor)
+        self.clients.append(client)
+        return client
+
+    def test_fresh_page_is_returned_from_cache(self):
+        interceptor = CacheInterceptor([CacheRule(r'/Notice\.aspx', 60)])
+        client = self.__create_client(interceptor)
+        self.assertEqual(client.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 1')
+        self.assertEqual(client.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 1')
+        # Not matched url is always sent
+        self.assertEqual(client.get('http://jwc.nau.edu.cn/Grade.aspx').text, 'page 2')
+        self.assertEqual(len(self.adapter.requests), 2)
+        info = interceptor.get_cache_info()
+        self.assertEqual((info['hits'], info['misses'], info['size']), (1, 1, 1))
+
+    def test_stale_page_is_revalidated(self):
+        interceptor = CacheInterceptor([CacheRule(r'/Notice\.aspx', 0.05)])
+        client = self.__create_client(interceptor)
+        self.assertEqual(client.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 1')
+        time.sleep(0.1)
+        response = client.get('http://jwc.nau.edu.cn/Notice.aspx')
+        self.assertEqual((response.status_code, response.text), (200, 'page 1'))
+        self.assertEqual(self.adapter.requests[1].headers['If-None-Match'], '"v1"')
+        # Revalidated entry is fresh again
+        self.assertEqual(client.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 1')
+        self.assertEqual(len(self.adapter.requests), 2)
+        info = interceptor.get_cache_info()
+        self.assertEqual((info['hits'], info['misses'], info['revalidated']), (1, 2, 1))
+
+    def test_private_page_is_not_shared_by_sessions(self):
+        interceptor = CacheInterceptor([CacheRule(r'/Grade\.aspx', 60), CacheRule(r'/Notice\.aspx', 60, True)])
+        first = self.__create_client(interceptor)
+        second = self.__create_client(interceptor)
+        self.assertEqual(first.get('http://jwc.nau.edu.cn/Grade.aspx').text, 'page 1')
+        self.assertEqual(second.get('http://jwc.nau.edu.cn/Grade.aspx').text, 'page 2')
+        self.assertEqual(first.get('http://jwc.nau.edu.cn/Grade.aspx').text, 'page 1')
+        self.assertEqual(first.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 3')
+        self.assertEqual(second.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 3')
+        self.assertEqual(len(self.adapter.requests), 3)
+
+    def test_shared_page_is_loaded_from_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rules = [CacheRule(r'/Notice\.aspx', 60, True), CacheRule(r'/Grade\.aspx', 60)]
+            first = self.__create_client(CacheInterceptor(rules, disk_dir=directory))
+            self.assertEqual(first.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 1')
+            self.assertEqual(first.get('http://jwc.nau.edu.cn/Grade.aspx').text, 'page 2')
+            interceptor = CacheInterceptor(rules, disk_dir=directory)
+            second = self.__create_client(interceptor)
+            self.assertEqual(second.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 1')
+            self.assertEqual(second.get('http://jwc.nau.edu.cn/Notice.aspx').text, 'page 1')
+            # Private pages are never saved on disk
+            self.assertEqual(second.get('http://jwc.nau.edu.cn/Grade.aspx').text, 'page 3')
+        info = interceptor.get_cache_info()
+        self.assertEqual((info['hits'], info['disk_hits'], info['misses']), (2, 1, 1))
+
+    def test_counters_of_concurrent_requests(self):
+        interceptor = CacheInterceptor([CacheRule(r'/Notice\.aspx', 60, True)])
+        client = self.__create_client(interceptor)
+        client.get('http://jwc.nau.edu.cn/Notice.aspx')
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: client.get('http://jwc.nau.edu.cn/Notice.aspx'), range(400)))
+        info = interceptor.get_cache_info()
+        self.assertEqual((info['hits'], info['misses']), (400, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
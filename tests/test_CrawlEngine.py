@@ -0,0 +1,155 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+from threading import Lock
+from urllib import parse
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.CrawlEngine import CallbackSink, CrawlEngine
+from NauNetTools.Clients.JwcClient import JwcClient, JwcNetState
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+_JWC = 'http://jwc.nau.edu.cn'
+_ALSTU = 'http://alstu.nau.edu.cn'
+
+
+# Pages of all fake clients, records logins, requests in flight of each host and expired pages
+class _FakeJwc:
+    def __init__(self, delay: float = 0, expired_paths: tuple = ()):
+        self.delay = delay
+        self.loginCount = 0
+        self.fetchedPaths = []
+        self.maxInFlight = {}
+        # Page returns login page once for each path
+        self.expiredPaths = set(expired_paths)
+        self.__inFlight = {}
+        self.__lock = Lock()
+
+    def login(self):
+        with self.__lock:
+            self.loginCount += 1
+
+    def fetch(self, url: str) -> tuple:
+        split_result = parse.urlsplit(url)
+        with self.__lock:
+            in_flight = self.__inFlight.get(split_result.netloc, 0) + 1
+            self.__inFlight[split_result.netloc] = in_flight
+            self.maxInFlight[split_result.netloc] = max(self.maxInFlight.get(split_result.netloc, 0), in_flight)
+        time.sleep(self.delay)
+        with self.__lock:
+            self.__inFlight[split_result.netloc] -= 1
+            if split_result.path in self.expiredPaths:
+                self.expiredPaths.discard(split_result.path)
+                return _JWC + '/Login.aspx', '<title>用户登录_南京审计大学教务管理系统</title>'
+            self.fetchedPaths.append(split_result.path)
+        return url, '<html>' + split_result.path + '</html>'
+
+
+class _FakeJwcClient(JwcClient):
+    functionDict: dict
+
+    def __init__(self, server: _FakeJwc, function_dict: dict):
+        super(_FakeJwcClient, self).__init__()
+        self.__server = server
+        self.functionDict = function_dict
+
+    def login(self, user_id: str, user_pw: str, sso_response=None, deadline=None) -> JwcNetState:
+        self.__server.login()
+        return JwcNetState.SUCCESS
+
+    def get_function_dict(self) -> dict:
+        return self.functionDict
+
+    def get(self, url: str, with_interceptor: bool = True, deadline=None, **kwargs) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.url, text = self.__server.fetch(url)
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = text.encode('utf-8')
+        response.raw = io.BytesIO(b'')
+        response.encoding = 'utf-8'
+        return response
+
+
+class CrawlEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.pages = []
+        self.sink = CallbackSink(self.pages.append)
+
+    def __create_engine(self, server: _FakeJwc, function_dict: dict, accounts: list = None, **kwargs):
+        if accounts is None:
+            accounts = [('2020000000', 'password')]
+        return CrawlEngine(accounts, self.sink, client_factory=lambda: _FakeJwcClient(server, function_dict),
+                           **kwargs)
+
+    def test_same_page_is_crawled_once(self):
+        vpn_host = VPNInterceptor.get_vpn_url_builder().encrypt_vpn_url('jwc.nau.edu.cn')
+        function_dict = {
+            '成绩': _JWC + '/Grade.aspx?b=2&a=1',
+            '信息': {
+                '成绩': _JWC + '/Grade.aspx?a=1&b=2#top',
+                'vpn成绩': 'http://vpn.nau.edu.cn/http/' + vpn_host + '/Grade.aspx?a=1&b=2',
+                '课表': _JWC + '/Table.aspx'
+            }
+        }
+        server = _FakeJwc()
+        metrics = self.__create_engine(server, function_dict, [('2020000000', 'a'), ('2020000001', 'b')]).crawl()
+        self.assertEqual(metrics['pages'], 4)
+        self.assertEqual(metrics['duplicates'], 4)
+        self.assertEqual(sorted(server.fetchedPaths), ['/Grade.aspx'] * 2 + ['/Table.aspx'] * 2)
+        self.assertEqual(server.loginCount, 2)
+
+    def test_host_limit(self):
+        function_dict = {'jwc': {str(n): _JWC + '/%d.aspx' % n for n in range(12)},
+                         'alstu': {str(n): _ALSTU + '/%d.aspx' % n for n in range(12)}}
+        server = _FakeJwc(delay=0.02)
+        metrics = self.__create_engine(server, function_dict, workers=8, host_limit=2).crawl()
+        self.assertEqual(metrics['pages'], 24)
+        self.assertEqual(server.maxInFlight, {'jwc.nau.edu.cn': 2, 'alstu.nau.edu.cn': 2})
+
+    def test_checkpoint_resume(self):
+        function_dict = {str(n): _JWC + '/%d.aspx' % n for n in range(6)}
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_path = os.path.join(directory, 'checkpoint.jsonl')
+
+            def write(page):
+                if len(self.pages) == 3:
+                    raise RuntimeError('Crawl is interrupted!')
+                self.pages.append(page)
+
+            self.sink = CallbackSink(write)
+            with self.assertRaises(RuntimeError):
+                self.__create_engine(_FakeJwc(), function_dict, workers=1, checkpoint_path=checkpoint_path).crawl()
+            self.sink = CallbackSink(self.pages.append)
+            server = _FakeJwc()
+            metrics = self.__create_engine(server, function_dict, checkpoint_path=checkpoint_path).crawl()
+        self.assertEqual(metrics['skipped'], 3)
+        self.assertEqual(metrics['pages'], 3)
+        self.assertEqual(len(server.fetchedPaths), 3)
+        self.assertEqual(sorted(page.task.url for page in self.pages), sorted(function_dict.values()))
+
+    def test_expired_page_is_fetched_again_after_login(self):
+        function_dict = {str(n): _JWC + '/%d.aspx' % n for n in range(4)}
+        server = _FakeJwc(expired_paths=('/1.aspx',))
+        engine = self.__create_engine(server, function_dict, workers=1)
+        metrics = engine.crawl()
+        self.assertEqual(metrics['pages'], 4)
+        self.assertEqual(metrics['failed'], 0)
+        self.assertEqual(server.loginCount, 2)
+        self.assertEqual(server.fetchedPaths.count('/1.aspx'), 1)
+
+    def test_expired_page_fails_after_max_attempts(self):
+        server = _FakeJwc(expired_paths=('/0.aspx',))
+        engine = self.__create_engine(server, {'0': _JWC + '/0.aspx'}, max_attempts=1)
+        metrics = engine.crawl()
+        self.assertEqual((metrics['pages'], metrics['failed']), (0, 1))
+        self.assertTrue(engine.get_failed_pages()[0].expired)
+
+
+if __name__ == '__main__':
+    unittest.main()
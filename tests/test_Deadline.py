@@ -0,0 +1,148 @@
+import io
+import time
+import unittest
+from threading import Thread
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ReadTimeout, Timeout
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.Deadline import Deadline, DeadlineExceeded
+from NauNetTools.Clients.JwcClient import JwcClient, JwcNetState
+from NauNetTools.Clients.NetworkClient import NetworkClient
+
+_SSO_LOGIN_PAGE = '<html><form><input name="lt" value="LT-1"/><input name="execution" value="e1s1"/></form></html>'
+
+
+# Sso login, jwc single login and student index pages, every hop takes delay seconds
+# Hop raises ReadTimeout after timeout seconds if timeout is less than delay
+class _LoginAdapter(BaseAdapter):
+    def __init__(self, delay: float):
+        super(_LoginAdapter, self).__init__()
+        self.delay = delay
+        # (method, path, timeout) of every hop
+        self.hops = []
+
+    def send(self, request, timeout=None, **kwargs) -> Response:
+        self.hops.append((request.method, request.path_url.split('?')[0], timeout))
+        if timeout is not None and timeout < self.delay:
+            time.sleep(timeout)
+            raise ReadTimeout('Read timed out!')
+        time.sleep(self.delay)
+        path = request.path_url.split('?')[0]
+        if path == '/sso/login' and request.method == 'GET':
+            return self.__build(request, 200, _SSO_LOGIN_PAGE)
+        if path == '/sso/login':
+            return self.__build(request, 302, '', 'http://jwc.nau.edu.cn/Login_Single.aspx?ticket=ST-1')
+        if path == '/Login_Single.aspx':
+            return self.__build(request, 302, '', '/Students/StudentIndex.aspx')
+        if path.startswith('/redirect/'):
+            count = int(path.rsplit('/', 1)[-1])
+            return self.__build(request, 302, '', '/redirect/%d' % (count - 1) if count > 0 else '/done')
+        return self.__build(request, 200, '<ul id="tt"></ul>')
+
+    @staticmethod
+    def __build(request, status_code: int, text: str, location: str = None) -> Response:
+        response = Response()
+        response.status_code = status_code
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        if location is not None:
+            response.headers['Location'] = location
+        # noinspection PyProtectedMember
+        response._content = text.encode('utf-8')
+        response.raw = io.BytesIO(b'')
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_timeout_is_limited_by_remaining_time(self):
+        deadline = Deadline(5)
+        self.assertLessEqual(deadline.get_timeout(), 5)
+        self.assertEqual(deadline.get_timeout(1), 1)
+        timeout = deadline.get_timeout((2, None))
+        self.assertEqual(timeout[0], 2)
+        self.assertLessEqual(timeout[1], 5)
+        expired = Deadline(0)
+        self.assertTrue(expired.is_expired())
+        with self.assertRaises(DeadlineExceeded):
+            expired.get_timeout(10)
+        self.assertTrue(issubclass(DeadlineExceeded, Timeout))
+
+    def test_earlier_deadline_is_used(self):
+        outer, inner = Deadline(1), Deadline(10)
+        self.assertIsNone(Deadline.current())
+        with Deadline.use(outer):
+            with Deadline.use(inner) as current:
+                self.assertIs(current, outer)
+            with Deadline.use(Deadline(0.5)) as current:
+                self.assertIsNot(current, outer)
+            self.assertIs(Deadline.current(), outer)
+            # Other threads do not get the deadline
+            currents = []
+            thread = Thread(target=lambda: currents.append(Deadline.current()))
+            thread.start()
+            thread.join()
+            self.assertEqual(currents, [None])
+        self.assertIsNone(Deadline.current())
+
+
+class DeadlineRequestTest(unittest.TestCase):
+    def setUp(self):
+        self.adapter = _LoginAdapter(0.05)
+
+    def __create_client(self, client: NetworkClient):
+        client.mount('http://', self.adapter)
+        return client
+
+    def test_every_redirect_gets_remaining_time(self):
+        client = self.__create_client(NetworkClient())
+        response = client.get('http://jwc.nau.edu.cn/redirect/3', timeout=10, deadline=Deadline(2))
+        self.assertEqual(response.url, 'http://jwc.nau.edu.cn/done')
+        timeouts = [timeout for _, _, timeout in self.adapter.hops]
+        self.assertEqual(len(timeouts), 5)
+        self.assertLessEqual(timeouts[0], 2)
+        for i in range(1, len(timeouts)):
+            self.assertLessEqual(timeouts[i], timeouts[i - 1] - self.adapter.delay)
+        # Without deadline, redirects get timeout of the request
+        self.adapter.hops.clear()
+        client.get('http://jwc.nau.edu.cn/redirect/1', timeout=10)
+        self.assertEqual([timeout for _, _, timeout in self.adapter.hops], [10] * 3)
+
+    def test_redirects_stop_when_deadline_is_exceeded(self):
+        client = self.__create_client(NetworkClient())
+        with self.assertRaises(Timeout):
+            client.get('http://jwc.nau.edu.cn/redirect/10', timeout=10, deadline=Deadline(0.12))
+        self.assertLess(len(self.adapter.hops), 5)
+
+    def test_every_login_hop_gets_remaining_time(self):
+        client = self.__create_client(JwcClient(time_out=10))
+        self.assertEqual(client.login('2020000000', 'password', deadline=Deadline(2)), JwcNetState.SUCCESS)
+        self.assertEqual([(method, path) for method, path, _ in self.adapter.hops], [
+            ('GET', '/sso/login'), ('POST', '/sso/login'), ('GET', '/Login_Single.aspx'),
+            ('GET', '/Students/StudentIndex.aspx')
+        ])
+        timeouts = [timeout for _, _, timeout in self.adapter.hops]
+        self.assertLessEqual(timeouts[0], 2)
+        for i in range(1, len(timeouts)):
+            self.assertLessEqual(timeouts[i], timeouts[i - 1] - self.adapter.delay)
+
+    def test_timeout_of_login_is_time_out_state(self):
+        client = self.__create_client(JwcClient(time_out=10))
+        # Post gets less time than the delay of hop, so requests raises ReadTimeout
+        self.assertEqual(client.login('2020000000', 'password', deadline=Deadline(0.08)), JwcNetState.TIME_OUT)
+        self.assertEqual([method for method, _, _ in self.adapter.hops], ['GET', 'POST'])
+        self.adapter.hops.clear()
+        # Deadline has been exceeded before the first hop
+        self.assertEqual(client.login('2020000000', 'password', deadline=Deadline(0)), JwcNetState.TIME_OUT)
+        self.assertEqual(self.adapter.hops, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
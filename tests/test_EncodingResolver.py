@@ -0,0 +1,112 @@
+import io
+import unittest
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.EncodingResolver import CachedEncodingResolver
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient
+
+_GBK_PAGE = '<html><body>南京审计大学教务管理系统，成绩查询与课表查询</body></html>'.encode('gb18030')
+
+
+# Counts charset detection of every response
+class _CountingResponse(Response):
+    detectCount: int = 0
+
+    @property
+    def apparent_encoding(self):
+        self.detectCount += 1
+        return super(_CountingResponse, self).apparent_encoding
+
+
+class _CountingResolver(CachedEncodingResolver):
+    def __init__(self):
+        super(_CountingResolver, self).__init__()
+        self.resolved = []
+
+    def resolve(self, response: Response):
+        self.resolved.append(response)
+        return super(_CountingResolver, self).resolve(response)
+
+
+# Returns the page of path, Content-Type is 'text/html' without charset unless header_charset is set
+class _PageAdapter(BaseAdapter):
+    def __init__(self, pages: dict):
+        super(_PageAdapter, self).__init__()
+        self.pages = pages
+        self.responses = []
+
+    def send(self, request, **kwargs) -> Response:
+        content_type, content = self.pages[request.path_url]
+        response = _CountingResponse()
+        response.status_code = 200
+        response.url = request.url
+        response.headers = CaseInsensitiveDict({'Content-Type': content_type})
+        if kwargs.get('stream'):
+            response.raw = io.BytesIO(content)
+        else:
+            # noinspection PyProtectedMember
+            response._content = content
+            response.raw = io.BytesIO(b'')
+        self.responses.append(response)
+        return response
+
+    def close(self):
+        pass
+
+
+class _PassInterceptor(NetInterceptor):
+    def request_intercept(self, session, request_code, param):
+        pass
+
+    def response_intercept(self, session, request_code, param, response):
+        return response
+
+
+class EncodingResolverChainTest(unittest.TestCase):
+    def setUp(self):
+        self.resolver = _CountingResolver()
+        self.adapter = _PageAdapter({
+            '/header': ('text/html; charset=utf-8', '<meta charset="gbk">成绩'.encode('utf-8')),
+            '/meta': ('text/html', '<meta charset="gb2312">成绩'.encode('gb18030')),
+            '/detect': ('text/html', _GBK_PAGE),
+            '/image': ('image/png', b'\x89PNG')
+        })
+        self.client = NetworkClient(self.resolver)
+        self.client.mount('http://', self.adapter)
+        self.client.add_interceptor(_PassInterceptor())
+        self.client.add_interceptor(_PassInterceptor())
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_chain_runs_once_for_each_response(self):
+        for path in ('/header', '/meta', '/detect', '/image'):
+            response = self.client.get('http://jwc.nau.edu.cn' + path)
+            self.assertEqual(self.resolver.resolved, [response])
+            self.resolver.resolved.clear()
+        encodings = [response.encoding for response in self.adapter.responses]
+        self.assertEqual(encodings, ['utf-8', 'gb18030', 'gb18030', None])
+        self.assertEqual([response.detectCount for response in self.adapter.responses], [0, 0, 1, 0])
+        self.assertEqual(self.adapter.responses[1].text, '<meta charset="gb2312">成绩')
+
+    def test_detection_fills_host_cache(self):
+        first = self.client.get('http://jwc.nau.edu.cn/detect')
+        self.assertEqual((first.encoding, first.detectCount), ('gb18030', 1))
+        second = self.client.get('http://jwc.nau.edu.cn/detect')
+        self.assertEqual((second.encoding, second.detectCount), ('gb18030', 0))
+        # Streaming response is not detected, but the cached encoding of host is used
+        third = self.client.get('http://jwc.nau.edu.cn/detect', stream=True)
+        self.assertEqual((third.encoding, third.detectCount), ('gb18030', 0))
+        self.assertEqual(third.text, _GBK_PAGE.decode('gb18030'))
+        # Cache key is host and mime type
+        other = self.client.get('http://alstu.nau.edu.cn/detect', stream=True)
+        self.assertIsNone(other.encoding)
+        self.resolver.clear_cache()
+        self.assertEqual(self.client.get('http://jwc.nau.edu.cn/detect').detectCount, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
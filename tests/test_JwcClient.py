@@ -0,0 +1,135 @@
+import io
+import json
+import unittest
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.JwcClient import JwcClient, JwcNetState
+from NauNetTools.Clients.LoginKeeper import LoginKeeper
+from NauNetTools.Clients.SSOClient import SSOClient
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor, VPNUtils
+
+
+class _LoginResult:
+    is_success = True
+
+    def __init__(self, text: str, url: str):
+        self.text = text
+        self.url = url
+
+
+# Sso login returns already login page once, then the student index page
+class _FakeSSOClient(SSOClient):
+    loginTexts: list
+
+    def login(self, user_id: str, user_pw: str, sso_response=None):
+        return _LoginResult(self.loginTexts.pop(0), 'http://jwc.nau.edu.cn/Students/StudentIndex.aspx')
+
+    def get(self, url, **kwargs):
+        raise ConnectionError('No network in test!')
+
+
+# Super of JwcClient is _FakeSSOClient in this class
+class _AlreadyLoginClient(JwcClient, _FakeSSOClient):
+    def __init__(self):
+        super(_AlreadyLoginClient, self).__init__()
+        self.loginTexts = ['当前你已经登录', '<ul id="tt"></ul>']
+
+
+class JwcClientTest(unittest.TestCase):
+    def test_re_login_keeps_login_keeper(self):
+        client = _AlreadyLoginClient()
+        keeper = LoginKeeper(period=3600)
+        try:
+            client.start_login_keeper(keeper=keeper)
+            self.assertEqual(client.login('2020000000', 'password'), JwcNetState.SUCCESS)
+            self.assertTrue(keeper.has_client(client))
+        finally:
+            keeper.stop()
+
+
+# Student index page for every request, requests are recorded
+class _StudentIndexAdapter(BaseAdapter):
+    def __init__(self):
+        super(_StudentIndexAdapter, self).__init__()
+        self.requests = []
+
+    def send(self, request, **kwargs) -> Response:
+        self.requests.append(request)
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = '<ul id="tt"></ul>'.encode('utf-8')
+        response.raw = io.BytesIO(b'')
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+class JwcClientSnapshotTest(unittest.TestCase):
+    __jwcState = {
+        'login_state': True,
+        'index_url': 'http://jwc.nau.edu.cn/Students/StudentIndex.aspx',
+        'index_path': 'Students/',
+        'function_dict': {'信息查询': {'成绩': 'http://jwc.nau.edu.cn/Students/Grade.aspx'}},
+        'function_html': '<ul id="tt"></ul>',
+        'last_login_success_html': None
+    }
+
+    def __create_client(self) -> JwcClient:
+        client = JwcClient()
+        client.restore_snapshot({'version': client.snapshotVersion, 'jwc': self.__jwcState}, validate=False)
+        client.cookies.set('ASP.NET_SessionId', 'jwc-session', domain='jwc.nau.edu.cn', path='/')
+        client.cookies.set('ASP.NET_SessionId', 'sso-session', domain='sso.nau.edu.cn', path='/sso')
+        client.cookies.set('CASTGC', 'TGT-1', domain='.sso.nau.edu.cn', path='/sso', expires=4102444800)
+        return client
+
+    @staticmethod
+    def __get_cookies(client: JwcClient) -> list:
+        return sorted((cookie['name'], cookie['value'], cookie['domain'], cookie['path'], cookie['expires'])
+                      for cookie in client.get_cookie_list())
+
+    def test_round_trip_keeps_cookie_domain_and_path(self):
+        client = self.__create_client()
+        snapshot = json.loads(json.dumps(client.snapshot(), ensure_ascii=False))
+        restored = JwcClient()
+        adapter = _StudentIndexAdapter()
+        restored.mount('http://', adapter)
+        self.assertTrue(restored.restore_snapshot(snapshot))
+        self.assertEqual(self.__get_cookies(restored), [
+            ('ASP.NET_SessionId', 'jwc-session', 'jwc.nau.edu.cn', '/', None),
+            ('ASP.NET_SessionId', 'sso-session', 'sso.nau.edu.cn', '/sso', None),
+            ('CASTGC', 'TGT-1', '.sso.nau.edu.cn', '/sso', 4102444800)
+        ])
+        self.assertEqual(restored.get_function_dict(), self.__jwcState['function_dict'])
+        self.assertEqual(restored.snapshot(), client.snapshot())
+        # Only one validation request is sent, with the cookie of jwc host
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertEqual(adapter.requests[0].headers['Cookie'], 'ASP.NET_SessionId=jwc-session')
+
+    def test_round_trip_keeps_vpn_state(self):
+        client = self.__create_client()
+        VPNUtils.use_school_vpn(client, 'vpn_user', 'vpn_password')
+        snapshot = client.snapshot()
+        self.assertNotIn('vpn_password', json.dumps(snapshot))
+        restored = JwcClient()
+        self.assertTrue(restored.restore_snapshot(snapshot, vpn_user_pw='vpn_password', validate=False))
+        self.assertEqual(restored.get_interceptor(VPNInterceptor).get_state(), snapshot['vpn'])
+        self.assertEqual(restored.get_interceptor(VPNInterceptor)._get_vpn_account(), ('vpn_user', 'vpn_password'))
+
+    def test_other_version_is_not_restored(self):
+        snapshot = self.__create_client().snapshot()
+        snapshot['version'] += 1
+        restored = JwcClient()
+        self.assertFalse(restored.restore_snapshot(snapshot, validate=False))
+        self.assertEqual(restored.get_cookie_list(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
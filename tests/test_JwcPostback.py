@@ -0,0 +1,119 @@
+import io
+import unittest
+from urllib import parse
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.JwcClient import JwcClient
+
+_PAGE_URL = 'http://jwc.nau.edu.cn/Students/Grade.aspx'
+
+
+# ASP.NET page, every response has a new viewstate, post with a viewstate which is not the last one fails
+# Ajax posts get UpdatePanel delta with new __VIEWSTATE only
+class _AspNetAdapter(BaseAdapter):
+    def __init__(self):
+        super(_AspNetAdapter, self).__init__()
+        self.version = 0
+        # (method, posted form) of every request
+        self.requests = []
+        self.alwaysFail = False
+
+    def send(self, request, **kwargs) -> Response:
+        form = dict(parse.parse_qsl(request.body, keep_blank_values=True)) if request.body else None
+        self.requests.append((request.method, form))
+        if request.method == 'POST' and (self.alwaysFail or form.get('__VIEWSTATE') != 'VS%d' % self.version):
+            return self.__build(request, 500, 'text/html', '<h2>Validation of viewstate MAC failed.</h2>')
+        self.version += 1
+        if request.headers.get('X-MicrosoftAjax') is not None:
+            view_state = 'VS%d' % self.version
+            return self.__build(request, 200, 'text/plain',
+                                '%d|hiddenField|__VIEWSTATE|%s|' % (len(view_state), view_state))
+        return self.__build(request, 200, 'text/html',
+                            '<form><input type="hidden" name="__VIEWSTATE" value="VS%d"/>'
+                            '<input type="hidden" name="__EVENTVALIDATION" value="EV%d"/>'
+                            '<input type="text" name="keyword" value=""/></form>' % (self.version, self.version))
+
+    @staticmethod
+    def __build(request, status_code: int, content_type: str, text: str) -> Response:
+        response = Response()
+        response.status_code = status_code
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict({'Content-Type': content_type + '; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = text.encode('utf-8')
+        response.raw = io.BytesIO(b'')
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+class JwcPostbackTest(unittest.TestCase):
+    def setUp(self):
+        self.adapter = _AspNetAdapter()
+        self.client = JwcClient()
+        self.client.mount('http://', self.adapter)
+
+    def test_hidden_fields_are_chained(self):
+        response = self.client.postback(_PAGE_URL, 'btnNext', {'keyword': 'a'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([method for method, _ in self.adapter.requests], ['GET', 'POST'])
+        self.assertEqual(self.adapter.requests[1][1], {'__VIEWSTATE': 'VS1', '__EVENTVALIDATION': 'EV1',
+                                                       '__EVENTTARGET': 'btnNext', '__EVENTARGUMENT': '',
+                                                       'keyword': 'a'})
+        # Next postback uses hidden fields of the last response, page is not loaded again
+        self.client.postback(_PAGE_URL + '#top', 'btnNext', event_argument='2')
+        self.assertEqual([method for method, _ in self.adapter.requests], ['GET', 'POST', 'POST'])
+        self.assertEqual(self.adapter.requests[2][1], {'__VIEWSTATE': 'VS2', '__EVENTVALIDATION': 'EV2',
+                                                       '__EVENTTARGET': 'btnNext', '__EVENTARGUMENT': '2'})
+        self.assertEqual(self.client.get_postback_state(_PAGE_URL), {'__VIEWSTATE': 'VS3', '__EVENTVALIDATION': 'EV3'})
+
+    def test_delta_response_updates_state(self):
+        self.client.postback(_PAGE_URL, 'btnQuery')
+        self.client.postback(_PAGE_URL, 'btnQuery', headers={'X-MicrosoftAjax': 'Delta=true'})
+        # Fields not in delta are kept
+        self.assertEqual(self.client.get_postback_state(_PAGE_URL), {'__VIEWSTATE': 'VS3', '__EVENTVALIDATION': 'EV2'})
+        self.client.postback(_PAGE_URL, 'btnQuery')
+        self.assertEqual(self.adapter.requests[-1][1]['__VIEWSTATE'], 'VS3')
+        self.assertEqual(self.adapter.requests[-1][1]['__EVENTVALIDATION'], 'EV2')
+
+    def test_rejected_state_is_posted_again_once(self):
+        self.client.postback(_PAGE_URL, 'btnQuery')
+        # Server restarted, saved viewstate is not valid any more
+        self.adapter.version = 10
+        response = self.client.postback(_PAGE_URL, 'btnQuery')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([method for method, _ in self.adapter.requests], ['GET', 'POST', 'POST', 'GET', 'POST'])
+        self.assertEqual(self.adapter.requests[-1][1]['__VIEWSTATE'], 'VS11')
+        self.assertEqual(self.client.get_postback_state(_PAGE_URL)['__VIEWSTATE'], 'VS12')
+
+    def test_rejected_again_is_returned(self):
+        self.client.postback(_PAGE_URL, 'btnQuery')
+        self.adapter.alwaysFail = True
+        response = self.client.postback(_PAGE_URL, 'btnQuery')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual([method for method, _ in self.adapter.requests], ['GET', 'POST', 'POST', 'GET', 'POST'])
+        # Loaded page is still saved, so next postback does not load it again
+        self.assertEqual(self.client.get_postback_state(_PAGE_URL)['__VIEWSTATE'], 'VS3')
+
+    def test_new_state_is_not_posted_again(self):
+        self.adapter.alwaysFail = True
+        response = self.client.postback(_PAGE_URL, 'btnQuery')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual([method for method, _ in self.adapter.requests], ['GET', 'POST'])
+
+    def test_clear_postback_state(self):
+        self.client.postback(_PAGE_URL, 'btnQuery')
+        self.client.clear_postback_state(_PAGE_URL)
+        self.assertIsNone(self.client.get_postback_state(_PAGE_URL))
+        self.client.postback(_PAGE_URL, 'btnQuery')
+        self.assertEqual([method for method, _ in self.adapter.requests], ['GET', 'POST', 'GET', 'POST'])
+
+
+if __name__ == '__main__':
+    unittest.main()
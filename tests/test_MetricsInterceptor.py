@@ -0,0 +1,199 @@
+import io
+import unittest
+from unittest import mock
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, PostRequestParam, RequestContext, \
+    RequestParam
+from NauNetTools.Interceptors.MetricsInterceptor import Histogram, MetricsInterceptor
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+
+def _build_response(status_code: int, content: bytes, history: list = None) -> Response:
+    response = Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+    # noinspection PyProtectedMember
+    response._content = content
+    response.raw = io.BytesIO(b'')
+    response.history = history or []
+    return response
+
+
+class _Noop(NetInterceptor):
+    def request_intercept(self, session, request_code, param):
+        pass
+
+    def response_intercept(self, session, request_code, param, response):
+        return response
+
+
+class _PageAdapter(BaseAdapter):
+    def send(self, request, **kwargs) -> Response:
+        response = _build_response(404 if request.url.endswith('/missing') else 200, b'12345')
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class HistogramTest(unittest.TestCase):
+    def test_buckets_and_percentile(self):
+        histogram = Histogram((1.0, 2.0, 4.0))
+        for value in (0.5, 1.5, 1.5, 3.0, 8.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.bucketCounts, [1, 2, 1, 1])
+        self.assertEqual((histogram.count, histogram.sum, histogram.min, histogram.max), (5, 14.5, 0.5, 8.0))
+        self.assertEqual(histogram.mean(), 2.9)
+        # Rank 2.5 is the 1.5th of 2 values in (1.0, 2.0]
+        self.assertEqual(histogram.percentile(50), 1.75)
+        self.assertEqual(histogram.percentile(0), 0.5)
+        self.assertEqual(histogram.percentile(100), 8.0)
+        self.assertIsNone(Histogram().percentile(50))
+
+    def test_merge(self):
+        first, second = Histogram((1.0, 2.0)), Histogram((1.0, 2.0))
+        first.observe(0.5)
+        second.observe(1.5)
+        second.observe(3.0)
+        first.merge(second)
+        self.assertEqual((first.bucketCounts, first.count, first.min, first.max), ([1, 1, 1], 3, 0.5, 3.0))
+        with self.assertRaises(ValueError):
+            first.merge(Histogram((1.0,)))
+
+
+class MetricsInterceptorTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsInterceptor(buckets=(0.1, 1.0))
+        self.session = object()
+
+    # Latency of request is end_time - start_time, interceptor_time is {interceptor: seconds}
+    def __record(self, param: RequestParam, response: Response, start_time: float, end_time: float,
+                 interceptor_time: dict = None, resent: bool = False):
+        context = RequestContext(self.session, 1, param)
+        with mock.patch('time.perf_counter', side_effect=[start_time, end_time]):
+            self.metrics.context_request_intercept(context)
+            for interceptor, seconds in (interceptor_time or {}).items():
+                self.metrics.context_interceptor_timing(context, interceptor, seconds)
+            context.resent = resent
+            self.metrics.context_chain_finished(context, response, None if response is not None else IOError())
+
+    def __record_requests(self):
+        vpn_host = VPNInterceptor.get_vpn_url_builder().encrypt_vpn_url('jwc.nau.edu.cn')
+        redirect = _build_response(302, b'')
+        redirect.headers['Content-Length'] = '10'
+        self.__record(RequestParam('http://vpn.nau.edu.cn/http/' + vpn_host + '/Grade.aspx'),
+                      _build_response(200, b'abc', [redirect]), 10.0, 10.25, {_Noop(): 0.05})
+        self.__record(PostRequestParam('http://sso.nau.edu.cn/sso/login', {'username': 'a'}), None, 10.0, 12.0)
+        with MetricsInterceptor.operation('grade'):
+            self.__record(RequestParam('http://jwc.nau.edu.cn/Grade.aspx'), _build_response(500, b''), 10.0, 10.5,
+                          resent=True)
+
+    def test_stats(self):
+        self.__record_requests()
+        stats = {(item['host'], item['operation']): item for item in self.metrics.get_stats()}
+        self.assertEqual(list(stats.keys()), [('jwc.nau.edu.cn', 'page_fetch'), ('sso.nau.edu.cn', 'sso_login'),
+                                              ('jwc.nau.edu.cn', 'grade')])
+        page = stats[('jwc.nau.edu.cn', 'page_fetch')]
+        self.assertEqual((page['errors'], page['status_codes'], page['request_bytes'], page['response_bytes'],
+                          page['redirects'], page['vpn_re_login']), (0, {200: 1}, 0, 13, 1, 0))
+        self.assertEqual(page['latency']['sum'], 0.25)
+        self.assertEqual(page['interceptors']['_Noop']['count'], 1)
+        login = stats[('sso.nau.edu.cn', 'sso_login')]
+        self.assertEqual((login['errors'], login['status_codes'], login['request_bytes']), (1, {}, 10))
+        self.assertEqual(stats[('jwc.nau.edu.cn', 'grade')]['vpn_re_login'], 1)
+        self.assertEqual(self.metrics.get_latency_histogram(host='jwc.nau.edu.cn').count, 2)
+        self.assertEqual(self.metrics.get_latency_histogram(operation='sso_login').bucketCounts, [0, 0, 1])
+        self.assertEqual(self.metrics.get_percentile(100), 2.0)
+        self.metrics.reset()
+        self.assertEqual(self.metrics.get_stats(), [])
+
+    def test_prometheus_text(self):
+        self.__record_requests()
+        expected = '''# HELP nau_request_duration_seconds Request latency including all interceptors
+# TYPE nau_request_duration_seconds histogram
+nau_request_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="page_fetch",le="0.1"} 0
+nau_request_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="page_fetch",le="1.0"} 1
+nau_request_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="page_fetch",le="+Inf"} 1
+nau_request_duration_seconds_sum{host="jwc.nau.edu.cn",operation="page_fetch"} 0.25
+nau_request_duration_seconds_count{host="jwc.nau.edu.cn",operation="page_fetch"} 1
+nau_request_duration_seconds_bucket{host="sso.nau.edu.cn",operation="sso_login",le="0.1"} 0
+nau_request_duration_seconds_bucket{host="sso.nau.edu.cn",operation="sso_login",le="1.0"} 0
+nau_request_duration_seconds_bucket{host="sso.nau.edu.cn",operation="sso_login",le="+Inf"} 1
+nau_request_duration_seconds_sum{host="sso.nau.edu.cn",operation="sso_login"} 2.0
+nau_request_duration_seconds_count{host="sso.nau.edu.cn",operation="sso_login"} 1
+nau_request_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="grade",le="0.1"} 0
+nau_request_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="grade",le="1.0"} 1
+nau_request_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="grade",le="+Inf"} 1
+nau_request_duration_seconds_sum{host="jwc.nau.edu.cn",operation="grade"} 0.5
+nau_request_duration_seconds_count{host="jwc.nau.edu.cn",operation="grade"} 1
+# HELP nau_interceptor_duration_seconds Time spent inside each interceptor
+# TYPE nau_interceptor_duration_seconds histogram
+nau_interceptor_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="page_fetch",interceptor="_Noop",le="0.1"} 1
+nau_interceptor_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="page_fetch",interceptor="_Noop",le="1.0"} 1
+nau_interceptor_duration_seconds_bucket{host="jwc.nau.edu.cn",operation="page_fetch",interceptor="_Noop",le="+Inf"} 1
+nau_interceptor_duration_seconds_sum{host="jwc.nau.edu.cn",operation="page_fetch",interceptor="_Noop"} 0.05
+nau_interceptor_duration_seconds_count{host="jwc.nau.edu.cn",operation="page_fetch",interceptor="_Noop"} 1
+# HELP nau_responses_total Responses by status code
+# TYPE nau_responses_total counter
+nau_responses_total{host="jwc.nau.edu.cn",operation="page_fetch",code="200"} 1
+nau_responses_total{host="jwc.nau.edu.cn",operation="grade",code="500"} 1
+# HELP nau_request_errors_total Requests failed with exception
+# TYPE nau_request_errors_total counter
+nau_request_errors_total{host="jwc.nau.edu.cn",operation="page_fetch"} 0
+nau_request_errors_total{host="sso.nau.edu.cn",operation="sso_login"} 1
+nau_request_errors_total{host="jwc.nau.edu.cn",operation="grade"} 0
+# HELP nau_request_bytes_total Estimated bytes sent
+# TYPE nau_request_bytes_total counter
+nau_request_bytes_total{host="jwc.nau.edu.cn",operation="page_fetch"} 0
+nau_request_bytes_total{host="sso.nau.edu.cn",operation="sso_login"} 10
+nau_request_bytes_total{host="jwc.nau.edu.cn",operation="grade"} 0
+# HELP nau_response_bytes_total Bytes received
+# TYPE nau_response_bytes_total counter
+nau_response_bytes_total{host="jwc.nau.edu.cn",operation="page_fetch"} 13
+nau_response_bytes_total{host="sso.nau.edu.cn",operation="sso_login"} 0
+nau_response_bytes_total{host="jwc.nau.edu.cn",operation="grade"} 0
+# HELP nau_redirects_total Redirects followed
+# TYPE nau_redirects_total counter
+nau_redirects_total{host="jwc.nau.edu.cn",operation="page_fetch"} 1
+nau_redirects_total{host="sso.nau.edu.cn",operation="sso_login"} 0
+nau_redirects_total{host="jwc.nau.edu.cn",operation="grade"} 0
+# HELP nau_vpn_re_login_total Requests which made vpn login again
+# TYPE nau_vpn_re_login_total counter
+nau_vpn_re_login_total{host="jwc.nau.edu.cn",operation="page_fetch"} 0
+nau_vpn_re_login_total{host="sso.nau.edu.cn",operation="sso_login"} 0
+nau_vpn_re_login_total{host="jwc.nau.edu.cn",operation="grade"} 1
+'''
+        self.assertEqual(self.metrics.to_prometheus('nau'), expected)
+
+    def test_label_is_escaped(self):
+        with MetricsInterceptor.operation('a "b"\\\n'):
+            self.__record(RequestParam('http://jwc.nau.edu.cn/'), _build_response(200, b''), 0.0, 0.0)
+        self.assertIn('nau_net_redirects_total{host="jwc.nau.edu.cn",operation="a \\"b\\"\\\\\\n"} 0',
+                      self.metrics.to_prometheus())
+
+    def test_requests_of_client(self):
+        client = NetworkClient()
+        client.mount('http://', _PageAdapter())
+        client.add_interceptor(self.metrics)
+        client.add_interceptor(_Noop())
+        for path in ('/a', '/b', '/missing'):
+            client.get('http://jwc.nau.edu.cn' + path)
+        client.close()
+        stats = self.metrics.get_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['status_codes'], {200: 2, 404: 1})
+        self.assertEqual(stats[0]['response_bytes'], 15)
+        self.assertGreater(stats[0]['request_bytes'], 0)
+        self.assertEqual(stats[0]['latency']['count'], 3)
+        self.assertEqual(stats[0]['interceptors']['_Noop']['count'], 3)
+        self.assertNotIn('MetricsInterceptor', stats[0]['interceptors'])
+
+
+if __name__ == '__main__':
+    unittest.main()
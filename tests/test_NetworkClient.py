@@ -0,0 +1,64 @@
+import unittest
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.NetworkClient import NetworkClient
+from NauNetTools.Clients.TransportPolicy import TransportPolicy
+
+
+# HTTPAdapter with canned response, pools and options are the same as a real adapter
+class _LocalHTTPAdapter(HTTPAdapter):
+    def send(self, request, **kwargs) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = b'<html>ok</html>'
+        response.request = request
+        return response
+
+
+class NetworkClientPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.client = NetworkClient()
+        self.adapter = _LocalHTTPAdapter(max_retries=5)
+        self.hostAdapter = _LocalHTTPAdapter(max_retries=3)
+        self.client.mount('http://', self.adapter)
+        self.client.mount('http://jwc.nau.edu.cn/', self.hostAdapter)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_fetch_many_keeps_custom_adapter(self):
+        old_pool_manager = self.adapter.poolmanager
+        urls = ['http://alstu.nau.edu.cn/%d' % n for n in range(20)]
+        urls += ['http://jwc.nau.edu.cn/%d' % n for n in range(5)]
+        results = list(self.client.fetch_many(urls, max_workers=20))
+        self.assertTrue(all(result.is_success() for result in results))
+        self.assertIs(self.client.get_adapter('http://alstu.nau.edu.cn/'), self.adapter)
+        self.assertIs(self.client.get_adapter('http://jwc.nau.edu.cn/'), self.hostAdapter)
+        self.assertEqual(self.adapter.max_retries.total, 5)
+        self.assertEqual(self.hostAdapter.max_retries.total, 3)
+        self.assertEqual(self.adapter.poolmanager.connection_pool_kw['maxsize'], 20)
+        self.assertEqual(self.hostAdapter.poolmanager.connection_pool_kw['maxsize'], 20)
+        self.assertEqual(len(old_pool_manager.pools), 0)
+
+    def test_transport_policy_keeps_custom_adapter(self):
+        self.client.set_transport_policy('*.nau.edu.cn', TransportPolicy(max_in_flight=32))
+        self.assertEqual(self.adapter.max_retries.total, 5)
+        self.assertEqual(self.adapter.poolmanager.connection_pool_kw['maxsize'], 32)
+        self.assertEqual(self.client.get('http://jwc.nau.edu.cn/').status_code, 200)
+
+    def test_smaller_size_does_not_shrink_pool(self):
+        self.client.ensure_pool_size(30)
+        pool_manager = self.adapter.poolmanager
+        self.client.ensure_pool_size(4)
+        self.assertIs(self.adapter.poolmanager, pool_manager)
+        self.assertEqual(pool_manager.connection_pool_kw['maxsize'], 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
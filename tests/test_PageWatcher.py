@@ -0,0 +1,70 @@
+import unittest
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.PageWatcher import PageWatcher
+
+PAGE_URL = 'http://jwc.nau.edu.cn/Students/Grade/Page0_0.aspx'
+
+
+def _grade_page(scores: list) -> str:
+    rows = ''.join('<tr><td>课程%d</td><td>%d</td></tr>' % (n, score) for n, score in enumerate(scores))
+    return '<html><body><table id="grade"><tr><th>课程</th><th>成绩</th></tr>' + rows + '</table></body></html>'
+
+
+# Serve the given (status, html) one by one without network
+class _FakeClient:
+    def __init__(self, pages: list):
+        self.pages = list(pages)
+
+    def get(self, url: str, **kwargs) -> Response:
+        status, html = self.pages.pop(0)
+        response = Response()
+        response.status_code = status
+        response.url = url
+        response.encoding = 'utf-8'
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = html.encode('utf-8')
+        return response
+
+
+class PageWatcherTest(unittest.TestCase):
+    def __watch(self, pages: list) -> tuple:
+        changes = []
+        watcher = PageWatcher(_FakeClient(pages), on_change=changes.append)
+        target = watcher.watch(PAGE_URL, region=('table', 'grade'), key_column=0, min_interval=1, max_interval=100)
+        for _ in range(len(pages)):
+            watcher.poll(target)
+        return watcher, target, changes
+
+    def test_error_status_is_not_diffed(self):
+        good = _grade_page([60, 70])
+        watcher, target, changes = self.__watch([(200, good), (200, good), (500, '<html>Server Error</html>'),
+                                                 (200, good), (200, _grade_page([60, 80]))])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].changed, [(('课程1', '70'), ('课程1', '80'))])
+        self.assertEqual(changes[0].added, [])
+        self.assertEqual(changes[0].removed, [])
+        self.assertEqual(watcher.get_metrics()['errors'], 1)
+
+    def test_missing_region_is_skipped(self):
+        good = _grade_page([60, 70])
+        watcher, target, changes = self.__watch([(200, good), (200, '<html><body>系统繁忙</body></html>'),
+                                                 (200, good), (200, _grade_page([60, 70, 90]))])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].added, [('课程2', '90')])
+        self.assertEqual(changes[0].removed, [])
+        self.assertEqual(watcher.get_metrics()['errors'], 1)
+        self.assertEqual(watcher.get_metrics()['same_body'], 1)
+
+    def test_interval_is_not_changed_by_errors(self):
+        good = _grade_page([60])
+        watcher, target, changes = self.__watch([(200, good), (502, ''), (200, '<html></html>')])
+        self.assertEqual(target.interval, 1.5)
+        self.assertEqual(changes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
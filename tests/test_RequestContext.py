@@ -0,0 +1,156 @@
+import gc
+import io
+import unittest
+import weakref
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient, RequestContext, RequestParam
+
+
+# Raises ConnectionError for /error, other urls get a page
+class _PageAdapter(BaseAdapter):
+    def __init__(self):
+        super(_PageAdapter, self).__init__()
+        self.sentCount = 0
+
+    def send(self, request, **kwargs) -> Response:
+        self.sentCount += 1
+        if request.path_url == '/error':
+            raise ConnectionError('Connection refused!')
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = b'page'
+        response.raw = io.BytesIO(b'')
+        return response
+
+    def close(self):
+        pass
+
+
+class _State:
+    pass
+
+
+# Only context hooks are used, state is kept in context
+class _StateInterceptor(NetInterceptor):
+    observeChain = True
+
+    def __init__(self):
+        self.stateRefs = []
+        self.finished = []
+
+    def context_request_intercept(self, context: RequestContext):
+        state = _State()
+        self.stateRefs.append(weakref.ref(state))
+        context.set_state(self, state)
+
+    def context_response_intercept(self, context: RequestContext, response: Response) -> Response:
+        return response
+
+    def context_chain_finished(self, context: RequestContext, response: Response, exception: Exception):
+        self.finished.append((context.get_state(self) is not None, response is not None, type(exception)))
+
+    def request_intercept(self, session, request_code, param):
+        raise AssertionError('Old hook should not be called!')
+
+    def response_intercept(self, session, request_code, param, response):
+        raise AssertionError('Old hook should not be called!')
+
+
+# Only old hooks are implemented
+class _LegacyInterceptor(NetInterceptor):
+    observeChain = True
+
+    def __init__(self, cached_url: str = None):
+        self.cachedUrl = cached_url
+        self.calls = []
+
+    def request_intercept(self, session, request_code, param):
+        self.calls.append(('request', session, request_code, param.url))
+        if param.url == self.cachedUrl:
+            response = Response()
+            response.status_code = 200
+            # noinspection PyProtectedMember
+            response._content = b'cached'
+            return response
+        return None
+
+    def response_intercept(self, session, request_code, param, response):
+        self.calls.append(('response', session, request_code, response.text))
+        return response
+
+    def interceptor_timing(self, session, request_code, interceptor, seconds):
+        self.calls.append(('timing', session, request_code, type(interceptor).__name__))
+
+    def chain_finished(self, session, request_code, param, response, exception):
+        self.calls.append(('finished', session, request_code, type(exception).__name__))
+
+
+class RequestContextTest(unittest.TestCase):
+    def setUp(self):
+        self.adapter = _PageAdapter()
+        self.client = NetworkClient()
+        self.client.mount('http://', self.adapter)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_state_methods(self):
+        context = RequestContext(self.client, 1, RequestParam('http://jwc.nau.edu.cn/'))
+        first, second = object(), object()
+        self.assertEqual(context.get_state(first, 'default'), 'default')
+        self.assertIsNone(context.pop_state(first))
+        context.set_state(first, 1)
+        context.set_state(second, 2)
+        self.assertEqual((context.get_state(first), context.pop_state(second)), (1, 2))
+        self.assertIsNone(context.get_state(second))
+        self.assertFalse(context.resent)
+
+    def test_state_is_dropped_when_request_raises(self):
+        interceptor = _StateInterceptor()
+        self.client.add_interceptor(interceptor)
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                self.client.get('http://jwc.nau.edu.cn/error')
+        self.client.get('http://jwc.nau.edu.cn/page')
+        gc.collect()
+        self.assertEqual([state_ref() for state_ref in interceptor.stateRefs], [None] * 4)
+        # State could still be read when the chain is finished
+        self.assertEqual(interceptor.finished, [(True, False, ConnectionError)] * 3 + [(True, True, type(None))])
+
+    def test_default_hooks_call_old_hooks(self):
+        interceptor = _LegacyInterceptor(cached_url='http://jwc.nau.edu.cn/cached')
+        state_interceptor = _StateInterceptor()
+        self.client.add_interceptor(interceptor)
+        self.client.add_interceptor(state_interceptor)
+        self.assertEqual(self.client.get('http://jwc.nau.edu.cn/page').text, 'page')
+        calls = list(interceptor.calls)
+        code = calls[0][2]
+        self.assertEqual(calls, [
+            ('request', self.client, code, 'http://jwc.nau.edu.cn/page'),
+            ('timing', self.client, code, '_StateInterceptor'),
+            ('timing', self.client, code, '_StateInterceptor'),
+            ('response', self.client, code, 'page'),
+            ('finished', self.client, code, 'NoneType')
+        ])
+        interceptor.calls.clear()
+        # Response of request_intercept skips the real request and the interceptors after it
+        self.assertEqual(self.client.get('http://jwc.nau.edu.cn/cached').text, 'cached')
+        self.assertEqual([call[0] for call in interceptor.calls], ['request', 'response', 'finished'])
+        self.assertEqual(interceptor.calls[0][2], code + 1)
+        self.assertEqual(self.adapter.sentCount, 1)
+        interceptor.calls.clear()
+        with self.assertRaises(ConnectionError):
+            self.client.get('http://jwc.nau.edu.cn/error')
+        self.assertEqual(interceptor.calls[-1], ('finished', self.client, code + 2, 'ConnectionError'))
+
+
+if __name__ == '__main__':
+    unittest.main()
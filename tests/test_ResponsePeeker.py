@@ -0,0 +1,122 @@
+import gzip
+import io
+import os
+import tempfile
+import unittest
+from binascii import hexlify
+
+from requests import HTTPError, Response
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from NauNetTools.Clients.NetworkClient import NetInterceptor, NetworkClient
+from NauNetTools.Clients.ResponsePeeker import ResponsePeeker
+
+_PAGE = ('<html><head><title>成绩查询</title></head><body>' + hexlify(os.urandom(64 * 1024)).decode() +
+         '</body></html>').encode('utf-8')
+
+
+# Body stream which counts read bytes
+class _CountingBody(io.BytesIO):
+    readSize: int = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = super(_CountingBody, self).read(size)
+        self.readSize += len(data)
+        return data
+
+
+# Real urllib3 response from memory, body is gzipped if path ends with .gz
+class _MemoryAdapter(HTTPAdapter):
+    def __init__(self):
+        super(_MemoryAdapter, self).__init__()
+        self.bodies = []
+
+    def send(self, request, stream=False, **kwargs) -> Response:
+        headers = {'Content-Type': 'text/html; charset=utf-8'}
+        body = _PAGE
+        if request.path_url.endswith('.gz'):
+            headers['Content-Encoding'] = 'gzip'
+            body = gzip.compress(body)
+        status = 404 if request.path_url.startswith('/missing') else 200
+        body_stream = _CountingBody(body)
+        self.bodies.append(body_stream)
+        raw = HTTPResponse(body=body_stream, headers=headers, status=status, preload_content=False,
+                           decode_content=True)
+        response = self.build_response(request, raw)
+        if not stream:
+            # noinspection PyStatementEffect
+            response.content
+        return response
+
+
+# Checks the title of every response like VPNInterceptor checks login page
+class _TitleInterceptor(NetInterceptor):
+    def __init__(self):
+        self.titles = []
+
+    def request_intercept(self, session, request_code, param):
+        pass
+
+    def response_intercept(self, session, request_code, param, response):
+        text = ResponsePeeker.peek_text(response, 64)
+        self.titles.append(text[text.index('<title>') + 7:text.index('</title>')])
+        return response
+
+
+class ResponsePeekerTest(unittest.TestCase):
+    def setUp(self):
+        self.adapter = _MemoryAdapter()
+        self.client = NetworkClient()
+        self.client.mount('http://', self.adapter)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_peek_streaming_response_then_read_all(self):
+        for path in ('/page', '/page.gz'):
+            response = self.client.get('http://jwc.nau.edu.cn' + path, stream=True)
+            self.assertTrue(ResponsePeeker.is_streaming(response))
+            self.assertEqual(ResponsePeeker.peek_content(response, 16), _PAGE[:16])
+            self.assertEqual(ResponsePeeker.peek_content(response, 64), _PAGE[:64])
+            self.assertEqual(ResponsePeeker.peek_text(response, 37), _PAGE[:37].decode('utf-8', 'ignore'))
+            # Only the beginning of body is read
+            self.assertLess(self.adapter.bodies[-1].readSize, len(self.adapter.bodies[-1].getvalue()) // 2)
+            self.assertTrue(ResponsePeeker.is_streaming(response))
+            self.assertEqual(response.content, _PAGE)
+            self.assertEqual(response.text, _PAGE.decode('utf-8'))
+            self.assertFalse(ResponsePeeker.is_streaming(response))
+
+    def test_peek_then_iterate_content(self):
+        response = self.client.get('http://jwc.nau.edu.cn/page.gz', stream=True)
+        ResponsePeeker.peek_content(response, 100)
+        self.assertEqual(b''.join(response.iter_content(1000)), _PAGE)
+        response = self.client.get('http://jwc.nau.edu.cn/page.gz', stream=True)
+        ResponsePeeker.peek_content(response, 100)
+        self.assertEqual(response.raw.read(10), _PAGE[:10])
+        self.assertEqual(response.raw.read(200), _PAGE[10:210])
+        self.assertEqual(response.raw.read(), _PAGE[210:])
+
+    def test_peek_read_response(self):
+        response = self.client.get('http://jwc.nau.edu.cn/page.gz')
+        self.assertFalse(ResponsePeeker.is_streaming(response))
+        self.assertEqual(ResponsePeeker.peek_content(response, 10), _PAGE[:10])
+        self.assertEqual(ResponsePeeker.peek_text(response, 10), _PAGE.decode('utf-8')[:10])
+        self.assertEqual(ResponsePeeker.peek_content(response, len(_PAGE) * 2), _PAGE)
+
+    def test_download_to_after_peek(self):
+        interceptor = _TitleInterceptor()
+        self.client.add_interceptor(interceptor)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'page.html')
+            self.assertEqual(self.client.download_to('http://jwc.nau.edu.cn/page.gz', file_path, 4096), len(_PAGE))
+            with open(file_path, 'rb') as file:
+                self.assertEqual(file.read(), _PAGE)
+            self.assertEqual(interceptor.titles, ['成绩查询'])
+            with self.assertRaises(HTTPError):
+                self.client.download_to('http://jwc.nau.edu.cn/missing.gz', os.path.join(directory, 'missing.html'))
+            self.assertEqual(os.listdir(directory), ['page.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
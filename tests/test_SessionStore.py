@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from NauNetTools.Clients.SessionStore import SessionStore
+
+
+class _FakeClient:
+    def __init__(self, name: str, logins: list):
+        self.name = name
+        self.logins = logins
+        self.restored = None
+
+    def login(self, user_id: str, user_pw: str, deadline=None) -> bool:
+        self.logins.append(self.name)
+        return True
+
+    def snapshot(self) -> dict:
+        return {'owner': self.name}
+
+    def restore_snapshot(self, snapshot: dict, vpn_user_pw: str = None, validate: bool = False) -> bool:
+        self.restored = snapshot
+        return True
+
+
+class SessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.dbPath = os.path.join(self.directory.name, 'sessions.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_session_saved_before_lease_is_restored(self):
+        logins = []
+        store_a = SessionStore(self.dbPath, poll_interval=0.01)
+        store_b = SessionStore(self.dbPath, poll_interval=0.01)
+        client_a = _FakeClient('A', logins)
+        client_b = _FakeClient('B', logins)
+        get_session = store_a.get_session
+        calls = []
+
+        # B borrows the account between the session check and the login lease of A
+        def get_session_then_borrow(service: str, user_id: str):
+            stored_session = get_session(service, user_id)
+            if len(calls) == 0:
+                calls.append(user_id)
+                self.assertEqual(store_b.borrow_client(client_b, user_id, 'password', service='Jwc')[0], True)
+            return stored_session
+
+        store_a.get_session = get_session_then_borrow
+        success, version = store_a.borrow_client(client_a, '2020000000', 'password', timeout=5, service='Jwc')
+        self.assertTrue(success)
+        self.assertEqual(logins, ['B'])
+        self.assertEqual(client_a.restored, {'owner': 'B'})
+
+    def test_lease_is_refused_for_live_session(self):
+        store = SessionStore(self.dbPath)
+        store.save_session('Jwc', '2020000000', {'owner': 'A'})
+        self.assertIsNone(store.acquire_login_lease('Jwc', '2020000000'))
+        store.invalidate_session('Jwc', '2020000000')
+        self.assertIsNotNone(store.acquire_login_lease('Jwc', '2020000000'))
+
+
+if __name__ == '__main__':
+    unittest.main()
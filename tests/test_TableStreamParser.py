@@ -0,0 +1,35 @@
+import unittest
+
+from NauNetTools.Clients.TableStreamParser import TableStreamParser
+
+
+def _parse(html: str, chunk_size: int = 7, **kwargs) -> list:
+    parser = TableStreamParser(**kwargs)
+    rows = []
+    for index in range(0, len(html), chunk_size):
+        parser.feed(html[index:index + chunk_size])
+        rows.extend(parser.pop_rows())
+    parser.close()
+    rows.extend(parser.pop_rows())
+    return rows
+
+
+class TableStreamParserTest(unittest.TestCase):
+    def test_nested_texts_are_separated(self):
+        rows = _parse('<table><tr><th>A</th><th>B</th><th>C</th></tr>'
+                      '<tr><td><table><tr><td>n1</td><td>n2</td></tr></table></td>'
+                      '<td><div>a</div><div>b</div>c<br>d</td>'
+                      '<td>x<table><tr><td>y</td></tr></table>z</td></tr></table>')
+        self.assertEqual(rows, [{'A': 'n1 n2', 'B': 'a b c d', 'C': 'x y z'}])
+
+    def test_spans_and_types(self):
+        rows = _parse('<table id="t"><tr><th rowspan="2">节次</th><th colspan="2">周一</th></tr>'
+                      '<tr><th>课程</th><th>学分</th></tr><tr><td rowspan="2">1</td><td>高数</td><td>4.5</td></tr>'
+                      '<tr><td>英语</td><td>2</td></tr></table>', table_id='t', header_rows=2,
+                      types={'周一/学分': float})
+        self.assertEqual(rows, [{'节次': 1, '周一/课程': '高数', '周一/学分': 4.5},
+                                {'节次': 1, '周一/课程': '英语', '周一/学分': 2.0}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import io
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from requests import Request, Response
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError as RequestConnectionError
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.Deadline import Deadline, DeadlineExceeded
+# noinspection PyProtectedMember
+from NauNetTools.Clients.TransportPolicy import TransportPolicy, _PolicyAdapter, _TokenBucket
+
+URL = 'http://jwc.nau.edu.cn/Students/StudentIndex.aspx'
+
+
+# Return the given status codes one by one, None means raising connection error
+class _FakeAdapter(BaseAdapter):
+    def __init__(self, statuses: list = None, delay: float = 0, headers: dict = None):
+        super(_FakeAdapter, self).__init__()
+        self.statuses = list(statuses or [])
+        self.delay = delay
+        self.headers = headers or {}
+        self.lock = Lock()
+        self.sendCount = 0
+        self.inFlight = 0
+        self.peakInFlight = 0
+        self.timeouts = []
+
+    def send(self, request, **kwargs) -> Response:
+        with self.lock:
+            self.sendCount += 1
+            self.inFlight += 1
+            self.peakInFlight = max(self.peakInFlight, self.inFlight)
+            self.timeouts.append(kwargs.get('timeout'))
+            status = self.statuses.pop(0) if len(self.statuses) > 0 else 200
+        try:
+            if self.delay > 0:
+                time.sleep(self.delay)
+            if status is None:
+                raise RequestConnectionError('Connection refused!')
+            response = Response()
+            response.status_code = status
+            response.url = request.url
+            response.headers = CaseInsensitiveDict(self.headers)
+            # noinspection PyProtectedMember
+            response._content = b''
+            response.raw = io.BytesIO(b'')
+            return response
+        finally:
+            with self.lock:
+                self.inFlight -= 1
+
+    def close(self):
+        pass
+
+
+def _send(policy: TransportPolicy, adapter: _FakeAdapter, method: str = 'GET', timeout: float = 10) -> Response:
+    request = Request(method, URL).prepare()
+    return _PolicyAdapter(adapter, policy, 'jwc.nau.edu.cn').send(request, timeout=timeout)
+
+
+class TransportPolicyTest(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = _TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 0.1, delta=0.02)
+        self.assertAlmostEqual(bucket.take(), 0.2, delta=0.02)
+
+    def test_rate_limit(self):
+        policy = TransportPolicy(rate=50, burst=1)
+        adapter = _FakeAdapter()
+        start_time = time.monotonic()
+        for _ in range(6):
+            _send(policy, adapter)
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.09)
+        self.assertEqual(policy.get_metrics()['jwc.nau.edu.cn']['rate_limited'], 5)
+
+    def test_in_flight_cap(self):
+        policy = TransportPolicy(max_in_flight=2)
+        adapter = _FakeAdapter(delay=0.03)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: _send(policy, adapter), range(8)))
+        self.assertEqual(adapter.peakInFlight, 2)
+        self.assertEqual(policy.get_metrics()['jwc.nau.edu.cn']['peak_in_flight'], 2)
+        self.assertEqual(policy.get_pool_size(), 2)
+
+    def test_retry_with_backoff(self):
+        policy = TransportPolicy(max_retries=3, backoff_factor=0.01, jitter=0)
+        adapter = _FakeAdapter([503, None, 200])
+        self.assertEqual(_send(policy, adapter).status_code, 200)
+        self.assertEqual(adapter.sendCount, 3)
+        metrics = policy.get_metrics()['jwc.nau.edu.cn']
+        self.assertEqual(metrics['retries'], 2)
+        self.assertEqual(metrics['errors'], 0)
+        self.assertEqual(policy.get_backoff_time(0), 0.01)
+        self.assertEqual(policy.get_backoff_time(3), 0.08)
+
+    def test_retry_stops_after_max_retries(self):
+        policy = TransportPolicy(max_retries=2, backoff_factor=0.001)
+        adapter = _FakeAdapter([503, 503, 503, 200])
+        self.assertEqual(_send(policy, adapter).status_code, 503)
+        self.assertEqual(adapter.sendCount, 3)
+        adapter = _FakeAdapter([None, None, None])
+        self.assertRaises(RequestConnectionError, _send, policy, adapter)
+        self.assertEqual(policy.get_metrics()['jwc.nau.edu.cn']['errors'], 1)
+
+    def test_post_is_not_retried(self):
+        policy = TransportPolicy(max_retries=3, backoff_factor=0.001)
+        adapter = _FakeAdapter([503, 200])
+        self.assertEqual(_send(policy, adapter, 'POST').status_code, 503)
+        self.assertEqual(adapter.sendCount, 1)
+
+    def test_retry_after(self):
+        policy = TransportPolicy(max_retries=1, backoff_factor=0.001, backoff_max=5, jitter=0)
+        response = Response()
+        response.headers = CaseInsensitiveDict({'Retry-After': '2'})
+        self.assertEqual(policy.get_backoff_time(0, response), 2)
+        response.headers['Retry-After'] = '60'
+        self.assertEqual(policy.get_backoff_time(0, response), 0.001)
+        adapter = _FakeAdapter([429, 200], headers={'Retry-After': '0'})
+        self.assertEqual(_send(policy, adapter).status_code, 200)
+
+    def test_deadline_cuts_retry(self):
+        policy = TransportPolicy(max_retries=5, backoff_factor=1, jitter=0)
+        adapter = _FakeAdapter([503, 503])
+        with Deadline.use(Deadline(0.5)):
+            self.assertEqual(_send(policy, adapter).status_code, 503)
+        self.assertEqual(adapter.sendCount, 1)
+        adapter = _FakeAdapter([None, None])
+        with Deadline.use(Deadline(0.5)):
+            self.assertRaises(DeadlineExceeded, _send, policy, adapter)
+        self.assertEqual(adapter.sendCount, 1)
+
+    def test_retry_only_gets_remaining_time(self):
+        policy = TransportPolicy(max_retries=1, backoff_factor=0.05, jitter=0)
+        adapter = _FakeAdapter([503, 200])
+        with Deadline.use(Deadline(1)):
+            self.assertEqual(_send(policy, adapter, timeout=10).status_code, 200)
+        self.assertEqual(adapter.timeouts[0], 10)
+        self.assertLess(adapter.timeouts[1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Event, Lock
+from urllib import parse
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from NauNetTools.Clients.NetworkClient import NetworkClient
+from NauNetTools.Clients.SSOClient import SSOClient
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor
+
+_SSO_LOGIN_PAGE = '<html><form><input name="lt" value="LT-1"/><input name="execution" value="e1s1"/></form></html>'
+
+
+# Vpn returns sso login page until the sso form is posted, expired requests wait for each other by barrier
+class _FakeVPNAdapter(BaseAdapter):
+    def __init__(self, expired_count: int):
+        super(_FakeVPNAdapter, self).__init__()
+        self.loggedIn = False
+        self.ssoPostCount = 0
+        # (method, path, body) of requests sent after vpn login
+        self.sentRequests = []
+        self.__expiredBarrier = Barrier(expired_count)
+        self.__lock = Lock()
+
+    def send(self, request, **kwargs) -> Response:
+        url = parse.urlsplit(request.url)
+        if url.netloc == SSOClient.ssoHost:
+            with self.__lock:
+                self.ssoPostCount += 1
+                self.loggedIn = True
+            return self.__build(VPNInterceptor.vpnServer + '/', '<html>vpn index</html>')
+        with self.__lock:
+            logged_in = self.loggedIn
+        if not logged_in:
+            self.__expiredBarrier.wait(5)
+            return self.__build('http://' + SSOClient.ssoHost + '/sso/login?service=' +
+                                parse.quote(VPNInterceptor.vpnServer + '/login'), _SSO_LOGIN_PAGE)
+        body = request.body.decode() if isinstance(request.body, bytes) else request.body
+        with self.__lock:
+            self.sentRequests.append((request.method, url.path, body))
+        return self.__build(request.url, '<html>ok</html>')
+
+    @staticmethod
+    def __build(url: str, text: str) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        # noinspection PyProtectedMember
+        response._content = text.encode()
+        response.raw = io.BytesIO(b'')
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+class VPNInterceptorLoginTest(unittest.TestCase):
+    def setUp(self):
+        self.client = NetworkClient()
+        self.interceptor = VPNInterceptor('2020000000', 'password')
+        self.client.add_interceptor(self.interceptor)
+
+    def tearDown(self):
+        self.client.close()
+
+    # Vpn logout is sent when client is closed, so every test needs the adapter
+    def __mount(self, expired_count: int) -> _FakeVPNAdapter:
+        adapter = _FakeVPNAdapter(expired_count)
+        self.client.mount('http://', adapter)
+        return adapter
+
+    def test_concurrent_expired_requests_login_once(self):
+        adapter = self.__mount(8)
+        urls = ['http://jwc.nau.edu.cn/page%d.aspx' % n for n in range(8)]
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(self.client.get, urls))
+        self.assertTrue(all(response.text == '<html>ok</html>' for response in responses))
+        self.assertEqual(adapter.ssoPostCount, 1)
+        self.assertEqual(self.interceptor.reLoginCount, 1)
+        self.assertEqual(self.interceptor.reLoginFailedCount, 0)
+        self.assertEqual(sorted(path.rsplit('/', 1)[-1] for _, path, _ in adapter.sentRequests),
+                         sorted('page%d.aspx' % n for n in range(8)))
+
+    def test_post_body_is_replayed(self):
+        adapter = self.__mount(2)
+        with ThreadPoolExecutor(2) as executor:
+            data_future = executor.submit(self.client.post, 'http://jwc.nau.edu.cn/data.aspx', {'name': 'value'})
+            json_future = executor.submit(self.client.post, 'http://jwc.nau.edu.cn/json.aspx',
+                                          json={'key': [1, 2]})
+            data_future.result()
+            json_future.result()
+        self.assertEqual(adapter.ssoPostCount, 1)
+        bodies = {path.rsplit('/', 1)[-1]: (method, body) for method, path, body in adapter.sentRequests}
+        self.assertEqual(bodies['data.aspx'], ('POST', 'name=value'))
+        self.assertEqual(bodies['json.aspx'][0], 'POST')
+        self.assertEqual(json.loads(bodies['json.aspx'][1]), {'key': [1, 2]})
+
+    def test_failed_login_is_not_counted_as_re_login(self):
+        self.__mount(1)
+        flight, is_leader = self.interceptor._join_login_flight(self.client, 0, Event)
+        self.assertTrue(is_leader)
+        self.interceptor._finish_login_flight(self.client, flight, False)
+        self.assertTrue(flight.event.is_set())
+        self.assertEqual(self.interceptor.reLoginCount, 0)
+        self.assertEqual(self.interceptor.reLoginFailedCount, 1)
+        # Generation is not changed, so the next expired request logins again
+        self.assertTrue(self.interceptor._join_login_flight(self.client, 0, Event)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from urllib import parse
+
+from NauNetTools.Clients.NetworkClient import NetworkClient
+from NauNetTools.Interceptors.VPNInterceptor import VPNInterceptor, VPNRouteAction, VPNRouteTable, VPNUtils
+
+
+class VPNRouteTableTest(unittest.TestCase):
+    def test_none_vpn_list_does_not_override_rules(self):
+        route_table = VPNRouteTable.from_config({'default': 'direct', 'vpn': ['jwc.nau.edu.cn']})
+        interceptor = VPNUtils.use_school_vpn(NetworkClient(), 'user', 'password', route_table=route_table)
+        self.assertEqual(interceptor.get_route_action('http://jwc.nau.edu.cn/'), VPNRouteAction.VPN)
+        self.assertEqual(interceptor.get_route_action('http://vpn.nau.edu.cn/login'), VPNRouteAction.DIRECT)
+        self.assertEqual(route_table.resolve('http://jwc.nau.edu.cn/'), VPNRouteAction.VPN)
+
+    def test_shared_table_is_not_changed(self):
+        route_table = VPNRouteTable.from_config({'direct': ['my.nau.edu.cn', '*.lib.nau.edu.cn']})
+        rules = route_table.get_rules()
+        first = VPNInterceptor('user', 'password', route_table=route_table)
+        first.set_none_vpn_host(VPNUtils.noneVPNHost)
+        second = VPNInterceptor('user', 'password', route_table=route_table)
+        second.set_none_vpn_host([])
+        self.assertEqual(route_table.get_rules(), rules)
+        self.assertEqual(route_table.get_fallback_rules(), {})
+        self.assertEqual(second.get_route_action('http://my.nau.edu.cn/'), VPNRouteAction.DIRECT)
+        self.assertEqual(second.get_route_action('http://jwc.nau.edu.cn/'), VPNRouteAction.VPN)
+        self.assertEqual(first.get_route_action('http://jwc.nau.edu.cn/'), VPNRouteAction.DIRECT)
+
+    def test_state_keeps_none_vpn_hosts(self):
+        route_table = VPNRouteTable.from_config({'vpn': ['jwc.nau.edu.cn']})
+        interceptor = VPNInterceptor('user', 'password', route_table=route_table)
+        interceptor.set_none_vpn_host(VPNUtils.noneVPNHost)
+        restored = VPNInterceptor.from_state(interceptor.get_state(), 'password')
+        self.assertEqual(restored.get_route_action('http://jwc.nau.edu.cn/'), VPNRouteAction.VPN)
+        self.assertEqual(restored.get_route_action('http://my.nau.edu.cn/'), VPNRouteAction.DIRECT)
+
+    def test_sso_login_of_vpn_service_is_direct(self):
+        route_table = VPNRouteTable.from_config({'vpn': ['vpn.nau.edu.cn', 'sso.nau.edu.cn']})
+        interceptor = VPNInterceptor('user', 'password', route_table=route_table)
+        service_url = 'http://vpn.nau.edu.cn/login?cas_login=true&fromUrl=/'
+        sso_url = 'http://sso.nau.edu.cn/sso/login'
+        self.assertEqual(interceptor.get_route_action(sso_url + '?service=' + parse.quote(service_url)),
+                         VPNRouteAction.DIRECT)
+        self.assertEqual(interceptor.get_route_action(sso_url, {'service': service_url}), VPNRouteAction.DIRECT)
+        self.assertEqual(interceptor.get_route_action(sso_url, {'service': 'http://jwc.nau.edu.cn/'}),
+                         VPNRouteAction.VPN)
+
+
+if __name__ == '__main__':
+    unittest.main()
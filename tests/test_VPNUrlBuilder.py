@@ -0,0 +1,58 @@
+import unittest
+
+from NauNetTools.Interceptors.VPNInterceptor import VPNUrlBuilder
+
+
+class VPNUrlBuilderCacheTest(unittest.TestCase):
+    def test_encrypt_and_decrypt_are_counted_separately(self):
+        builder = VPNUrlBuilder()
+        encrypted_host = builder.encrypt_vpn_url('jwc.nau.edu.cn')
+        self.assertEqual(builder.encrypt_vpn_url('jwc.nau.edu.cn'), encrypted_host)
+        self.assertEqual(builder.decrypt_vpn_url(encrypted_host), 'jwc.nau.edu.cn')
+        info = builder.get_cache_info()
+        self.assertEqual((info['encrypt_hits'], info['encrypt_misses'], info['encrypt_size']), (1, 1, 1))
+        self.assertEqual((info['decrypt_hits'], info['decrypt_misses'], info['decrypt_size']), (0, 1, 1))
+        builder.decrypt_vpn_url(encrypted_host.upper())
+        info = builder.get_cache_info()
+        self.assertEqual((info['decrypt_hits'], info['decrypt_misses']), (1, 1))
+        self.assertEqual((info['encrypt_hits'], info['encrypt_misses']), (1, 1))
+
+    def test_least_recently_used_host_is_evicted(self):
+        builder = VPNUrlBuilder(cache_size=2)
+        builder.encrypt_vpn_url('jwc.nau.edu.cn')
+        builder.encrypt_vpn_url('sso.nau.edu.cn')
+        # Jwc is used again, so sso is the least recently used one
+        builder.encrypt_vpn_url('jwc.nau.edu.cn')
+        builder.encrypt_vpn_url('alstu.nau.edu.cn')
+        self.assertEqual(builder.get_cache_info()['encrypt_size'], 2)
+        builder.encrypt_vpn_url('jwc.nau.edu.cn')
+        self.assertEqual(builder.encryptCacheMisses, 3)
+        builder.encrypt_vpn_url('sso.nau.edu.cn')
+        self.assertEqual(builder.encryptCacheMisses, 4)
+        self.assertEqual(builder.encryptCacheHits, 2)
+
+    def test_batch_api_warms_cache(self):
+        builder = VPNUrlBuilder()
+        hosts = ['jwc.nau.edu.cn', 'sso.nau.edu.cn', 'jwc.nau.edu.cn']
+        encrypted_hosts = builder.encrypt_vpn_urls(hosts)
+        self.assertEqual(sorted(encrypted_hosts.keys()), ['jwc.nau.edu.cn', 'sso.nau.edu.cn'])
+        self.assertEqual((builder.encryptCacheHits, builder.encryptCacheMisses), (1, 2))
+        for host, encrypted_host in encrypted_hosts.items():
+            self.assertEqual(builder.encrypt_vpn_url(host), encrypted_host)
+            self.assertEqual(builder.decrypt_vpn_url(encrypted_host), host)
+        self.assertEqual(builder.encryptCacheHits, 3)
+
+    def test_no_cache_and_clear_cache(self):
+        builder = VPNUrlBuilder(cache_size=0)
+        self.assertEqual(builder.encrypt_vpn_url('jwc.nau.edu.cn'), VPNUrlBuilder().encrypt_vpn_url('jwc.nau.edu.cn'))
+        self.assertEqual(builder.get_cache_info()['encrypt_misses'], 0)
+        builder = VPNUrlBuilder()
+        builder.decrypt_vpn_url(builder.encrypt_vpn_url('jwc.nau.edu.cn'))
+        builder.clear_cache()
+        info = builder.get_cache_info()
+        self.assertEqual([info[key] for key in ('encrypt_hits', 'encrypt_misses', 'encrypt_size', 'decrypt_hits',
+                                                'decrypt_misses', 'decrypt_size')], [0] * 6)
+
+
+if __name__ == '__main__':
+    unittest.main()